@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Пакетная загрузка чанков: эмбеддинги группами через /api/embed (Ollama)
+и upsert в Qdrant пачками вместо одного HTTP-запроса на чанк
+
+Повторная загрузка документа инкрементальная (манифест ingest_state): эмбеддинги
+создаются только для новых и измененных чанков. Новая версия документа включается
+целиком (doc_version в payload + активная версия в ingest_state), после чего точки
+прежней версии удаляются одним запросом. Состояние чанков загрузки пишется в журнал
+(ingest_journal): прерванная загрузка продолжается с того места, где остановилась
+"""
+
+import os
+import time
+import uuid
+from pathlib import Path
+import chunking
+import ingest_state
+import ingest_journal
+import lexical_index
+import vector_mirror
+import collection_manager
+from http_client import ollama, qdrant
+from chunk_features import extract_features
+
+OLLAMA_URL = os.getenv('OLLAMA_URL', "http://ollama-docling:11434")
+QDRANT_URL = os.getenv('QDRANT_URL', "http://qdrant-docling:6333")
+COLLECTION_NAME = "documents"
+EMBED_MODEL = "nomic-embed-text"
+
+# Размеры пачек можно подбирать через переменные окружения
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '32'))
+UPSERT_BATCH_SIZE = int(os.getenv('UPSERT_BATCH_SIZE', '128'))
+
+# Маркер версии коллекции: меняется при каждой загрузке документа,
+# по нему webapp инвалидирует кэш ответов
+COLLECTION_VERSION_PATH = os.getenv('COLLECTION_VERSION_PATH', '/shared/db/collection_version')
+
+# Сколько точек запрашивать из Qdrant за раз при сверке с манифестом
+RETRIEVE_BATCH_SIZE = 256
+SCROLL_PAGE_SIZE = 1000
+
+# Коллекция (конфигурация и payload-индексы) проверяется один раз на процесс
+_collection_ready = False
+
+
+def bump_collection_version():
+    """Отмечает, что содержимое коллекции изменилось"""
+    path = Path(COLLECTION_VERSION_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    version = uuid.uuid4().hex
+    tmp_path.write_text(version)
+    tmp_path.replace(path)
+    return version
+
+
+def get_collection_version():
+    """Текущая версия коллекции ('initial', если документы еще не загружались)"""
+    try:
+        return Path(COLLECTION_VERSION_PATH).read_text().strip() or 'initial'
+    except FileNotFoundError:
+        return 'initial'
+
+
+def embed_batch(texts, model=EMBED_MODEL, ollama_url=OLLAMA_URL, retries=3):
+    """
+    Получает эмбеддинги сразу для группы текстов
+
+    Использует multi-input endpoint /api/embed. Для старых версий Ollama
+    без этого endpoint'а откатывается на /api/embeddings по одному тексту.
+
+    Returns:
+        list: эмбеддинги в том же порядке, что и texts
+    """
+    for attempt in range(retries):
+        try:
+            response = ollama.post(
+                f"{ollama_url}/api/embed",
+                json={"model": model, "input": texts},
+                timeout=60 + 10 * len(texts)
+            )
+            if response.status_code == 404:
+                break
+            response.raise_for_status()
+            return response.json()["embeddings"]
+        except Exception as e:
+            if attempt < retries - 1:
+                print(f"    ⏳ Ошибка пакетного эмбеддинга ({e}), повтор через 3 сек...")
+                time.sleep(3)
+            else:
+                raise
+
+    embeddings = []
+    for text in texts:
+        response = ollama.post(
+            f"{ollama_url}/api/embeddings",
+            json={"model": model, "prompt": text},
+            timeout=60,
+            idempotent=True
+        )
+        response.raise_for_status()
+        embeddings.append(response.json()["embedding"])
+    return embeddings
+
+
+def upsert_points(points, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME, wait=False):
+    """Загружает пачку точек в Qdrant одним запросом"""
+    response = qdrant.put(
+        f"{qdrant_url}/collections/{collection}/points",
+        params={"wait": "true" if wait else "false"},
+        json={"points": points},
+        timeout=60
+    )
+    response.raise_for_status()
+
+
+def retrieve_points(point_ids, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME, with_vector=False):
+    """
+    Какие из точек есть в Qdrant
+
+    Returns:
+        dict: нормализованный ID -> вектор (None при with_vector=False); отсутствующих точек нет
+    """
+    found = {}
+    for start in range(0, len(point_ids), RETRIEVE_BATCH_SIZE):
+        response = qdrant.post(
+            f"{qdrant_url}/collections/{collection}/points",
+            json={"ids": point_ids[start:start + RETRIEVE_BATCH_SIZE],
+                  "with_payload": False, "with_vector": with_vector},
+            timeout=60,
+            idempotent=True
+        )
+        response.raise_for_status()
+        for point in response.json()["result"]:
+            found[vector_mirror.normalize_point_id(point["id"])] = point.get("vector")
+    return found
+
+
+def scroll_point_ids(search_filter, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """ID всех точек, подходящих под фильтр"""
+    point_ids = []
+    offset = None
+    while True:
+        body = {"filter": search_filter, "limit": SCROLL_PAGE_SIZE, "with_payload": False, "with_vector": False}
+        if offset is not None:
+            body["offset"] = offset
+        response = qdrant.post(f"{qdrant_url}/collections/{collection}/points/scroll",
+                               json=body, timeout=60, idempotent=True)
+        response.raise_for_status()
+        result = response.json()["result"]
+        point_ids.extend(point["id"] for point in result["points"])
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return point_ids
+
+
+def delete_points(point_ids, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """Удаляет точки по ID"""
+    response = qdrant.post(
+        f"{qdrant_url}/collections/{collection}/points/delete",
+        params={"wait": "true"},
+        json={"points": point_ids},
+        timeout=60,
+        idempotent=True
+    )
+    response.raise_for_status()
+
+
+def set_payload(point_ids, payload, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """Записывает поля payload сразу для группы точек (остальные поля не меняются)"""
+    response = qdrant.post(
+        f"{qdrant_url}/collections/{collection}/points/payload",
+        params={"wait": "true"},
+        json={"payload": payload, "points": point_ids},
+        timeout=60,
+        idempotent=True
+    )
+    response.raise_for_status()
+
+
+def plan_incremental(filename, hashes, point_ids, qdrant_url, collection, reuse=True):
+    """
+    Сверяет чанки документа с манифестом и Qdrant
+
+    Returns:
+        tuple: (unchanged, reused, previous_ids, previous_total)
+            unchanged - номера чанков, точки которых не меняются;
+            reused - номер чанка -> вектор из Qdrant (текст уже встречался в документе);
+            previous_ids - нормализованные ID точек прошлой загрузки (по манифесту или из Qdrant);
+            previous_total - число чанков прошлой загрузки (None, если документа нет в манифесте)
+        При reuse=False unchanged и reused пустые (эмбеддинги для всех чанков)
+    """
+    total = len(hashes)
+    old_total, old = ingest_state.get_manifest(filename)
+    if old_total is None:
+        # Документа нет в манифесте (загружен до него или манифест сброшен): точки берем
+        # из Qdrant, иначе совпавшие ID перезаписались бы до включения новой версии
+        old_ids = scroll_point_ids({"must": [{"key": "filename", "match": {"value": filename}}]},
+                                   qdrant_url, collection)
+    else:
+        old_ids = [point_id for point_id, _ in old.values()]
+    previous_ids = {vector_mirror.normalize_point_id(point_id) for point_id in old_ids}
+    if old_total is None or not reuse:
+        return [], {}, previous_ids, old_total
+
+    def same(idx):
+        """Чанк на том же месте с тем же ID"""
+        return idx in old and old[idx][0] == point_ids[idx]
+
+    # Payload точки: текст, номер, total_chunks и ID соседей - если что-то изменилось,
+    # точку надо перезаписать (со старым вектором, если текст тот же)
+    unchanged = [idx for idx in range(total)
+                 if old_total == total and same(idx) and old[idx][1] == hashes[idx]
+                 and (idx == 0 or same(idx - 1)) and (idx == total - 1 or same(idx + 1))]
+    unchanged_set = set(unchanged)
+    by_hash = {hash_: point_id for point_id, hash_ in old.values()}
+    sources = {idx: by_hash[hashes[idx]] for idx in range(total)
+               if idx not in unchanged_set and hashes[idx] in by_hash}
+
+    # Манифест мог разойтись с коллекцией (пересоздание, ручное удаление) - проверяем точки
+    present = retrieve_points([point_ids[idx] for idx in unchanged], qdrant_url, collection)
+    vectors = retrieve_points(sorted(set(sources.values())), qdrant_url, collection, with_vector=True)
+    unchanged = [idx for idx in unchanged if vector_mirror.normalize_point_id(point_ids[idx]) in present]
+    reused = {}
+    for idx, source_id in sources.items():
+        vector = vectors.get(vector_mirror.normalize_point_id(source_id))
+        if vector is not None:
+            reused[idx] = vector
+    return unchanged, reused, previous_ids, old_total
+
+
+def abandon_run(filename, run, active_version, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """Отменяет незавершенную загрузку: удаляет точки ее версии, которых нет в активной"""
+    search_filter = {"must": [{"key": "filename", "match": {"value": filename}},
+                              {"key": "doc_version", "match": {"any": [run["version"]]}}]}
+    if active_version:
+        search_filter["must_not"] = [{"key": "doc_version", "match": {"any": [active_version]}}]
+    point_ids = scroll_point_ids(search_filter, qdrant_url, collection)
+    if point_ids:
+        delete_points(point_ids, qdrant_url, collection)
+    ingest_journal.finish(filename)
+    print(f"🗑️ {filename}: незавершенная загрузка отменена, удалено точек: {len(point_ids)}")
+
+
+def recover_run(filename, hashes, point_ids, active_version, qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """
+    Разбирает незавершенную загрузку документа из журнала
+
+    Версия включена, но манифест не сохранен - сохраняет манифест по журналу.
+    Загрузка того же текста при той же активной версии - возвращается для
+    продолжения, иначе отменяется.
+
+    Returns:
+        dict: запись журнала для продолжения (см. ingest_journal.get_run) или None
+    """
+    run = ingest_journal.get_run(filename)
+    if run is None:
+        return None
+    if run["status"] == "activated":
+        ingest_state.save_manifest(
+            filename,
+            [(idx, point_id, hash_) for idx, (point_id, hash_, state, _) in run["chunks"].items()
+             if state == ingest_journal.UPSERTED],
+            run["total_chunks"]
+        )
+        ingest_journal.finish(filename)
+        return None
+    same_text = run["total_chunks"] == len(hashes) and all(
+        run["chunks"].get(idx, (None, None))[:2] == (point_ids[idx], hashes[idx]) for idx in range(len(hashes))
+    )
+    if same_text and run["previous_version"] == active_version:
+        return run
+    abandon_run(filename, run, active_version, qdrant_url, collection)
+    return None
+
+
+def ingest_chunks(filename, chunks, ollama_url=OLLAMA_URL, qdrant_url=QDRANT_URL,
+                  collection=COLLECTION_NAME, embed_batch_size=None,
+                  upsert_batch_size=None, progress=None, incremental=True):
+    """
+    Создает эмбеддинги для чанков документа и загружает их в Qdrant пачками
+
+    Документ загружается новой версией (doc_version в payload): точки новой версии
+    пишутся рядом со старыми, затем версия становится активной (поиск видит только
+    активные версии, см. ingest_state) и все остальные точки документа удаляются.
+    Если часть чанков загрузить не удалось, активной остается прежняя версия, а
+    следующая загрузка того же текста продолжит эту (по журналу ingest_journal).
+
+    Args:
+        filename: имя файла (идет в payload и в ID точек)
+        chunks: список текстов чанков
+        embed_batch_size: сколько чанков отправлять в Ollama за раз
+        upsert_batch_size: сколько точек отправлять в Qdrant за раз
+        progress: callback(done, total) после каждой пачки эмбеддингов
+        incremental: сверить с манифестом и загрузить только изменения
+            (False - эмбеддинги для всех чанков)
+
+    Returns:
+        dict: статистика загрузки, включая chunks_per_sec и activated
+    """
+    # Одна загрузка документа за раз: журнал и удаление старых точек рассчитаны на одну версию
+    with ingest_state.document_lock(filename):
+        return _ingest_chunks(filename, chunks, ollama_url, qdrant_url, collection,
+                              embed_batch_size, upsert_batch_size, progress, incremental)
+
+
+def _ingest_chunks(filename, chunks, ollama_url, qdrant_url, collection,
+                   embed_batch_size, upsert_batch_size, progress, incremental):
+    """Загрузка документа под блокировкой (см. ingest_chunks)"""
+    global _collection_ready
+    if not _collection_ready:
+        try:
+            collection_manager.ensure_collection(qdrant_url, collection)
+            _collection_ready = True
+        except Exception as e:
+            print(f"Ошибка подготовки коллекции: {e}")
+
+    embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+    upsert_batch_size = upsert_batch_size or UPSERT_BATCH_SIZE
+    total = len(chunks)
+    # ID от текста чанка (и номера в режиме fixed): измененный чанк - новая точка, а не перезапись
+    point_ids = chunking.point_ids(filename, chunks)
+    normalized_ids = [vector_mirror.normalize_point_id(point_id) for point_id in point_ids]
+    hashes = [ingest_state.text_hash(chunk) for chunk in chunks]
+
+    stats = {
+        "filename": filename,
+        "chunks": total,
+        "upserted": 0,
+        "failed": 0,
+        "unchanged": 0,
+        "reused": 0,
+        "embedded": 0,
+        "deleted": 0,
+        "survived": None,
+        "resumed": 0,
+        "activated": False,
+        "embed_seconds": 0.0,
+        "upsert_seconds": 0.0,
+    }
+    started = time.time()
+
+    def journal(call, *args):
+        """Запись в журнал; его ошибка не останавливает загрузку (продолжить ее будет нельзя)"""
+        try:
+            call(filename, *args)
+        except Exception as e:
+            print(f"Ошибка записи журнала загрузки: {e}")
+
+    try:
+        previous_version = ingest_state.get_active_version(filename)
+        run = recover_run(filename, hashes, point_ids, previous_version, qdrant_url, collection)
+    except Exception as e:
+        print(f"Ошибка чтения журнала загрузки: {e}")
+        previous_version, run = None, None
+    try:
+        unchanged, reused, previous_ids, previous_total = plan_incremental(
+            filename, hashes, point_ids, qdrant_url, collection, reuse=incremental
+        )
+    except Exception as e:
+        print(f"Ошибка сверки с манифестом, загружаем документ полностью: {e}")
+        unchanged, reused, previous_ids, previous_total = [], {}, set(), None
+    unchanged_set = set(unchanged)
+    # Прерванная загрузка: точки, которые она успела загрузить, и сохраненные векторы
+    resumed = {}
+    if run:
+        for idx, (_, _, state, vector) in run["chunks"].items():
+            if idx in unchanged_set or vector is None:
+                continue
+            if state == ingest_journal.UPSERTED:
+                resumed[idx] = vector
+            elif idx not in reused:
+                reused[idx] = vector
+    to_embed = [idx for idx in range(total) if idx not in unchanged_set and idx not in reused and idx not in resumed]
+    stats["unchanged"] = len(unchanged)
+    stats["reused"] = len(reused)
+    stats["resumed"] = len(resumed)
+    if incremental and previous_total is not None and total:
+        # Доля чанков, текст которых остался прежним: для них эмбеддинги не создаются
+        stats["survived"] = round((len(unchanged) + len(reused)) / total, 3)
+
+    if previous_version and previous_total == total and len(unchanged) == total:
+        if run:
+            try:
+                abandon_run(filename, run, previous_version, qdrant_url, collection)
+            except Exception as e:
+                print(f"Ошибка отмены незавершенной загрузки: {e}")
+        stats["activated"] = True
+        return finish_stats(stats, started, embed_batch_size, upsert_batch_size)
+
+    if run:
+        version = run["version"]
+        print(f"↩️ {filename}: продолжаем загрузку, уже загружено чанков: {len(resumed)}")
+    else:
+        version = uuid.uuid4().hex
+        # Журнал до первой записи в Qdrant: без него упавшую загрузку не продолжить
+        journal(ingest_journal.begin, version, previous_version, [
+            (idx, point_ids[idx], hashes[idx],
+             ingest_journal.UPSERTED if idx in unchanged_set
+             else ingest_journal.EMBEDDED if idx in reused else ingest_journal.PENDING,
+             reused.get(idx))
+            for idx in range(total)
+        ])
+    # Точки, общие со старой версией, до переключения должны быть видны в ней и не меняться:
+    # им дописывается новая версия, а новый payload (номер, соседи) пишется после переключения
+    # (точки без doc_version видны всегда - загружены до версионирования)
+    shared_versions = [previous_version, version] if previous_version else None
+    shared_ids = [point_ids[idx] for idx in range(total) if normalized_ids[idx] in previous_ids]
+
+    pending = []
+    deferred = []
+    # Чанки, точки которых точно есть в Qdrant - попадут в манифест
+    stored = list(unchanged) + sorted(resumed)
+    # Загруженные точки - для обновления локального зеркала векторов
+    mirrored = []
+
+    def make_point(idx, vector):
+        payload = {
+            "text": chunks[idx],
+            "filename": filename,
+            "chunk_index": idx,
+            "total_chunks": total,
+            # Соседи для расширения контекста (ID могут не зависеть от номера чанка)
+            "prev_id": point_ids[idx - 1] if idx > 0 else None,
+            "next_id": point_ids[idx + 1] if idx < total - 1 else None,
+            "doc_version": [version],
+            **extract_features(chunks[idx], filename)
+        }
+        return {"id": point_ids[idx], "vector": vector, "payload": payload}
+
+    def add(idx, vector):
+        if normalized_ids[idx] in previous_ids:
+            deferred.append(make_point(idx, vector))
+            return
+        pending.append(make_point(idx, vector))
+        while len(pending) >= upsert_batch_size:
+            flush(pending, wait=False)
+
+    def flush(queue, wait):
+        batch = queue[:upsert_batch_size]
+        del queue[:upsert_batch_size]
+        t0 = time.time()
+        try:
+            upsert_points(batch, qdrant_url, collection, wait=wait)
+            stats["upserted"] += len(batch)
+            indices = [point["payload"]["chunk_index"] for point in batch]
+            stored.extend(indices)
+            journal(ingest_journal.mark_upserted, indices)
+            if vector_mirror.VECTOR_MIRROR_ENABLED:
+                mirrored.extend(batch)
+        except Exception as e:
+            print(f"Ошибка загрузки пачки в Qdrant: {e}")
+            stats["failed"] += len(batch)
+        stats["upsert_seconds"] += time.time() - t0
+
+    if vector_mirror.VECTOR_MIRROR_ENABLED:
+        mirrored.extend(make_point(idx, resumed[idx]) for idx in sorted(resumed))
+
+    # Текст уже был в документе - вектор берем из Qdrant (или журнала), эмбеддинг не нужен
+    for idx in sorted(reused):
+        add(idx, reused[idx])
+    done = len(unchanged) + len(reused) + len(resumed)
+    if progress:
+        progress(done, total)
+
+    for start in range(0, len(to_embed), embed_batch_size):
+        batch = to_embed[start:start + embed_batch_size]
+
+        t0 = time.time()
+        try:
+            embeddings = embed_batch([chunks[idx] for idx in batch], ollama_url=ollama_url)
+        except Exception as e:
+            print(f"Ошибка получения эмбеддингов для чанков {batch[0]}-{batch[-1]}: {e}")
+            embeddings = None
+        stats["embed_seconds"] += time.time() - t0
+
+        if embeddings is None:
+            stats["failed"] += len(batch)
+        else:
+            stats["embedded"] += len(batch)
+            journal(ingest_journal.mark_embedded, dict(zip(batch, embeddings)))
+            for idx, embedding in zip(batch, embeddings):
+                add(idx, embedding)
+
+        done += len(batch)
+        if progress:
+            progress(done, total)
+
+    # Последнюю пачку ждем, чтобы после возврата документ был доступен для поиска
+    while pending:
+        flush(pending, wait=not pending[upsert_batch_size:])
+
+    if shared_ids and shared_versions and not stats["failed"]:
+        try:
+            set_payload(shared_ids, {"doc_version": shared_versions}, qdrant_url, collection)
+        except Exception as e:
+            print(f"Ошибка записи версии в общие чанки: {e}")
+            stats["failed"] += len(shared_ids)
+
+    # Документ уже был в базе - неполную версию не включаем; загруженные точки поиску
+    # не видны и остаются для продолжения загрузки (журнал)
+    if stats["failed"] and (previous_version or previous_ids):
+        print(f"❌ {filename}: не загружено {stats['failed']} чанков, активной осталась прежняя версия "
+              f"(повторная загрузка продолжит с этого места)")
+        return finish_stats(stats, started, embed_batch_size, upsert_batch_size)
+
+    # Переключение: новая версия становится видна поиску (webapp перечитывает активные
+    # версии при смене версии коллекции)
+    ingest_state.activate_version(filename, version)
+    journal(ingest_journal.mark_activated)
+    stats["activated"] = True
+    previous_collection_version = get_collection_version()
+    collection_version = bump_collection_version()
+
+    # Общие точки переводим на новую версию (с новым payload), все остальные точки документа удаляем
+    rewritten = {point["id"] for point in deferred}
+    while deferred:
+        flush(deferred, wait=not deferred[upsert_batch_size:])
+    removed = []
+    try:
+        retagged = [point_id for point_id in shared_ids if point_id not in rewritten]
+        if retagged:
+            set_payload(retagged, {"doc_version": [version]}, qdrant_url, collection)
+        removed = scroll_point_ids({
+            "must": [{"key": "filename", "match": {"value": filename}}],
+            "must_not": [{"key": "doc_version", "match": {"any": [version]}}]
+        }, qdrant_url, collection)
+        if removed:
+            delete_points(removed, qdrant_url, collection)
+            stats["deleted"] = len(removed)
+    except Exception as e:
+        # Точки старой версии поиску не видны, удалятся при следующей загрузке
+        print(f"Ошибка удаления старой версии документа: {e}")
+        removed = []
+
+    # Обновляем лексический индекс (BM25) для keyword-поиска
+    try:
+        lexical_index.index_document(filename, chunks, point_ids)
+    except Exception as e:
+        print(f"Ошибка обновления лексического индекса: {e}")
+
+    if vector_mirror.VECTOR_MIRROR_ENABLED and (mirrored or removed):
+        try:
+            vector_mirror.apply_points(mirrored, previous_collection_version, collection_version,
+                                       remove_ids=removed)
+        except Exception as e:
+            print(f"Ошибка обновления зеркала векторов: {e}")
+
+    entries = [(idx, point_ids[idx], hashes[idx]) for idx in stored]
+    try:
+        ingest_state.save_manifest(filename, entries, total)
+        journal(ingest_journal.finish)
+    except Exception as e:
+        print(f"Ошибка сохранения манифеста: {e}")
+
+    return finish_stats(stats, started, embed_batch_size, upsert_batch_size)
+
+
+def finish_stats(stats, started, embed_batch_size, upsert_batch_size):
+    """Итоговые времена и скорость загрузки, запись в историю и вывод в лог"""
+    elapsed = time.time() - started
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["embed_seconds"] = round(stats["embed_seconds"], 2)
+    stats["upsert_seconds"] = round(stats["upsert_seconds"], 2)
+    stats["chunks_per_sec"] = round((stats["upserted"] + stats["unchanged"]) / elapsed, 2) if elapsed > 0 else 0.0
+    try:
+        ingest_state.record_run(stats["filename"], chunking.CHUNKING_MODE, stats)
+    except Exception as e:
+        print(f"Ошибка записи истории загрузки: {e}")
+    survived = "-" if stats["survived"] is None else f"{stats['survived']:.0%}"
+    print(
+        f"📈 {stats['filename']}: {stats['upserted'] + stats['unchanged'] + stats['resumed']}/{stats['chunks']} чанков "
+        f"за {stats['elapsed_seconds']} сек (сохранилось {survived}, "
+        f"без изменений {stats['unchanged']}, вектор переиспользован {stats['reused']}, "
+        f"эмбеддингов {stats['embedded']}, продолжено {stats['resumed']}, удалено {stats['deleted']}; "
+        f"embed_batch={embed_batch_size}, upsert_batch={upsert_batch_size})"
+    )
+    return stats
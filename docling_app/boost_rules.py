@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Движок правил re-ranking'а результатов поиска
+
+Правила описаны декларативно в boost_rules.json, загружаются один раз
+на процесс, триггеры по запросу компилируются в регулярки. Для каждого
+правила копится статистика: сколько раз сработало и сколько времени заняло.
+
+Типы условий правила (проверяются по payload кандидата):
+    filename_contains  - подстрока в имени файла
+    payload_less_than  - {"field": ..., "value": ...}, числовое поле меньше значения
+    flag               - булев признак чанка (has_definition, has_formula)
+    field_contains     - {"field": ..., "value": ...}, значение есть в списке признаков
+Необязательный query_any - правило активно, только если запрос содержит
+хотя бы одну из подстрок.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from pathlib import Path
+
+from chunk_features import features_from_payload
+
+BOOST_RULES_PATH = os.getenv('BOOST_RULES_PATH', str(Path(__file__).with_name('boost_rules.json')))
+
+
+def _compile_query_trigger(substrings):
+    """Компилирует список подстрок запроса в одну регулярку"""
+    if not substrings:
+        return None
+    return re.compile("|".join(re.escape(s) for s in sorted(substrings, key=len, reverse=True)))
+
+
+def _compile_condition(rule):
+    """Превращает условие правила в функцию (payload, features) -> bool"""
+    if 'filename_contains' in rule:
+        pattern = rule['filename_contains']
+        return lambda payload, features: pattern in payload.get('filename', '')
+    if 'payload_less_than' in rule:
+        field, value = rule['payload_less_than']['field'], rule['payload_less_than']['value']
+        return lambda payload, features: payload.get(field, value) < value
+    if 'flag' in rule:
+        flag = rule['flag']
+        return lambda payload, features: bool(features.get(flag))
+    if 'field_contains' in rule:
+        field, value = rule['field_contains']['field'], rule['field_contains']['value']
+        return lambda payload, features: value in features.get(field, ())
+    raise ValueError(f"Правило {rule.get('name')}: не задано условие")
+
+
+class BoostRule:
+    """Скомпилированное правило со счетчиками"""
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.boost = config['boost']
+        self.query_trigger = _compile_query_trigger(config.get('query_any'))
+        self.condition = _compile_condition(config)
+        self.needs_features = 'flag' in config or 'field_contains' in config
+        self.hits = 0
+        self.activations = 0
+        self.seconds = 0.0
+
+    def is_active(self, query_lower):
+        return self.query_trigger is None or self.query_trigger.search(query_lower) is not None
+
+
+class BoostRuleEngine:
+    """Набор правил boosting'а, загруженный из конфига"""
+
+    def __init__(self, config):
+        self.min_score_threshold = config.get('min_score_threshold', 0.0)
+        self.doc_filters = [
+            (re.compile(re.escape(f['query'])), f['filename_text'])
+            for f in config.get('doc_filters', [])
+        ]
+        self.definition_prefixes = config.get('definition_query_prefixes', [])
+        self.rules = [BoostRule(rule) for rule in config.get('rules', [])]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path=BOOST_RULES_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def get_doc_filter(self, query_lower):
+        """Qdrant-фильтр по документу, если он явно упомянут в запросе"""
+        for trigger, filename_text in self.doc_filters:
+            if trigger.search(query_lower):
+                return {"must": [{"key": "filename", "match": {"text": filename_text}}]}, filename_text
+        return None, None
+
+    def get_definition_term(self, query_lower):
+        """Термин из вопроса вида "Что такое X?" (или None)"""
+        for prefix in self.definition_prefixes:
+            if prefix in query_lower:
+                return query_lower.replace(prefix, '').replace('?', '').strip()
+        return None
+
+    def apply(self, query, results):
+        """
+        Применяет активные для запроса правила ко всем кандидатам
+
+        Меняет result["score"] на месте.
+
+        Returns:
+            dict: {имя правила: сколько кандидатов получили boost}
+        """
+        query_lower = query.lower()
+        active = [rule for rule in self.rules if rule.is_active(query_lower)]
+        if not active or not results:
+            return {}
+
+        # Признаки считаем один раз на кандидата и только если они нужны
+        if any(rule.needs_features for rule in active):
+            features = [features_from_payload(r["payload"]) for r in results]
+        else:
+            features = [{}] * len(results)
+
+        fired = {}
+        timings = []
+        for rule in active:
+            started = time.perf_counter()
+            hits = 0
+            for result, chunk_features in zip(results, features):
+                if rule.condition(result["payload"], chunk_features):
+                    result["score"] += rule.boost
+                    hits += 1
+            timings.append((rule, hits, time.perf_counter() - started))
+            if hits:
+                fired[rule.name] = hits
+
+        with self._lock:
+            for rule, hits, seconds in timings:
+                rule.activations += 1
+                rule.hits += hits
+                rule.seconds += seconds
+        return fired
+
+    def get_stats(self):
+        """Статистика по правилам: срабатывания и затраченное время"""
+        with self._lock:
+            return [{
+                'name': rule.name,
+                'boost': rule.boost,
+                'activations': rule.activations,
+                'hits': rule.hits,
+                'total_ms': round(rule.seconds * 1000, 3),
+            } for rule in self.rules]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Движок правил текущего процесса (конфиг читается один раз)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = BoostRuleEngine.from_file()
+    return _engine
@@ -1,52 +1,22 @@
 #!/usr/bin/env python3
 """
 Скрипт для проверки всех файлов - какие обработаны, какие нет
+
+Читает манифест и журнал загрузок (ingest_journal), коллекцию не сканирует.
 """
 
-import requests
+import ingest_journal
 from pathlib import Path
 import os
 
-QDRANT_URL = "http://qdrant-docling:6333"
-COLLECTION_NAME = "documents"
 PROCESSED_DIR = "/shared/processed"
 
 def get_processed_files():
-    """Получает список всех обработанных файлов из Qdrant"""
+    """Получает список всех обработанных файлов (манифест и журнал загрузок, без scroll'а Qdrant)"""
     try:
-        response = requests.post(
-            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
-            json={
-                "limit": 10000,
-                "with_payload": True,
-                "with_vector": False
-            },
-            timeout=10
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        files_dict = {}
-        for point in data.get("result", {}).get("points", []):
-            filename = point.get("payload", {}).get("filename")
-            if filename:
-                if filename not in files_dict:
-                    files_dict[filename] = {
-                        "chunks": 0,
-                        "last_chunk_index": 0,
-                        "total_chunks": 0
-                    }
-                files_dict[filename]["chunks"] += 1
-                chunk_idx = point.get("payload", {}).get("chunk_index", 0)
-                total = point.get("payload", {}).get("total_chunks", 0)
-                if chunk_idx > files_dict[filename]["last_chunk_index"]:
-                    files_dict[filename]["last_chunk_index"] = chunk_idx
-                if total > files_dict[filename]["total_chunks"]:
-                    files_dict[filename]["total_chunks"] = total
-        
-        return files_dict
+        return ingest_journal.processed_documents()
     except Exception as e:
-        print(f"Ошибка подключения к Qdrant: {e}")
+        print(f"Ошибка чтения манифеста: {e}")
         return {}
 
 def get_all_md_files():
@@ -71,7 +41,7 @@ if __name__ == "__main__":
     else:
         print(f"📄 Найдено файлов в директории: {len(all_files)}\n")
         
-        # Получаем обработанные файлы из Qdrant
+        # Получаем обработанные файлы из манифеста и журнала
         processed = get_processed_files()
         
         print("📊 Статус обработки:\n")
@@ -86,7 +56,7 @@ if __name__ == "__main__":
                 chunks_done = info["chunks"]
                 total = info["total_chunks"]
                 
-                if total > 0 and chunks_done == total:
+                if info["status"] == "done" and total > 0 and chunks_done == total:
                     status = "✅"
                     fully_processed.append(filename)
                     print(f"{status} {filename}")
@@ -1,9 +1,9 @@
-import requests
+from http_client import qdrant
 
 QDRANT_URL = 'http://qdrant-docling:6333'
 
 # Scroll through Справочник chunks
-r = requests.post(
+r = qdrant.post(
     f'{QDRANT_URL}/collections/documents/points/scroll',
     json={
         'limit': 100,
@@ -15,7 +15,8 @@ r = requests.post(
             }]
         }
     },
-    timeout=30
+    timeout=30,
+    idempotent=True
 )
 
 points = r.json()['result']['points']
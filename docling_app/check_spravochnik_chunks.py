@@ -1,19 +1,20 @@
-import requests
+from http_client import ollama, qdrant
 
 QDRANT_URL = 'http://qdrant-docling:6333'
 OLLAMA_URL = 'http://ollama-docling:11434'
 query = 'что такое система сбалансированных показателей'
 
 # Get embedding
-r1 = requests.post(
+r1 = ollama.post(
     f'{OLLAMA_URL}/api/embeddings',
     json={'model': 'nomic-embed-text', 'prompt': query},
-    timeout=60
+    timeout=60,
+    idempotent=True
 )
 embedding = r1.json()['embedding']
 
 # Search ONLY in Справочник
-r2 = requests.post(
+r2 = qdrant.post(
     f'{QDRANT_URL}/collections/documents/points/search',
     json={
         'vector': embedding,
@@ -26,7 +27,8 @@ r2 = requests.post(
             }]
         }
     },
-    timeout=30
+    timeout=30,
+    idempotent=True
 )
 results = r2.json()['result']
 
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Признаки чанков, вычисляемые один раз при загрузке документа
+
+Сохраняются в payload точки Qdrant (с payload-индексами), чтобы при поиске
+не прогонять регулярки по тексту каждого кандидата:
+    has_definition  - в чанке есть определение вида **Термин** = ...
+    defined_terms   - какие термины определяются (в нижнем регистре)
+    has_formula     - в чанке есть формула вида ВВ = Кзаг * НЧ * tраб
+    formula_vars    - какие переменные формул упоминаются (вв, кзаг, нч, ...)
+    doc_family      - семейство документа (справочник, золотой стандарт, ...)
+
+Использование:
+    python chunk_features.py backfill   # посчитать признаки для уже загруженных точек
+"""
+
+import os
+import re
+
+# Паттерны определений: **Название** =, **Название (НЧ)** =, Название (НЧ) =
+DEFINITION_PATTERNS = [
+    re.compile(r'\*\*[А-ЯЁа-яё\s]+\*\*\s*='),
+    re.compile(r'\*\*[А-ЯЁа-яё\s]+\([А-ЯЁа-яё]+\)\*\*\s*='),
+    re.compile(r'[А-ЯЁа-яё\s]+\([А-ЯЁ]+\)\s*='),
+]
+
+# Из чего извлекаются сами определяемые термины
+DEFINED_TERM_PATTERNS = [
+    re.compile(r'\*\*([^*\n]{2,80}?)\*\*\s*='),
+    re.compile(r'([А-ЯЁа-яё][А-ЯЁа-яё ]{1,60}?\s*\([А-ЯЁ][А-ЯЁа-яё]*\))\s*='),
+]
+
+# Паттерны формул: ВВ = Кзаг * НЧ * тр, формулы с делением, сокращения типа ВВ=
+FORMULA_PATTERNS = [
+    re.compile(r'[А-ЯЁ]+[А-ЯЁа-яё]*\s*=\s*[А-ЯЁа-яё0-9\s\+\-\*\(\)]+', re.IGNORECASE),
+    re.compile(r'[А-ЯЁ]+[А-ЯЁа-яё]*\s*=\s*[А-ЯЁа-яё0-9\s\+\-\*\/\(\)]+', re.IGNORECASE),
+    re.compile(r'\b[А-ЯЁ]{2,}\s*[=:]\s*', re.IGNORECASE),
+]
+
+# Переменные формул и слова, по которым они узнаются в тексте
+FORMULA_VAR_KEYWORDS = {
+    'вв': ['валов', 'выручк'],
+    'кзаг': ['коэффициент', 'загрузк'],
+    'нч': ['нормочас'],
+    'нормочас': ['нормочас', 'нч'],
+    'тр': ['рабоч', 'времен'],
+}
+
+# Семейства документов по подстроке в имени файла
+DOC_FAMILIES = {
+    'Справочник': 'справочник',
+    'Золотой Стандарт': 'золотой стандарт',
+    'ПИР': 'пир',
+    'Директор': 'директор',
+}
+
+# Payload-индексы Qdrant для признаков
+FEATURE_INDEXES = {
+    'has_definition': 'bool',
+    'defined_terms': 'keyword',
+    'has_formula': 'bool',
+    'formula_vars': 'keyword',
+    'doc_family': 'keyword',
+}
+
+
+def has_definition(text):
+    """Есть ли в тексте определение термина"""
+    return any(pattern.search(text) for pattern in DEFINITION_PATTERNS)
+
+
+def has_formula(text):
+    """Есть ли в тексте формула"""
+    return any(pattern.search(text) for pattern in FORMULA_PATTERNS)
+
+
+def extract_defined_terms(text):
+    """Извлекает определяемые термины: 'Нормочас доктора (НЧ)' -> ['нормочас доктора', 'нч']"""
+    terms = []
+    for pattern in DEFINED_TERM_PATTERNS:
+        for match in pattern.finditer(text):
+            raw = match.group(1)
+            name = re.sub(r'\([^)]*\)', '', raw)
+            candidates = [name] + re.findall(r'\(([^)]+)\)', raw)
+            for term in candidates:
+                term = " ".join(term.lower().replace('ё', 'е').split())
+                if len(term) >= 2 and term not in terms:
+                    terms.append(term)
+    return terms
+
+
+def extract_formula_vars(text_lower):
+    """Какие переменные формул упоминаются в тексте (текст уже в нижнем регистре)"""
+    return [var for var, keywords in FORMULA_VAR_KEYWORDS.items()
+            if any(kw in text_lower for kw in keywords)]
+
+
+def get_doc_family(filename):
+    """Семейство документа по имени файла"""
+    for pattern, family in DOC_FAMILIES.items():
+        if pattern in filename:
+            return family
+    return 'other'
+
+
+def extract_features(text, filename):
+    """
+    Вычисляет все признаки чанка для payload
+
+    Returns:
+        dict: has_definition, defined_terms, has_formula, formula_vars, doc_family
+    """
+    return {
+        'has_definition': has_definition(text),
+        'defined_terms': extract_defined_terms(text),
+        'has_formula': has_formula(text),
+        'formula_vars': extract_formula_vars(text.lower()),
+        'doc_family': get_doc_family(filename),
+    }
+
+
+def features_from_payload(payload):
+    """Признаки чанка из payload; для точек, загруженных до появления признаков, считает на лету"""
+    if 'has_definition' in payload:
+        return payload
+    return extract_features(payload.get('text', ''), payload.get('filename', ''))
+
+
+def ensure_payload_indexes(qdrant_url, collection="documents"):
+    """Создает payload-индексы для признаков (повторный вызов безопасен)"""
+    from http_client import qdrant
+
+    for field_name, field_schema in FEATURE_INDEXES.items():
+        response = qdrant.put(
+            f"{qdrant_url}/collections/{collection}/index",
+            params={"wait": "true"},
+            json={"field_name": field_name, "field_schema": field_schema},
+            timeout=30
+        )
+        response.raise_for_status()
+
+
+def backfill(qdrant_url, collection="documents", batch_size=128):
+    """Считает признаки для всех точек коллекции и записывает их в payload"""
+    from http_client import qdrant
+
+    ensure_payload_indexes(qdrant_url, collection)
+
+    updated = 0
+    offset = None
+    while True:
+        scroll_params = {"limit": batch_size, "with_payload": ["text", "filename"], "with_vector": False}
+        if offset:
+            scroll_params["offset"] = offset
+        response = qdrant.post(
+            f"{qdrant_url}/collections/{collection}/points/scroll",
+            json=scroll_params,
+            timeout=60,
+            idempotent=True
+        )
+        response.raise_for_status()
+        result = response.json()["result"]
+
+        operations = [{
+            "set_payload": {
+                "payload": extract_features(point["payload"]["text"], point["payload"]["filename"]),
+                "points": [point["id"]]
+            }
+        } for point in result["points"]]
+        if operations:
+            response = qdrant.post(
+                f"{qdrant_url}/collections/{collection}/points/batch",
+                params={"wait": "true"},
+                json={"operations": operations},
+                timeout=60,
+                idempotent=True  # set_payload с теми же значениями
+            )
+            response.raise_for_status()
+            updated += len(operations)
+            print(f"  ✅ Обновлено точек: {updated}")
+
+        offset = result.get("next_page_offset")
+        if not offset:
+            break
+
+    print(f"✨ Признаки посчитаны для {updated} точек")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("Использование: python chunk_features.py backfill")
+        sys.exit(1)
+
+    backfill(os.getenv('QDRANT_URL', "http://qdrant-docling:6333"))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Разбиение документов на чанки и ID точек
+
+Два режима (CHUNKING_MODE):
+    fixed - окна по CHUNK_SIZE слов с перекрытием CHUNK_OVERLAP, ID точки - md5 от
+            имени файла, текста и номера чанка. Вставка одного предложения в начало
+            документа сдвигает все следующие окна, и все чанки приходится пересоздавать.
+    cdc   - границы определяются содержимым: rolling hash по последним словам
+            (граница там, где хэш попадает в маску) или заголовок markdown, с
+            ограничениями CDC_MIN_WORDS/CDC_MAX_WORDS. Правка меняет только чанки
+            рядом с ней, остальные границы сохраняются. ID точки - md5 от имени
+            файла и текста чанка, поэтому не зависит от номера чанка.
+
+В обоих режимах ID зависит от текста: измененный чанк попадает в новую точку, а не
+перезаписывает точку прежней версии документа, которую еще может читать поиск.
+Соседние чанки связаны через prev_id/next_id в payload (см. batch_ingest).
+
+Использование:
+    python chunking.py compare старый.md новый.md   # доля сохранившихся чанков в обоих режимах
+"""
+
+import os
+import sys
+import math
+import zlib
+import hashlib
+
+CHUNKING_MODE = os.getenv('CHUNKING_MODE', 'fixed')
+
+CHUNK_SIZE = 350  # Оптимизировано для формул
+CHUNK_OVERLAP = 70  # Больший overlap для лучшего покрытия формул
+
+# Размер участка без перекрытия: в среднем участок + CHUNK_OVERLAP ~ CHUNK_SIZE слов
+CDC_MIN_WORDS = int(os.getenv('CDC_MIN_WORDS', '160'))
+CDC_AVG_WORDS = int(os.getenv('CDC_AVG_WORDS', '280'))
+CDC_MAX_WORDS = int(os.getenv('CDC_MAX_WORDS', '420'))
+# Граница, если младшие биты хэша нулевые: в среднем раз в 2^bits слов после минимума
+_CDC_MASK = (1 << max(1, round(math.log2(max(2, CDC_AVG_WORDS - CDC_MIN_WORDS))))) - 1
+
+
+def chunk_point_id(filename, idx):
+    """Детерминированный ID точки: md5 от имени файла и номера чанка"""
+    return hashlib.md5(f"{filename}_{idx}".encode()).hexdigest()
+
+
+def content_point_id(filename, text, occurrence=0):
+    """ID точки по содержимому: md5 от имени файла, хэша текста и номера повтора текста в документе"""
+    text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return hashlib.md5(f"{filename}:{text_hash}:{occurrence}".encode()).hexdigest()
+
+
+def fixed_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Чанки по chunk_size слов с перекрытием overlap"""
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = " ".join(words[i:i + chunk_size])
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def _words_with_headings(text):
+    """Слова текста и номера слов, с которых начинаются заголовки markdown"""
+    words = []
+    headings = set()
+    for line in text.splitlines():
+        line_words = line.split()
+        if line_words and line_words[0].startswith('#'):
+            headings.add(len(words))
+        words.extend(line_words)
+    return words, headings
+
+
+def cdc_segments(words, headings=(), min_words=CDC_MIN_WORDS, max_words=CDC_MAX_WORDS, mask=_CDC_MASK):
+    """
+    Границы участков по содержимому
+
+    Gear-хэш: h = (h << 1) + crc32(слово), поэтому он зависит только от последних
+    32 слов и после правки границы снова совпадают с прежними. Перед заголовком
+    участок закрывается, если набрал min_words.
+
+    Returns:
+        list: пары (start, end) номеров слов
+    """
+    segments = []
+    start = 0
+    h = 0
+    for i, word in enumerate(words):
+        if i in headings and i - start >= min_words:
+            segments.append((start, i))
+            start = i
+        h = ((h << 1) + zlib.crc32(word.encode('utf-8'))) & 0xFFFFFFFF
+        length = i + 1 - start
+        if (length >= min_words and not h & mask) or length >= max_words:
+            segments.append((start, i + 1))
+            start = i + 1
+    if start < len(words):
+        segments.append((start, len(words)))
+    return segments
+
+
+def cdc_chunks(text, overlap=CHUNK_OVERLAP):
+    """Чанки с границами по содержимому; к каждому добавляются последние overlap слов предыдущего участка"""
+    words, headings = _words_with_headings(text)
+    chunks = []
+    for start, end in cdc_segments(words, headings):
+        chunks.append(" ".join(words[max(0, start - overlap):end] if chunks else words[start:end]))
+    return chunks
+
+
+def split_text(text, mode=None):
+    """Чанки документа в режиме mode (по умолчанию CHUNKING_MODE)"""
+    if (mode or CHUNKING_MODE) == 'cdc':
+        return cdc_chunks(text)
+    return fixed_chunks(text)
+
+
+def point_ids(filename, chunks, mode=None):
+    """ID точек для чанков документа: по тексту и номеру (fixed) или по тексту и номеру повтора (cdc)"""
+    if (mode or CHUNKING_MODE) != 'cdc':
+        return [content_point_id(filename, chunk, idx) for idx, chunk in enumerate(chunks)]
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        occurrence = seen.get(chunk, 0)
+        seen[chunk] = occurrence + 1
+        ids.append(content_point_id(filename, chunk, occurrence))
+    return ids
+
+
+def survival(old_chunks, new_chunks):
+    """Доля новых чанков, текст которых уже был в старой версии (их эмбеддинги не пересоздаются)"""
+    old = set(old_chunks)
+    return sum(chunk in old for chunk in new_chunks) / len(new_chunks) if new_chunks else 1.0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "compare":
+        print("Использование: python chunking.py compare старый.md новый.md")
+        sys.exit(1)
+
+    with open(sys.argv[2], 'r', encoding='utf-8') as f:
+        old_text = f.read()
+    with open(sys.argv[3], 'r', encoding='utf-8') as f:
+        new_text = f.read()
+    for mode in ('fixed', 'cdc'):
+        old_chunks, new_chunks = split_text(old_text, mode), split_text(new_text, mode)
+        kept = survival(old_chunks, new_chunks)
+        print(f"{mode:>5}: чанков {len(old_chunks)} -> {len(new_chunks)}, сохранилось {kept:.0%}, "
+              f"новых эмбеддингов {round(len(new_chunks) * (1 - kept))}")
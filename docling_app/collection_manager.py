@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Создание и настройка коллекции Qdrant
+
+ensure_collection идемпотентно приводит коллекцию к описанной здесь
+конфигурации: создает ее, если нет, иначе меняет только то, что отличается
+(параметры HNSW, хранение payload на диске, скалярное int8-квантование),
+и создает недостающие payload-индексы (keyword/integer для фильтров поиска
+и индексы признаков чанков).
+
+Использование:
+    python collection_manager.py migrate          # создать / обновить коллекцию
+    python collection_manager.py migrate --bench  # то же, с замером фильтрованного поиска до и после
+    python collection_manager.py bench            # замер фильтрованного поиска
+    python collection_manager.py show             # текущая конфигурация коллекции
+"""
+
+import os
+import time
+import random
+import statistics
+
+from http_client import qdrant
+from chunk_features import FEATURE_INDEXES
+
+QDRANT_URL = os.getenv('QDRANT_URL', "http://qdrant-docling:6333")
+COLLECTION_NAME = "documents"
+VECTOR_SIZE = 768  # nomic-embed-text
+DISTANCE = "Cosine"
+
+HNSW_CONFIG = {
+    "m": int(os.getenv('QDRANT_HNSW_M', '16')),
+    "ef_construct": int(os.getenv('QDRANT_HNSW_EF_CONSTRUCT', '128')),
+    "full_scan_threshold": 10000,
+}
+ON_DISK_PAYLOAD = os.getenv('QDRANT_ON_DISK_PAYLOAD', '1') == '1'
+QUANTIZATION_ENABLED = os.getenv('QDRANT_QUANTIZATION', '1') == '1'
+QUANTIZATION_CONFIG = {
+    "scalar": {
+        "type": "int8",
+        "quantile": 0.99,
+        "always_ram": True,
+    }
+}
+
+# Payload-индексы для фильтров поиска (расширение контекста, поиск пропущенных чанков).
+# filename - keyword: точные совпадения match.value; фильтр по документу (match.text)
+# работает как раньше - проверкой подстроки
+PAYLOAD_INDEXES = {
+    'filename': 'keyword',
+    'chunk_index': 'integer',
+    'total_chunks': 'integer',
+    # Версия документа (batch_ingest): фильтр активных версий и удаление прежней
+    'doc_version': 'keyword',
+    **FEATURE_INDEXES,
+}
+
+
+def get_collection(qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """Информация о коллекции или None, если ее нет"""
+    response = qdrant.get(f"{qdrant_url}/collections/{collection}", timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()["result"]
+
+
+def _create(qdrant_url, collection):
+    body = {
+        "vectors": {"size": VECTOR_SIZE, "distance": DISTANCE},
+        "hnsw_config": HNSW_CONFIG,
+        "on_disk_payload": ON_DISK_PAYLOAD,
+    }
+    if QUANTIZATION_ENABLED:
+        body["quantization_config"] = QUANTIZATION_CONFIG
+    response = qdrant.put(f"{qdrant_url}/collections/{collection}", json=body, timeout=60)
+    response.raise_for_status()
+
+
+def _config_changes(info):
+    """Что нужно поменять в существующей коллекции (тело PATCH /collections/{name})"""
+    config = info["config"]
+    vectors = config["params"]["vectors"]
+    if vectors.get("size") != VECTOR_SIZE or vectors.get("distance") != DISTANCE:
+        raise ValueError(
+            f"Коллекция создана с вектором {vectors.get('size')}/{vectors.get('distance')}, "
+            f"нужен {VECTOR_SIZE}/{DISTANCE} - требуется пересоздание и переиндексация"
+        )
+
+    changes = {}
+    hnsw = config.get("hnsw_config", {})
+    hnsw_diff = {key: value for key, value in HNSW_CONFIG.items() if hnsw.get(key) != value}
+    if hnsw_diff:
+        changes["hnsw_config"] = hnsw_diff
+    if config["params"].get("on_disk_payload") != ON_DISK_PAYLOAD:
+        changes["params"] = {"on_disk_payload": ON_DISK_PAYLOAD}
+    quantization = config.get("quantization_config")
+    if QUANTIZATION_ENABLED and quantization != QUANTIZATION_CONFIG:
+        changes["quantization_config"] = QUANTIZATION_CONFIG
+    elif not QUANTIZATION_ENABLED and quantization:
+        changes["quantization_config"] = "Disabled"
+    return changes
+
+
+def ensure_payload_indexes(qdrant_url=QDRANT_URL, collection=COLLECTION_NAME, info=None):
+    """Создает недостающие payload-индексы; возвращает список созданных"""
+    info = info or get_collection(qdrant_url, collection)
+    existing = info.get("payload_schema", {}) if info else {}
+    created = []
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if existing.get(field_name, {}).get("data_type") == field_schema:
+            continue
+        response = qdrant.put(
+            f"{qdrant_url}/collections/{collection}/index",
+            params={"wait": "true"},
+            json={"field_name": field_name, "field_schema": field_schema},
+            timeout=60
+        )
+        response.raise_for_status()
+        created.append(field_name)
+    return created
+
+
+def ensure_collection(qdrant_url=QDRANT_URL, collection=COLLECTION_NAME):
+    """
+    Создает коллекцию или приводит существующую к нужной конфигурации
+
+    Повторный вызов ничего не меняет.
+
+    Returns:
+        dict: created (bool), changes (что изменено в конфигурации), indexes (созданные индексы)
+    """
+    info = get_collection(qdrant_url, collection)
+    report = {"created": False, "changes": {}, "indexes": []}
+
+    if info is None:
+        print(f"📦 Создание коллекции {collection}...")
+        _create(qdrant_url, collection)
+        report["created"] = True
+        info = get_collection(qdrant_url, collection)
+    else:
+        changes = _config_changes(info)
+        if changes:
+            print(f"🔧 Обновление конфигурации {collection}: {', '.join(changes)}")
+            response = qdrant.patch(f"{qdrant_url}/collections/{collection}", json=changes, timeout=60)
+            response.raise_for_status()
+            report["changes"] = changes
+
+    report["indexes"] = ensure_payload_indexes(qdrant_url, collection, info)
+    if report["indexes"]:
+        print(f"📇 Созданы payload-индексы: {', '.join(report['indexes'])}")
+    return report
+
+
+def wait_until_green(qdrant_url=QDRANT_URL, collection=COLLECTION_NAME, timeout=600):
+    """Ждет окончания оптимизации (перестроение HNSW/квантования после изменения конфигурации)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if get_collection(qdrant_url, collection)["status"] == "green":
+            return True
+        time.sleep(2)
+    return False
+
+
+def bench(qdrant_url=QDRANT_URL, collection=COLLECTION_NAME, queries=30, limit=15):
+    """
+    Замер задержки фильтрованного поиска (как в search_documents и расширении контекста)
+
+    В роли запросов - векторы случайных точек коллекции.
+
+    Returns:
+        dict: {сценарий: {'median_ms', 'p95_ms'}}
+    """
+    response = qdrant.post(
+        f"{qdrant_url}/collections/{collection}/points/scroll",
+        json={"limit": 500, "with_payload": ["filename", "chunk_index"], "with_vector": True},
+        timeout=60,
+        idempotent=True
+    )
+    response.raise_for_status()
+    points = response.json()["result"]["points"]
+    if not points:
+        print("Коллекция пуста")
+        return {}
+    samples = random.sample(points, min(queries, len(points)))
+
+    def doc_filter(point):
+        # Фильтр по документу, как при упоминании документа в вопросе
+        word = point["payload"]["filename"].split()[0].split('.')[0]
+        return {"must": [{"key": "filename", "match": {"text": word}}]}
+
+    def neighbor_filter(point):
+        # Соседние чанки одного файла
+        idx = point["payload"]["chunk_index"]
+        return {"must": [
+            {"key": "filename", "match": {"value": point["payload"]["filename"]}},
+            {"key": "chunk_index", "match": {"any": [max(0, idx - 1), idx, idx + 1]}}
+        ]}
+
+    scenarios = {
+        "unfiltered": lambda point: None,
+        "doc_filter": doc_filter,
+        "filename+chunk_index": neighbor_filter,
+    }
+    results = {}
+    for name, make_filter in scenarios.items():
+        timings = []
+        for point in samples:
+            body = {"vector": point["vector"], "limit": limit, "with_payload": True}
+            search_filter = make_filter(point)
+            if search_filter:
+                body["filter"] = search_filter
+            started = time.perf_counter()
+            response = qdrant.post(
+                f"{qdrant_url}/collections/{collection}/points/search",
+                json=body,
+                timeout=30,
+                idempotent=True
+            )
+            response.raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            "median_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        }
+    return results
+
+
+def _print_bench(title, results):
+    print(f"\n{title}")
+    for name, timing in results.items():
+        print(f"  {name:<22} median {timing['median_ms']:>8.2f} мс   p95 {timing['p95_ms']:>8.2f} мс")
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "migrate":
+        with_bench = "--bench" in sys.argv
+        if with_bench and get_collection() is not None:
+            _print_bench("До миграции:", bench())
+        print(json.dumps(ensure_collection(), ensure_ascii=False, indent=2))
+        if with_bench:
+            print("Ожидание окончания оптимизации...")
+            wait_until_green()
+            _print_bench("После миграции:", bench())
+    elif command == "bench":
+        _print_bench("Фильтрованный поиск:", bench())
+    elif command == "show":
+        print(json.dumps(get_collection(), ensure_ascii=False, indent=2))
+    else:
+        print("Использование: python collection_manager.py migrate [--bench] | bench | show")
+        sys.exit(1)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Сервис конвертации документов с постоянно загруженными моделями Docling
+
+Держит пул из CONVERTER_POOL_SIZE конвертеров, модели которых загружаются
+один раз при старте (прогрев форматов CONVERTER_WARMUP_FORMATS), и принимает
+задачи по HTTP. Запрос ждет свободный конвертер, поэтому одновременно идет
+не больше CONVERTER_POOL_SIZE конвертаций.
+
+API:
+    POST /convert  {"path": "/documents/файл.pdf", "output_dir": "/shared/processed"}
+                   -> {"success": true, "output_file": "...", "seconds": 3.2, "cold": false}
+    GET  /stats    - число конвертаций, задержки холодных/теплых конвертаций, пропускная способность
+    GET  /health
+
+Использование:
+    python conversion_server.py                        # запуск сервиса
+    python conversion_server.py bench <файл> [повторов]  # подпроцесс против сервиса
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import statistics
+import subprocess
+from collections import deque
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CONVERSION_HOST = os.getenv('CONVERSION_HOST', '0.0.0.0')
+CONVERSION_PORT = int(os.getenv('CONVERSION_PORT', '8090'))
+CONVERTER_POOL_SIZE = int(os.getenv('CONVERTER_POOL_SIZE', '1'))
+CONVERTER_WARMUP_FORMATS = [f for f in os.getenv('CONVERTER_WARMUP_FORMATS', 'pdf,docx,pptx').split(',') if f]
+# Сколько запрос ждет свободный конвертер, сек
+CONVERSION_QUEUE_TIMEOUT = int(os.getenv('CONVERSION_QUEUE_TIMEOUT', '600'))
+DEFAULT_OUTPUT_DIR = "/shared/processed"
+# Конвертируются только файлы из этих каталогов
+ALLOWED_ROOTS = ('/documents', '/shared')
+
+
+def summarize(timings):
+    """count, median, p95 (сек) по списку времен"""
+    if not timings:
+        return {'count': 0, 'median_seconds': None, 'p95_seconds': None}
+    ordered = sorted(timings)
+    return {
+        'count': len(ordered),
+        'median_seconds': round(statistics.median(ordered), 2),
+        'p95_seconds': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    }
+
+
+class ConverterPool:
+    """Пул прогретых конвертеров; каждый используется одним запросом за раз"""
+
+    def __init__(self, size=CONVERTER_POOL_SIZE):
+        self.size = size
+        self.ready = False
+        self.startup_seconds = None
+        self._pool = queue.Queue()
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._stats = {'conversions': 0, 'errors': 0, 'busy_seconds': 0.0}
+        # Холодная конвертация - первая для формата на данном конвертере (загрузка моделей)
+        self._cold = deque(maxlen=1000)
+        self._warm = deque(maxlen=1000)
+
+    def start(self):
+        """Создает конвертеры и загружает модели форматов прогрева"""
+        from process_documents import create_converter
+
+        started = time.perf_counter()
+        for i in range(self.size):
+            converter = create_converter()
+            warmed = self._warm_up(converter)
+            self._pool.put({'converter': converter, 'formats': warmed})
+            print(f"Конвертер {i + 1}/{self.size} готов (прогреты: {', '.join(sorted(warmed)) or 'нет'})")
+        self.startup_seconds = round(time.perf_counter() - started, 2)
+        self.ready = True
+        print(f"Пул конвертеров готов за {self.startup_seconds} сек")
+
+    @staticmethod
+    def _warm_up(converter):
+        """Загружает pipeline и модели форматов заранее; возвращает множество прогретых расширений"""
+        warmed = set()
+        if not hasattr(converter, 'initialize_pipeline'):
+            return warmed
+        from docling.datamodel.base_models import InputFormat
+
+        for fmt in CONVERTER_WARMUP_FORMATS:
+            try:
+                converter.initialize_pipeline(InputFormat(fmt))
+                warmed.add(f".{fmt}")
+            except Exception as e:
+                print(f"⚠️ Не удалось прогреть {fmt}: {e}")
+        return warmed
+
+    def convert(self, file_path, output_dir):
+        """Конвертирует документ на свободном конвертере"""
+        from process_documents import process_document
+
+        try:
+            slot = self._pool.get(timeout=CONVERSION_QUEUE_TIMEOUT)
+        except queue.Empty:
+            return {'success': False, 'error': f'Нет свободного конвертера {CONVERSION_QUEUE_TIMEOUT} сек'}
+
+        ext = Path(file_path).suffix.lower()
+        cold = ext not in slot['formats']
+        started = time.perf_counter()
+        try:
+            result = process_document(file_path, output_dir, converter=slot['converter'])
+        finally:
+            seconds = time.perf_counter() - started
+            slot['formats'].add(ext)
+            self._pool.put(slot)
+
+        with self._lock:
+            self._stats['conversions'] += 1
+            self._stats['busy_seconds'] += seconds
+            if not result['success']:
+                self._stats['errors'] += 1
+            (self._cold if cold else self._warm).append(seconds)
+
+        # Текст клиент читает из output_file
+        result.pop('text', None)
+        result.update(seconds=round(seconds, 2), cold=cold)
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            cold, warm = list(self._cold), list(self._warm)
+        busy = stats.pop('busy_seconds')
+        return {
+            **stats,
+            'ready': self.ready,
+            'pool_size': self.size,
+            'startup_seconds': self.startup_seconds,
+            'uptime_seconds': round(time.time() - self._started_at, 1),
+            'cold': summarize(cold),
+            'warm': summarize(warm),
+            # Документов в минуту при полностью занятом пуле
+            'docs_per_minute': round(stats['conversions'] / busy * 60 * self.size, 2) if busy else None,
+        }
+
+
+pool = ConverterPool()
+
+
+def is_allowed(path):
+    resolved = str(Path(path).resolve())
+    return any(resolved == root or resolved.startswith(root + '/') for root in ALLOWED_ROOTS)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200 if pool.ready else 503, {'status': 'ok' if pool.ready else 'warming_up'})
+        elif self.path == '/stats':
+            self._send_json(200, pool.get_stats())
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/convert':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'success': False, 'error': 'Некорректный JSON'})
+            return
+
+        file_path = data.get('path', '')
+        output_dir = data.get('output_dir', DEFAULT_OUTPUT_DIR)
+        if not is_allowed(file_path) or not is_allowed(output_dir):
+            self._send_json(400, {'success': False, 'error': 'Путь вне разрешенных каталогов'})
+            return
+        if not Path(file_path).is_file():
+            self._send_json(404, {'success': False, 'error': f'Файл не найден: {file_path}'})
+            return
+        if not pool.ready:
+            self._send_json(503, {'success': False, 'error': 'Конвертеры еще загружаются'})
+            return
+
+        result = pool.convert(file_path, output_dir)
+        self._send_json(200 if result['success'] else 422, result)
+
+    def log_message(self, format, *args):
+        print(f"[conversion] {self.address_string()} {format % args}")
+
+
+def serve():
+    server = ThreadingHTTPServer((CONVERSION_HOST, CONVERSION_PORT), ConversionHandler)
+    server.daemon_threads = True
+    # Модели грузятся в фоне, /health отвечает warming_up до готовности
+    threading.Thread(target=pool.start, daemon=True).start()
+    print(f"Сервис конвертации: http://{CONVERSION_HOST}:{CONVERSION_PORT}")
+    server.serve_forever()
+
+
+def bench(file_path, repeats=5, url=None):
+    """
+    Сравнение: новый процесс process_documents.py на каждый документ
+    против запросов к запущенному сервису (последовательно и параллельно)
+    """
+    from http_client import docling
+
+    url = url or f"http://localhost:{CONVERSION_PORT}"
+    file_path = str(Path(file_path).resolve())
+
+    def via_service():
+        started = time.perf_counter()
+        response = docling.post(f"{url}/convert", json={'path': file_path}, timeout=CONVERSION_QUEUE_TIMEOUT)
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    print(f"Документ: {file_path}")
+    started = time.perf_counter()
+    subprocess.run([sys.executable, str(Path(__file__).with_name('process_documents.py')), file_path],
+                   check=True, capture_output=True)
+    subprocess_seconds = time.perf_counter() - started
+
+    warm = [via_service() for _ in range(repeats)]
+
+    # Параллельно - по два запроса на конвертер
+    concurrent = max(2, CONVERTER_POOL_SIZE * 2)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=via_service) for _ in range(concurrent)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parallel_seconds = time.perf_counter() - started
+
+    print(f"  Подпроцесс (запуск Python, импорт, загрузка моделей): {subprocess_seconds:.2f} сек")
+    print(f"  Сервис, теплый конвертер: median {statistics.median(warm):.2f} сек, "
+          f"min {min(warm):.2f}, max {max(warm):.2f} ({repeats} повторов)")
+    print(f"  Сервис, {concurrent} параллельно: {parallel_seconds:.2f} сек, "
+          f"{concurrent / parallel_seconds * 60:.1f} документов/мин")
+    print(f"  Ускорение теплой конвертации: x{subprocess_seconds / statistics.median(warm):.1f}")
+
+    stats = docling.get(f"{url}/stats", timeout=10).json()
+    print(f"  Статистика сервиса: {json.dumps(stats, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        if len(sys.argv) < 3:
+            print("Использование: python conversion_server.py bench <файл> [повторов]")
+            sys.exit(1)
+        bench(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 5)
+    else:
+        serve()
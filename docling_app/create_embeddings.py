@@ -1,71 +1,31 @@
 #!/usr/bin/env python3
 """
 Скрипт для создания эмбеддингов из обработанных документов и загрузки в Qdrant
+
+Повторный запуск для измененного .md создает эмбеддинги только для новых и
+измененных чанков (манифест ingest_state.py), прерванная загрузка продолжается
+(журнал ingest_journal.py); --full - для всех чанков.
+
+Использование:
+    python create_embeddings.py [файл_или_папка] [--full]
 """
 
 import os
 import json
-import requests
-import hashlib
 from pathlib import Path
+from batch_ingest import ingest_chunks
+from chunking import split_text
 
 OLLAMA_URL = "http://ollama-docling:11434"
 QDRANT_URL = "http://qdrant-docling:6333"
 COLLECTION_NAME = "documents"
 
-def get_embedding(text: str, model: str = "nomic-embed-text"):
-    """Получает эмбеддинг текста через Ollama"""
-    try:
-        response = requests.post(
-            f"{OLLAMA_URL}/api/embeddings",
-            json={"model": model, "prompt": text},
-            timeout=60
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
-    except Exception as e:
-        print(f"Ошибка получения эмбеддинга: {e}")
-        return None
-
-def chunk_text(text: str, chunk_size: int = 350, overlap: int = 70):
-    """Разбивает текст на чанки с перекрытием (оптимизировано для формул)"""
-    # Уменьшенный размер для лучшего сохранения формул целиком
-    # Больший overlap для лучшего покрытия формул на границах чанков
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        if chunk:
-            chunks.append(chunk)
-    
-    return chunks
-
-def add_to_qdrant(doc_id: str, embedding: list, text: str, metadata: dict):
-    """Добавляет вектор в Qdrant"""
-    try:
-        response = requests.put(
-            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
-            json={
-                "points": [{
-                    "id": doc_id,
-                    "vector": embedding,
-                    "payload": {
-                        "text": text,
-                        **metadata
-                    }
-                }]
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        return True
-    except Exception as e:
-        print(f"Ошибка добавления в Qdrant: {e}")
-        return False
+def chunk_text(text: str):
+    """Разбивает текст на чанки (режим CHUNKING_MODE: окна с перекрытием или границы по содержимому)"""
+    return split_text(text)
 
-def process_file(file_path: str):
-    """Обрабатывает файл и создает эмбеддинги"""
+def process_file(file_path: str, incremental: bool = True):
+    """Обрабатывает файл и создает эмбеддинги (только для изменившихся чанков), возвращает статистику"""
     print(f"\n{'='*60}")
     print(f"Обработка: {file_path}")
     print(f"{'='*60}")
@@ -76,7 +36,7 @@ def process_file(file_path: str):
     
     if not content.strip():
         print("⚠️  Файл пустой, пропускаем")
-        return
+        return None
     
     # Разбиваем на чанки
     chunks = chunk_text(content)
@@ -84,33 +44,26 @@ def process_file(file_path: str):
     
     filename = Path(file_path).name
     
-    # Обрабатываем каждый чанк
-    for idx, chunk in enumerate(chunks):
-        # Создаем уникальный ID
-        chunk_id = hashlib.md5(f"{filename}_{idx}".encode()).hexdigest()
-        
-        # Получаем эмбеддинг
-        print(f"  [{idx+1}/{len(chunks)}] Создание эмбеддинга... ", end="")
-        embedding = get_embedding(chunk)
-        
-        if embedding:
-            # Добавляем в Qdrant
-            metadata = {
-                "filename": filename,
-                "chunk_index": idx,
-                "total_chunks": len(chunks)
-            }
-            
-            if add_to_qdrant(chunk_id, embedding, chunk, metadata):
-                print("✅")
-            else:
-                print("❌")
-        else:
-            print("❌")
+    # Эмбеддинги и загрузка в Qdrant пачками
+    def report(done, total):
+        print(f"  [{done}/{total}] эмбеддинги созданы")
+    
+    stats = ingest_chunks(
+        filename,
+        chunks,
+        ollama_url=OLLAMA_URL,
+        qdrant_url=QDRANT_URL,
+        collection=COLLECTION_NAME,
+        progress=report,
+        incremental=incremental
+    )
+    if stats["failed"]:
+        print(f"❌ Не загружено чанков: {stats['failed']}")
     
     print(f"✨ Обработка завершена!\n")
+    return stats
 
-def process_directory(input_dir: str):
+def process_directory(input_dir: str, incremental: bool = True):
     """Обрабатывает все markdown файлы в директории"""
     files = list(Path(input_dir).glob("*.md"))
     
@@ -121,14 +74,16 @@ def process_directory(input_dir: str):
     print(f"\n🚀 Найдено файлов для обработки: {len(files)}")
     
     for file_path in files:
-        process_file(str(file_path))
+        process_file(str(file_path), incremental)
 
 if __name__ == "__main__":
     import sys
     
-    input_path = sys.argv[1] if len(sys.argv) > 1 else "/shared/processed"
+    args = [arg for arg in sys.argv[1:] if arg != "--full"]
+    incremental = "--full" not in sys.argv
+    input_path = args[0] if args else "/shared/processed"
     
     if os.path.isfile(input_path):
-        process_file(input_path)
+        process_file(input_path, incremental)
     else:
-        process_directory(input_path)
+        process_directory(input_path, incremental)
@@ -3,36 +3,14 @@
 Скрипт для создания эмбеддингов с паузами между запросами
 """
 
-import os
-import json
-import requests
-import hashlib
 import time
 from pathlib import Path
+from batch_ingest import ingest_chunks
 
 OLLAMA_URL = "http://ollama-docling:11434"
 QDRANT_URL = "http://qdrant-docling:6333"
 COLLECTION_NAME = "documents"
 
-def get_embedding(text, model="nomic-embed-text", retries=3):
-    """Получает эмбеддинг с повторными попытками"""
-    for attempt in range(retries):
-        try:
-            response = requests.post(
-                f"{OLLAMA_URL}/api/embeddings",
-                json={"model": model, "prompt": text},
-                timeout=60
-            )
-            response.raise_for_status()
-            return response.json()["embedding"]
-        except Exception as e:
-            if attempt < retries - 1:
-                print(f"    ⏳ Попытка {attempt + 2}/{retries} через 3 сек...")
-                time.sleep(3)
-            else:
-                print(f"    ❌ Ошибка после {retries} попыток")
-                return None
-
 def get_optimal_chunk_size(text):
     """Определяет оптимальный размер чанка в зависимости от размера документа"""
     word_count = len(text.split())
@@ -64,30 +42,8 @@ def chunk_text(text, chunk_size=None, overlap=None):
             chunks.append(chunk)
     return chunks
 
-def add_to_qdrant(chunk_id, embedding, text, metadata):
-    """Добавляет вектор в Qdrant"""
-    try:
-        response = requests.put(
-            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
-            json={
-                "points": [{
-                    "id": chunk_id,
-                    "vector": embedding,
-                    "payload": {
-                        "text": text,
-                        **metadata
-                    }
-                }]
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        return True
-    except Exception as e:
-        return False
-
 def process_file(file_path):
-    """Обрабатывает файл и создает эмбеддинги"""
+    """Обрабатывает файл и создает эмбеддинги (по одному чанку с паузами)"""
     print(f"\n{'='*60}")
     print(f"Обработка: {file_path}")
     print(f"{'='*60}")
@@ -102,34 +58,19 @@ def process_file(file_path):
     chunks = chunk_text(content)
     print(f"📄 Создано чанков: {len(chunks)}\n")
     
-    filename = Path(file_path).name
-    success_count = 0
-    
-    for idx, chunk in enumerate(chunks):
-        chunk_id = hashlib.md5(f"{filename}_{idx}".encode()).hexdigest()
-        
-        print(f"  [{idx+1}/{len(chunks)}] Чанк {idx+1}...", end=" ")
-        
-        embedding = get_embedding(chunk)
-        
-        if embedding:
-            metadata = {
-                "filename": filename,
-                "chunk_index": idx,
-                "total_chunks": len(chunks)
-            }
-            
-            if add_to_qdrant(chunk_id, embedding, chunk, metadata):
-                print("✅")
-                success_count += 1
-            else:
-                print("❌ Qdrant")
-        
+    def progress(done, total):
+        print(f"  [{done}/{total}] ✅")
         # Пауза между чанками
-        if idx < len(chunks) - 1:
+        if done < total:
             time.sleep(1)
     
-    print(f"\n✨ Обработка завершена! Успешно: {success_count}/{len(chunks)}\n")
+    # Через ingest_chunks: новая версия документа включается целиком, а точки прежней
+    # (в том числе с другим размером чанка) удаляются
+    stats = ingest_chunks(Path(file_path).name, chunks, ollama_url=OLLAMA_URL, qdrant_url=QDRANT_URL,
+                          collection=COLLECTION_NAME, embed_batch_size=1, progress=progress)
+    
+    print(f"\n✨ Обработка завершена! Успешно: {stats['upserted'] + stats['unchanged'] + stats['resumed']}/{len(chunks)}, "
+          f"удалено старых точек: {stats['deleted']}\n")
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Общий HTTP-клиент для внешних сервисов (Ollama, Qdrant, Polza.ai, OpenRouter, Telegram)
+
+На каждый сервис - своя requests.Session с пулом keep-alive соединений,
+поэтому TCP/TLS handshake делается один раз на соединение, а не на каждый
+запрос. Размер пула ограничен (HTTP_POOL_SIZE на процесс / gunicorn worker),
+при исчерпании запрос ждет свободное соединение.
+
+Идемпотентные запросы (GET/PUT/DELETE и POST, помеченные idempotent=True -
+поиск, scroll, эмбеддинги) повторяются с экспоненциальной задержкой при
+ошибке соединения, таймауте и ответах 429/502/503/504. Генерация ответа LLM
+не повторяется. timeout запроса - общий срок вместе с повторами и паузами:
+каждая попытка получает остаток срока, повтор без запаса времени не делается.
+
+Использование:
+    from http_client import qdrant, ollama, polza
+
+    response = qdrant.post(f"{QDRANT_URL}/collections/documents/points/search",
+                           json=params, timeout=30, idempotent=True)
+"""
+
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.3'))
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+RETRY_STATUSES = {429, 502, 503, 504}
+# Минимальный таймаут попытки: 0 requests не принимает, а aiohttp считает "без таймаута"
+MIN_ATTEMPT_TIMEOUT = 0.05
+
+
+def attempt_timeout(timeout, deadline):
+    """Таймаут попытки: не больше остатка общего срока (timeout - число или (connect, read))"""
+    remaining = max(deadline - time.monotonic(), MIN_ATTEMPT_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return tuple(min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+
+def can_retry(attempt, attempts, deadline, delay):
+    """Есть ли еще попытка и останется ли после паузы delay время до срока"""
+    return attempt < attempts - 1 and (deadline is None or time.monotonic() + delay < deadline)
+
+
+class UpstreamClient:
+    """Пул соединений к одному сервису с повторами и счетчиками задержек"""
+
+    def __init__(self, name, pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES,
+                 backoff=HTTP_RETRY_BACKOFF):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        # Повторы делаем сами (только для идемпотентных запросов), у адаптера их нет
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=0, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'errors': 0, 'retries': 0,
+                       'total_seconds': 0.0, 'max_seconds': 0.0}
+
+    def _record(self, seconds, error=False, retry=False):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['total_seconds'] += seconds
+            self._stats['max_seconds'] = max(self._stats['max_seconds'], seconds)
+            if error:
+                self._stats['errors'] += 1
+            if retry:
+                self._stats['retries'] += 1
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """
+        Выполняет запрос через пул сервиса
+
+        Args:
+            idempotent: можно ли повторять запрос (по умолчанию - по HTTP-методу)
+            kwargs: как у requests.request (json, params, timeout, stream, ...);
+                timeout - общий срок всех попыток (для (connect, read) - их сумма)
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = self.retries + 1 if idempotent else 1
+
+        timeout = kwargs.get('timeout')
+        if isinstance(timeout, tuple):
+            budget = None if None in timeout else sum(timeout)
+        else:
+            budget = timeout
+        deadline = time.monotonic() + budget if budget is not None else None
+
+        for attempt in range(attempts):
+            delay = self.backoff * (2 ** attempt)
+            if deadline is not None:
+                kwargs['timeout'] = attempt_timeout(timeout, deadline)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                last_attempt = not can_retry(attempt, attempts, deadline, delay)
+                self._record(time.perf_counter() - started, error=True, retry=not last_attempt)
+                if last_attempt:
+                    raise
+            else:
+                retryable = response.status_code in RETRY_STATUSES
+                last_attempt = not can_retry(attempt, attempts, deadline, delay)
+                self._record(time.perf_counter() - started, error=response.status_code >= 500,
+                             retry=retryable and not last_attempt)
+                if not retryable or last_attempt:
+                    return response
+                response.close()
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def get_stats(self):
+        """Счетчики запросов к сервису в текущем процессе"""
+        with self._lock:
+            stats = dict(self._stats)
+        count = stats['requests']
+        stats['avg_ms'] = round(stats['total_seconds'] / count * 1000, 1) if count else 0.0
+        stats['max_ms'] = round(stats.pop('max_seconds') * 1000, 1)
+        stats['total_seconds'] = round(stats['total_seconds'], 3)
+        return stats
+
+
+ollama = UpstreamClient('ollama')
+qdrant = UpstreamClient('qdrant')
+polza = UpstreamClient('polza')
+openrouter = UpstreamClient('openrouter')
+telegram = UpstreamClient('telegram')
+docling = UpstreamClient('docling')
+
+UPSTREAMS = {client.name: client for client in (ollama, qdrant, polza, openrouter, telegram, docling)}
+
+
+def get_upstream_stats():
+    """Счетчики по всем сервисам: число запросов, ошибки, повторы, задержки"""
+    return {name: client.get_stats() for name, client in UPSTREAMS.items()}
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Журнал загрузки документов (write-ahead): состояние каждого чанка текущей загрузки
+
+Перед загрузкой ingest_chunks записывает в журнал все чанки новой версии документа
+(pending), вектор - сразу после получения эмбеддинга (embedded), затем отмечает
+загрузку точки в Qdrant (upserted). Если процесс упал или Ollama/Qdrant отвалились,
+следующая загрузка того же текста продолжает ту же версию: загруженные точки не
+трогает, сохраненные векторы не пересчитывает. После включения версии (activated)
+и сохранения манифеста запись журнала удаляется.
+
+Прогресс загрузок берется из журнала и манифеста, без scroll'а коллекции Qdrant.
+
+Использование:
+    python ingest_journal.py status [файл]   # незавершенные загрузки / чанки загрузки
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from array import array
+from pathlib import Path
+import ingest_state
+
+INGEST_JOURNAL_PATH = os.getenv('INGEST_JOURNAL_PATH', '/shared/db/ingest_journal.db')
+_schema_ready = False
+
+PENDING = 'pending'
+EMBEDDED = 'embedded'
+UPSERTED = 'upserted'
+
+
+def _pack(vector):
+    return array('f', vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def get_connection():
+    """Создает подключение к журналу"""
+    global _schema_ready
+    Path(INGEST_JOURNAL_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(INGEST_JOURNAL_PATH, timeout=10)
+    if _schema_ready:
+        return conn
+    conn.execute('PRAGMA journal_mode=WAL')
+    # status: running - версия загружается, activated - включена, манифест еще не сохранен
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal_runs (
+            filename TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            previous_version TEXT,
+            total_chunks INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal_chunks (
+            filename TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            point_id TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            state TEXT NOT NULL,
+            vector BLOB,
+            PRIMARY KEY (filename, chunk_index)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+    _schema_ready = True
+    return conn
+
+
+def begin(filename, version, previous_version, entries):
+    """
+    Начинает загрузку новой версии документа (заменяет прежнюю запись журнала)
+
+    Args:
+        entries: список (chunk_index, point_id, text_hash, state, vector или None)
+    """
+    now = time.time()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM journal_chunks WHERE filename = ?', (filename,))
+    cursor.execute(
+        'INSERT OR REPLACE INTO journal_runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (filename, version, previous_version, len(entries), 'running', now, now)
+    )
+    cursor.executemany(
+        'INSERT INTO journal_chunks VALUES (?, ?, ?, ?, ?, ?)',
+        [(filename, idx, point_id, hash_, state, _pack(vector) if vector is not None else None)
+         for idx, point_id, hash_, state, vector in entries]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_run(filename):
+    """
+    Незавершенная загрузка документа
+
+    Returns:
+        dict: version, previous_version, total_chunks, status и
+        chunks - {chunk_index: (point_id, text_hash, state, vector или None)};
+        None, если незавершенной загрузки нет
+    """
+    conn = get_connection()
+    run = conn.execute(
+        'SELECT version, previous_version, total_chunks, status FROM journal_runs WHERE filename = ?',
+        (filename,)
+    ).fetchone()
+    if run is None:
+        conn.close()
+        return None
+    rows = conn.execute(
+        'SELECT chunk_index, point_id, text_hash, state, vector FROM journal_chunks WHERE filename = ?',
+        (filename,)
+    ).fetchall()
+    conn.close()
+    return {
+        "version": run[0],
+        "previous_version": run[1],
+        "total_chunks": run[2],
+        "status": run[3],
+        "chunks": {idx: (point_id, hash_, state, _unpack(blob) if blob is not None else None)
+                   for idx, point_id, hash_, state, blob in rows},
+    }
+
+
+def _update(filename, query, params):
+    conn = get_connection()
+    conn.executemany(query, params)
+    conn.execute('UPDATE journal_runs SET updated_at = ? WHERE filename = ?', (time.time(), filename))
+    conn.commit()
+    conn.close()
+
+
+def mark_embedded(filename, vectors):
+    """Сохраняет векторы чанков до загрузки в Qdrant: {chunk_index: vector}"""
+    _update(filename, 'UPDATE journal_chunks SET state = ?, vector = ? WHERE filename = ? AND chunk_index = ?',
+            [(EMBEDDED, _pack(vector), filename, idx) for idx, vector in vectors.items()])
+
+
+def mark_upserted(filename, indices):
+    """Отмечает чанки, точки которых загружены в Qdrant"""
+    _update(filename, 'UPDATE journal_chunks SET state = ? WHERE filename = ? AND chunk_index = ?',
+            [(UPSERTED, filename, idx) for idx in indices])
+
+
+def mark_activated(filename):
+    """Версия включена: осталось сохранить манифест"""
+    conn = get_connection()
+    conn.execute("UPDATE journal_runs SET status = 'activated', updated_at = ? WHERE filename = ?",
+                 (time.time(), filename))
+    conn.commit()
+    conn.close()
+
+
+def finish(filename):
+    """Удаляет запись журнала (загрузка завершена или отменена)"""
+    conn = get_connection()
+    conn.execute('DELETE FROM journal_chunks WHERE filename = ?', (filename,))
+    conn.execute('DELETE FROM journal_runs WHERE filename = ?', (filename,))
+    conn.commit()
+    conn.close()
+
+
+def list_runs():
+    """Незавершенные загрузки: filename, status, total_chunks, {state: число чанков}, updated_at"""
+    conn = get_connection()
+    runs = conn.execute(
+        'SELECT filename, status, total_chunks, updated_at FROM journal_runs ORDER BY updated_at DESC'
+    ).fetchall()
+    counts = {}
+    for filename, state, count in conn.execute(
+            'SELECT filename, state, COUNT(*) FROM journal_chunks GROUP BY filename, state'):
+        counts.setdefault(filename, {})[state] = count
+    conn.close()
+    return [(filename, status, total, counts.get(filename, {}), updated_at)
+            for filename, status, total, updated_at in runs]
+
+
+def document_progress(filename):
+    """
+    Прогресс загрузки документа по журналу и манифесту (без запросов к Qdrant)
+
+    Returns:
+        dict: status (running/activated - загрузка не завершена, done - по манифесту),
+        total_chunks, stored - чанков в Qdrant, counts - {состояние: число чанков};
+        None, если документ не загружался
+    """
+    run = get_run(filename)
+    if run is not None:
+        counts = {}
+        for _, _, state, _ in run["chunks"].values():
+            counts[state] = counts.get(state, 0) + 1
+        return {"status": run["status"], "total_chunks": run["total_chunks"],
+                "stored": counts.get(UPSERTED, 0), "counts": counts}
+    total, manifest = ingest_state.get_manifest(filename)
+    if total is None:
+        return None
+    return {"status": "done", "total_chunks": total, "stored": len(manifest), "counts": {UPSERTED: len(manifest)}}
+
+
+def processed_documents():
+    """
+    Все загруженные и загружаемые документы (без scroll'а Qdrant)
+
+    Returns:
+        dict: filename -> {chunks, total_chunks, last_chunk_index, status, updated_at}
+    """
+    documents = {}
+    for filename, total, in_manifest, updated_at in ingest_state.list_documents():
+        _, manifest = ingest_state.get_manifest(filename)
+        documents[filename] = {"chunks": in_manifest, "total_chunks": total,
+                               "last_chunk_index": max(manifest, default=0),
+                               "status": "done", "updated_at": updated_at}
+    for filename, status, total, counts, updated_at in list_runs():
+        run = get_run(filename)
+        upserted = [idx for idx, chunk in run["chunks"].items() if chunk[2] == UPSERTED]
+        documents[filename] = {"chunks": counts.get(UPSERTED, 0), "total_chunks": total,
+                               "last_chunk_index": max(upserted, default=0),
+                               "status": status, "updated_at": updated_at}
+    return documents
+
+
+def stored_chunks(filename, point_ids, hashes):
+    """Номера чанков, точки которых уже есть в Qdrant (по манифесту и журналу незавершенной загрузки)"""
+    _, manifest = ingest_state.get_manifest(filename)
+    run = get_run(filename)
+    stored = set()
+    for idx, (point_id, hash_) in enumerate(zip(point_ids, hashes)):
+        if manifest.get(idx) == (point_id, hash_):
+            stored.add(idx)
+        elif run and run["chunks"].get(idx, (None, None, None))[:3] == (point_id, hash_, UPSERTED):
+            stored.add(idx)
+    return stored
+
+
+def format_progress(total, counts):
+    """Строка прогресса загрузки: загружено/всего и число чанков в каждом состоянии"""
+    return (f"загружено {counts.get(UPSERTED, 0)}/{total}, с вектором {counts.get(EMBEDDED, 0)}, "
+            f"ожидают {counts.get(PENDING, 0)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "status":
+        print("Использование: python ingest_journal.py status [файл]")
+        sys.exit(1)
+
+    if len(sys.argv) > 2:
+        run = get_run(sys.argv[2])
+        if run is None:
+            print(f"Незавершенной загрузки {sys.argv[2]} нет")
+            sys.exit(0)
+        print(f"Версия {run['version']} ({run['status']}), чанков {run['total_chunks']}")
+        for idx in sorted(run["chunks"]):
+            point_id, hash_, state, _ = run["chunks"][idx]
+            print(f"{idx:>5}  {point_id}  {hash_[:12]}  {state}")
+    else:
+        runs = list_runs()
+        for filename, status, total, counts, updated_at in runs:
+            updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(updated_at))
+            print(f"{filename} [{status}]: {format_progress(total, counts)}, обновлено {updated}")
+        print(f"Незавершенных загрузок: {len(runs)}")
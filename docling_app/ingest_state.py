@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Манифест загруженных документов: для каждого чанка - ID точки в Qdrant и хэш текста
+
+По манифесту ingest_chunks при повторной загрузке документа создает эмбеддинги
+только для новых и измененных чанков, а лишние точки удаляет. Здесь же хранится
+активная версия каждого документа (doc_version в payload точек). SQLite рядом
+с остальными базами (/shared/db).
+
+Использование:
+    python ingest_state.py show [файл]    # документы в манифесте / чанки документа
+    python ingest_state.py history [файл] # загрузки: доля сохранившихся чанков, эмбеддинги
+    python ingest_state.py forget <файл>  # следующая загрузка файла будет полной
+"""
+
+import os
+import sys
+import time
+import fcntl
+import sqlite3
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+INGEST_STATE_PATH = os.getenv('INGEST_STATE_PATH', '/shared/db/ingest_state.db')
+_schema_ready = False
+
+
+def text_hash(text):
+    """Хэш текста чанка"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get_connection():
+    """Создает подключение к манифесту"""
+    global _schema_ready
+    Path(INGEST_STATE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(INGEST_STATE_PATH, timeout=10)
+    if _schema_ready:
+        return conn
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_manifest (
+            filename TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            point_id TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            PRIMARY KEY (filename, chunk_index)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            filename TEXT PRIMARY KEY,
+            total_chunks INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    # История загрузок: сколько чанков пережило правку документа
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            survived REAL,
+            unchanged INTEGER NOT NULL,
+            reused INTEGER NOT NULL,
+            embedded INTEGER NOT NULL,
+            deleted INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            elapsed_seconds REAL NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_filename ON ingest_runs(filename, created_at)')
+    # Активная версия документа: поиск видит только точки с этим doc_version
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS document_versions (
+            filename TEXT PRIMARY KEY,
+            active_version TEXT NOT NULL,
+            previous_version TEXT,
+            activated_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+    _schema_ready = True
+    return conn
+
+
+def get_manifest(filename):
+    """
+    Чанки документа из манифеста
+
+    Returns:
+        tuple: (total_chunks, {chunk_index: (point_id, text_hash)});
+        (None, {}), если документ еще не загружался
+    """
+    conn = get_connection()
+    document = conn.execute('SELECT total_chunks FROM documents WHERE filename = ?', (filename,)).fetchone()
+    rows = conn.execute(
+        'SELECT chunk_index, point_id, text_hash FROM chunk_manifest WHERE filename = ?',
+        (filename,)
+    ).fetchall()
+    conn.close()
+    return (document[0] if document else None), {idx: (point_id, hash_) for idx, point_id, hash_ in rows}
+
+
+def save_manifest(filename, entries, total_chunks):
+    """
+    Заменяет манифест документа
+
+    Args:
+        entries: список (chunk_index, point_id, text_hash) - только чанки, которые есть в Qdrant
+        total_chunks: число чанков документа
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM chunk_manifest WHERE filename = ?', (filename,))
+    cursor.executemany(
+        'INSERT INTO chunk_manifest (filename, chunk_index, point_id, text_hash) VALUES (?, ?, ?, ?)',
+        [(filename, idx, point_id, hash_) for idx, point_id, hash_ in entries]
+    )
+    cursor.execute(
+        'INSERT OR REPLACE INTO documents (filename, total_chunks, updated_at) VALUES (?, ?, ?)',
+        (filename, total_chunks, time.time())
+    )
+    conn.commit()
+    conn.close()
+
+
+def remove_document(filename):
+    """Удаляет документ из манифеста (активная версия остается - точки документа видны поиску)"""
+    conn = get_connection()
+    conn.execute('DELETE FROM chunk_manifest WHERE filename = ?', (filename,))
+    conn.execute('DELETE FROM documents WHERE filename = ?', (filename,))
+    conn.commit()
+    conn.close()
+
+
+def get_active_version(filename):
+    """Активная версия документа (None, если документ загружен до версионирования или не загружался)"""
+    conn = get_connection()
+    row = conn.execute('SELECT active_version FROM document_versions WHERE filename = ?', (filename,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def get_active_versions():
+    """Активные версии всех документов: {filename: version}"""
+    conn = get_connection()
+    rows = conn.execute('SELECT filename, active_version FROM document_versions').fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def active_version_filter(search_filter=None, versions=None):
+    """
+    Фильтр Qdrant с условием "только активные версии документов"
+
+    Точки без doc_version (загружены до версионирования) проходят всегда.
+
+    Args:
+        versions: активные версии (по умолчанию - все из базы)
+    """
+    if versions is None:
+        versions = sorted(get_active_versions().values())
+    condition = {"should": [{"is_empty": {"key": "doc_version"}}]}
+    if versions:
+        condition["should"].append({"key": "doc_version", "match": {"any": list(versions)}})
+    search_filter = dict(search_filter or {})
+    search_filter["must"] = list(search_filter.get("must", [])) + [condition]
+    return search_filter
+
+
+@contextmanager
+def document_lock(filename):
+    """
+    Межпроцессная блокировка загрузки документа (воркеры очереди, webapp, скрипты docling)
+
+    Пока документ загружается, вторая загрузка того же файла ждет: иначе обе начнут
+    свою версию в журнале и одна удалит точки другой.
+    """
+    lock_dir = Path(INGEST_STATE_PATH).parent / 'ingest_locks'
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with open(lock_dir / f'{text_hash(filename)}.lock', 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"⏳ {filename}: ждем завершения другой загрузки этого документа")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def activate_version(filename, version):
+    """Делает версию документа активной (одна транзакция - поиск видит либо старую, либо новую)"""
+    conn = get_connection()
+    conn.execute(
+        '''INSERT INTO document_versions (filename, active_version, previous_version, activated_at)
+           VALUES (?, ?, NULL, ?)
+           ON CONFLICT(filename) DO UPDATE SET previous_version = active_version,
+               active_version = excluded.active_version, activated_at = excluded.activated_at''',
+        (filename, version, time.time())
+    )
+    conn.commit()
+    conn.close()
+
+
+def record_run(filename, mode, stats):
+    """Записывает итог загрузки документа (статистика ingest_chunks)"""
+    conn = get_connection()
+    conn.execute(
+        '''INSERT INTO ingest_runs (filename, mode, total_chunks, survived, unchanged, reused, embedded,
+                                   deleted, failed, elapsed_seconds, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (filename, mode, stats["chunks"], stats["survived"], stats["unchanged"], stats["reused"],
+         stats["embedded"], stats["deleted"], stats["failed"], stats["elapsed_seconds"], time.time())
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_history(filename=None, limit=20):
+    """Последние загрузки (всех документов или одного), новые первыми"""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    query = 'SELECT * FROM ingest_runs'
+    params = ()
+    if filename:
+        query += ' WHERE filename = ?'
+        params = (filename,)
+    rows = conn.execute(query + ' ORDER BY created_at DESC LIMIT ?', params + (limit,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def list_documents():
+    """Документы манифеста: filename, total_chunks, число чанков в манифесте, updated_at"""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT d.filename, d.total_chunks, COUNT(m.chunk_index), d.updated_at
+        FROM documents d LEFT JOIN chunk_manifest m ON m.filename = d.filename
+        GROUP BY d.filename ORDER BY d.filename
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("show", "history", "forget"):
+        print("Использование: python ingest_state.py show [файл] | history [файл] | forget <файл>")
+        sys.exit(1)
+
+    if sys.argv[1] == "forget":
+        if len(sys.argv) < 3:
+            print("Укажите файл")
+            sys.exit(1)
+        remove_document(sys.argv[2])
+        print(f"✅ {sys.argv[2]} удален из манифеста")
+    elif sys.argv[1] == "history":
+        for run in get_history(sys.argv[2] if len(sys.argv) > 2 else None):
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created_at']))
+            survived = '-' if run['survived'] is None else f"{run['survived']:.0%}"
+            print(f"{created} {run['filename']} [{run['mode']}]: чанков {run['total_chunks']}, "
+                  f"сохранилось {survived}, эмбеддингов {run['embedded']}, удалено {run['deleted']}, "
+                  f"ошибок {run['failed']}, {run['elapsed_seconds']} сек")
+    elif len(sys.argv) > 2:
+        _, manifest = get_manifest(sys.argv[2])
+        for idx in sorted(manifest):
+            point_id, hash_ = manifest[idx]
+            print(f"{idx:>5}  {point_id}  {hash_[:12]}")
+        print(f"Чанков в манифесте: {len(manifest)}")
+    else:
+        versions = get_active_versions()
+        for filename, total, in_manifest, updated_at in list_documents():
+            updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(updated_at))
+            print(f"{filename}: {in_manifest}/{total} чанков, обновлен {updated}, "
+                  f"версия {versions.get(filename, '-')}")
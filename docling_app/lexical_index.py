@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Локальный инвертированный индекс (BM25) по чанкам документов
+
+Строится при загрузке документов и обновляется по одному документу.
+Хранится в SQLite рядом с основной БД, поэтому поиск по ключевым словам
+не требует scroll'а всей коллекции Qdrant.
+
+Использование:
+    python lexical_index.py rebuild          # пересобрать индекс из Qdrant
+    python lexical_index.py search <запрос>  # проверить поиск
+"""
+
+import os
+import re
+import math
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+LEXICAL_INDEX_PATH = os.getenv('LEXICAL_INDEX_PATH', '/shared/db/lexical_index.db')
+_schema_ready = False
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r'[а-яa-z0-9]+')
+
+# Окончания для упрощенного стемминга русских слов (от длинных к коротким)
+RU_SUFFIXES = sorted({
+    'иями', 'ями', 'ами', 'ией', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ость', 'ости', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'ых', 'их', 'ию',
+    'ия', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+}, key=len, reverse=True)
+MIN_STEM_LENGTH = 4
+
+
+def stem(token):
+    """Упрощенный стемминг: отрезает окончание, если остается основа >= 4 символов"""
+    if len(token) <= MIN_STEM_LENGTH or not ('а' <= token[0] <= 'я'):
+        return token
+    for suffix in RU_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """Нормализует текст в список термов: регистр, ё/е, стемминг"""
+    text = text.lower().replace('ё', 'е')
+    return [stem(t) for t in TOKEN_RE.findall(text)]
+
+
+def get_connection():
+    """Создает подключение к индексу"""
+    global _schema_ready
+    Path(LEXICAL_INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(LEXICAL_INDEX_PATH, timeout=10)
+    if _schema_ready:
+        return conn
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chunks (
+            point_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            point_id TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (term, point_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks(filename)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_postings_point ON postings(point_id)')
+    conn.commit()
+    _schema_ready = True
+    return conn
+
+
+def _delete_document(cursor, filename):
+    cursor.execute(
+        'DELETE FROM postings WHERE point_id IN (SELECT point_id FROM chunks WHERE filename = ?)',
+        (filename,)
+    )
+    cursor.execute('DELETE FROM chunks WHERE filename = ?', (filename,))
+
+
+def _update_meta(cursor):
+    """Пересчитывает N и среднюю длину чанка для BM25"""
+    count, avg_length = cursor.execute('SELECT COUNT(*), AVG(length) FROM chunks').fetchone()
+    cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('chunk_count', count or 0))
+    cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('avg_length', avg_length or 0))
+
+
+def index_document(filename, chunks, point_ids, chunk_indices=None):
+    """
+    Индексирует (или переиндексирует) все чанки документа
+
+    Args:
+        filename: имя файла
+        chunks: список текстов чанков
+        point_ids: ID точек в Qdrant в том же порядке
+        chunk_indices: номера чанков (по умолчанию 0..N-1)
+    """
+    if chunk_indices is None:
+        chunk_indices = range(len(chunks))
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    _delete_document(cursor, filename)
+
+    for idx, text, point_id in zip(chunk_indices, chunks, point_ids):
+        terms = tokenize(text)
+        cursor.execute(
+            'INSERT OR REPLACE INTO chunks (point_id, filename, chunk_index, length) VALUES (?, ?, ?, ?)',
+            (point_id, filename, idx, len(terms))
+        )
+        cursor.executemany(
+            'INSERT OR REPLACE INTO postings (term, point_id, tf) VALUES (?, ?, ?)',
+            [(term, point_id, tf) for term, tf in Counter(terms).items()]
+        )
+
+    _update_meta(cursor)
+    conn.commit()
+    conn.close()
+
+
+def remove_document(filename):
+    """Удаляет документ из индекса"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    _delete_document(cursor, filename)
+    _update_meta(cursor)
+    conn.commit()
+    conn.close()
+
+
+def search(query, limit=20):
+    """
+    BM25-поиск по индексу
+
+    Args:
+        limit: сколько лучших чанков вернуть (None - все, где есть хотя бы одно слово запроса)
+
+    Returns:
+        list: словари с ключами point_id, filename, chunk_index, score
+              (по убыванию score)
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    conn = get_connection()
+    meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+    n_chunks = meta.get('chunk_count', 0)
+    avg_length = meta.get('avg_length', 0) or 1
+
+    scores = Counter()
+    locations = {}
+    for term in terms:
+        rows = conn.execute('''
+            SELECT p.point_id, p.tf, c.length, c.filename, c.chunk_index
+            FROM postings p JOIN chunks c ON c.point_id = p.point_id
+            WHERE p.term = ?
+        ''', (term,)).fetchall()
+        if not rows:
+            continue
+        idf = math.log(1 + (n_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+        for point_id, tf, length, filename, chunk_index in rows:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[point_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            locations[point_id] = (filename, chunk_index)
+    conn.close()
+
+    return [{
+        "point_id": point_id,
+        "filename": locations[point_id][0],
+        "chunk_index": locations[point_id][1],
+        "score": score
+    } for point_id, score in scores.most_common(limit)]
+
+
+def is_empty():
+    """True, если индекс еще не построен"""
+    conn = get_connection()
+    row = conn.execute('SELECT 1 FROM chunks LIMIT 1').fetchone()
+    conn.close()
+    return row is None
+
+
+def rebuild_from_qdrant(qdrant_url, collection="documents"):
+    """Пересобирает индекс по всем точкам коллекции (для уже загруженных документов)"""
+    from http_client import qdrant
+    from ingest_state import active_version_filter
+
+    # Точки невключенных версий (загрузка идет или прервалась) в индекс не попадают
+    search_filter = active_version_filter()
+    by_file = {}
+    offset = None
+    while True:
+        scroll_params = {"limit": 256, "with_payload": ["filename", "chunk_index", "text"], "with_vector": False,
+                         "filter": search_filter}
+        if offset:
+            scroll_params["offset"] = offset
+        response = qdrant.post(
+            f"{qdrant_url}/collections/{collection}/points/scroll",
+            json=scroll_params,
+            timeout=60,
+            idempotent=True
+        )
+        response.raise_for_status()
+        result = response.json()["result"]
+        for point in result["points"]:
+            payload = point["payload"]
+            by_file.setdefault(payload["filename"], []).append(
+                (payload["chunk_index"], point["id"], payload["text"])
+            )
+        offset = result.get("next_page_offset")
+        if not offset:
+            break
+
+    for filename, items in by_file.items():
+        items.sort()
+        index_document(
+            filename,
+            [text for _, _, text in items],
+            [point_id for _, point_id, _ in items],
+            [idx for idx, _, _ in items]
+        )
+        print(f"  ✅ {filename}: {len(items)} чанков")
+    print(f"✨ Индекс построен: {len(by_file)} документов")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("rebuild", "search"):
+        print("Использование: python lexical_index.py rebuild | search <запрос>")
+        sys.exit(1)
+
+    if sys.argv[1] == "rebuild":
+        rebuild_from_qdrant(os.getenv('QDRANT_URL', "http://qdrant-docling:6333"))
+    else:
+        started = time.time()
+        hits = search(" ".join(sys.argv[2:]), limit=10)
+        print(f"Найдено {len(hits)} за {(time.time() - started) * 1000:.2f} мс")
+        for hit in hits:
+            print(f"  {hit['score']:.3f}  {hit['filename']} (чанк {hit['chunk_index']})")
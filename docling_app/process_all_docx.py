@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 """
 Скрипт для автоматической обработки всех DOCX файлов:
-1. Конвертация в markdown
+1. Конвертация в markdown (параллельно, в пуле процессов)
 2. Создание векторов
+
+Использование:
+    python process_all_docx.py [процессов]
 """
 import os
 import sys
+import time
 from pathlib import Path
 
 # Добавляем текущую директорию в путь
 sys.path.insert(0, '/app')
 
-from process_documents import process_document
+from process_documents import convert_parallel, print_summary, CONVERSION_WORKERS
 from create_embeddings import process_file
 
 DOCUMENTS_DIR = "/documents"
@@ -39,21 +43,24 @@ def main():
     
     print(f"\n📄 Найдено файлов для обработки: {len(target_files)}\n")
     
-    for i, docx_file in enumerate(target_files, 1):
+    # Конвертация идет в пуле процессов, векторы создаются по мере готовности файлов (по порядку)
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else CONVERSION_WORKERS
+    started = time.perf_counter()
+    results = []
+    for i, (docx_file, result) in enumerate(convert_parallel(target_files, PROCESSED_DIR, workers), 1):
+        results.append((docx_file, result))
         print("="*70)
-        print(f"📄 [{i}/{len(target_files)}] Обработка: {docx_file.name}")
+        print(f"📄 [{i}/{len(target_files)}] Обработка: {Path(docx_file).name}")
         print("="*70)
         
         # Шаг 1: Конвертация DOCX -> Markdown
         print("\n1️⃣  Конвертация DOCX → Markdown...")
-        result = process_document(str(docx_file), PROCESSED_DIR)
-        
         if not result['success']:
             print(f"   ❌ Ошибка: {result.get('error', 'Unknown')}")
             continue
         
         md_file = result['output_file']
-        print(f"   ✅ Сохранено: {Path(md_file).name}")
+        print(f"   ✅ Сохранено: {Path(md_file).name} ({result['seconds']} сек)")
         
         # Шаг 2: Создание векторов
         print("\n2️⃣  Создание векторов (chunk_size=350, overlap=70)...")
@@ -66,6 +73,7 @@ def main():
         
         print()
     
+    print_summary(results, time.perf_counter() - started)
     print("="*70)
     print("✨ Обработка завершена!")
     print("="*70)
@@ -73,8 +81,8 @@ def main():
     # Проверяем количество векторов
     print("\n📊 Проверка результатов...")
     try:
-        import requests
-        response = requests.get("http://qdrant-docling:6333/collections/documents", timeout=5)
+        from http_client import qdrant
+        response = qdrant.get("http://qdrant-docling:6333/collections/documents", timeout=5)
         if response.status_code == 200:
             data = response.json()
             points = data['result']['points_count']
@@ -3,22 +3,48 @@
 Скрипт для обработки документов с помощью Docling и создания векторных эмбеддингов
 """
 
+import io
 import os
-import sys
+import time
+import argparse
+import contextlib
+import multiprocessing
 from pathlib import Path
 from docling.document_converter import DocumentConverter
 
-def process_document(file_path: str, output_dir: str = "/shared/processed"):
+SUPPORTED_FORMATS = ['.pdf', '.docx', '.pptx', '.html', '.md']
+# Каждый процесс держит свои модели Docling (~1-2 ГБ), поэтому не больше 4 по умолчанию
+CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Процесс пересоздается после стольких документов - память Docling не копится
+CONVERSION_MAX_TASKS_PER_CHILD = int(os.getenv('CONVERSION_MAX_TASKS_PER_CHILD', '20'))
+# Документ, не сконвертированный за это время (процесс завис или убит), считается ошибкой
+CONVERSION_TIMEOUT = int(os.getenv('CONVERSION_TIMEOUT', '600'))
+
+# Конвертер процесса: модели загружаются при первой конвертации и дальше переиспользуются
+_converter = None
+
+def create_converter():
+    """Новый конвертер (модели формата загружаются при его первой конвертации)"""
+    return DocumentConverter()
+
+def get_converter():
+    """Конвертер, общий для всех документов процесса"""
+    global _converter
+    if _converter is None:
+        _converter = create_converter()
+    return _converter
+
+def process_document(file_path: str, output_dir: str = "/shared/processed", converter=None):
     """
     Обрабатывает документ и извлекает текст
     
     Args:
         file_path: путь к документу
         output_dir: директория для сохранения результатов
+        converter: конвертер (по умолчанию - общий конвертер процесса)
     """
     try:
-        # Создаем конвертер
-        converter = DocumentConverter()
+        converter = converter or get_converter()
         
         # Конвертируем документ
         print(f"Обработка документа: {file_path}")
@@ -48,24 +74,105 @@ def process_document(file_path: str, output_dir: str = "/shared/processed"):
             "error": str(e)
         }
 
-def process_directory(input_dir: str, output_dir: str = "/shared/processed"):
+def _init_worker(threads):
+    """Инициализация процесса пула: ограничение потоков и загрузка конвертера"""
+    # Без ограничения каждый процесс запускает потоки torch на все ядра
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    get_converter()
+
+def _convert_in_worker(file_path, output_dir):
+    """Конвертация в процессе пула; вывод Docling не смешивается с прогрессом"""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = process_document(file_path, output_dir)
+    # Текст не передаем обратно в родительский процесс, он есть в output_file
+    result.pop("text", None)
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+def convert_parallel(files, output_dir: str = "/shared/processed", workers: int = CONVERSION_WORKERS,
+                     max_tasks_per_child: int = CONVERSION_MAX_TASKS_PER_CHILD):
+    """
+    Конвертирует документы в пуле процессов, у каждого процесса свой конвертер
+    
+    Yields:
+        (file_path, result) в порядке files; документ, процесс которого упал
+        (например, по нехватке памяти) или завис, возвращается с success=False
     """
-    Обрабатывает все документы в директории
+    # multiprocessing.Pool, а не ProcessPoolExecutor: с max_tasks_per_child он зависает
+    # при пересоздании процессов (CPython 3.11-3.13)
+    files = [str(f) for f in files]
+    workers = max(1, min(workers, len(files)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn: процессы не наследуют потоки родителя
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=(threads,),
+                      maxtasksperchild=max_tasks_per_child) as pool:
+        tasks = [pool.apply_async(_convert_in_worker, (f, output_dir)) for f in files]
+        for file_path, task in zip(files, tasks):
+            try:
+                # Упавший процесс пул заменяет, но его задача не завершится никогда
+                result = task.get(timeout=CONVERSION_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                result = {"success": False,
+                          "error": f"Нет результата за {CONVERSION_TIMEOUT} сек (процесс упал или завис)"}
+            except Exception as e:
+                result = {"success": False, "error": f"Процесс конвертации упал: {e}"}
+            yield file_path, result
+
+def print_summary(results, elapsed):
+    """Итог конвертации: число успешных, скорость и список ошибок"""
+    failed = [(f, r) for f, r in results if not r["success"]]
+    print("=" * 70)
+    print(f"Сконвертировано: {len(results) - len(failed)}/{len(results)} за {elapsed:.1f} сек "
+          f"({len(results) / elapsed * 60 if elapsed else 0:.1f} документов/мин)")
+    if failed:
+        print(f"Ошибки ({len(failed)}):")
+        for file_path, result in failed:
+            print(f"  ❌ {file_path}: {result.get('error', 'Unknown')}")
+
+def process_directory(input_dir: str, output_dir: str = "/shared/processed", workers: int = CONVERSION_WORKERS):
     """
-    supported_formats = ['.pdf', '.docx', '.pptx', '.html', '.md']
+    Обрабатывает все документы в директории (при workers > 1 - параллельно)
     
-    for file_path in Path(input_dir).rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in supported_formats:
-            process_document(str(file_path), output_dir)
+    Returns:
+        список (file_path, result) в порядке файлов
+    """
+    files = sorted(
+        f for f in Path(input_dir).rglob('*')
+        if f.is_file() and f.suffix.lower() in SUPPORTED_FORMATS
+    )
+    if not files:
+        print(f"Документы не найдены: {input_dir}")
+        return []
+
+    started = time.perf_counter()
+    if workers > 1:
+        print(f"Документов: {len(files)}, процессов: {min(workers, len(files))}")
+        results = []
+        for i, (file_path, result) in enumerate(convert_parallel(files, output_dir, workers), 1):
+            status = f"✅ {result['seconds']} сек" if result["success"] else "❌"
+            print(f"[{i}/{len(files)}] {status} {file_path}")
+            results.append((file_path, result))
+    else:
+        results = [(str(f), process_document(str(f), output_dir)) for f in files]
+
+    print_summary(results, time.perf_counter() - started)
+    return results
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Использование: python process_documents.py <путь_к_документу_или_папке>")
-        sys.exit(1)
-    
-    input_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Конвертация документов в markdown")
+    parser.add_argument("input_path", help="путь к документу или папке")
+    parser.add_argument("--workers", type=int, default=CONVERSION_WORKERS,
+                        help="процессов для папки (1 - последовательно)")
+    args = parser.parse_args()
     
-    if os.path.isdir(input_path):
-        process_directory(input_path)
+    if os.path.isdir(args.input_path):
+        process_directory(args.input_path, workers=args.workers)
     else:
-        process_document(input_path)
+        process_document(args.input_path)
@@ -5,7 +5,8 @@
 
 import sys
 import os
-import requests
+from http_client import ollama, openrouter, qdrant
+from boost_rules import get_engine as get_boost_engine
 
 OLLAMA_URL = "http://ollama-docling:11434"
 QDRANT_URL = "http://qdrant-docling:6333"
@@ -18,10 +19,11 @@ DEEPSEEK_MODEL = "deepseek/deepseek-chat"
 
 def get_embedding(text: str, model: str = "nomic-embed-text"):
     """Получает эмбеддинг текста"""
-    response = requests.post(
+    response = ollama.post(
         f"{OLLAMA_URL}/api/embeddings",
         json={"model": model, "prompt": text},
-        timeout=60
+        timeout=60,
+        idempotent=True
     )
     return response.json()["embedding"]
 
@@ -30,25 +32,12 @@ def search(query: str, limit: int = 5):
     print(f"\n🔍 Поиск: {query}\n")
     
     query_lower = query.lower()
+    rules = get_boost_engine()
     
     # Проверяем упоминание документа
-    doc_filters = {
-        'справочник': 'Справочник Мудрого Руководителя',
-        'золотой стандарт': 'Золотой Стандарт Аудита',
-        'директор': 'Директор'
-    }
-    
-    search_filter = None
-    for keyword, doc_pattern in doc_filters.items():
-        if keyword in query_lower:
-            search_filter = {
-                "must": [{
-                    "key": "filename",
-                    "match": {"text": doc_pattern}
-                }]
-            }
-            print(f"🎯 Фильтр по документу: {doc_pattern}")
-            break
+    search_filter, doc_pattern = rules.get_doc_filter(query_lower)
+    if search_filter:
+        print(f"🎯 Фильтр по документу: {doc_pattern}")
     
     # Получаем эмбеддинг запроса
     print("⌛ Создание эмбеддинга запроса...")
@@ -65,10 +54,11 @@ def search(query: str, limit: int = 5):
     if search_filter:
         search_params["filter"] = search_filter
     
-    response = requests.post(
+    response = qdrant.post(
         f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/search",
         json=search_params,
-        timeout=30
+        timeout=30,
+        idempotent=True
     )
     
     results = response.json()["result"]
@@ -77,29 +67,10 @@ def search(query: str, limit: int = 5):
         print("❌ Ничего не найдено")
         return []
     
-    # Keyword matching + boosting
-    query_lower = query.lower()
-    keyword_boosts = {
-        'справочник': ('Справочник', 0.3),
-        'золотой стандарт': ('Золотой Стандарт', 0.3),
-        'ссп': ('Справочник', 0.2),
-        'пир': ('ПИР', 0.05),
-        'директор': ('Директор', 0.1)
-    }
-    
-    # Re-ranking
-    for result in results:
-        filename = result["payload"]["filename"]
-        total_chunks = result["payload"]["total_chunks"]
-        
-        # Keyword boost
-        for keyword, (file_pattern, boost) in keyword_boosts.items():
-            if keyword in query_lower and file_pattern in filename:
-                result["score"] += boost
-        
-        # Small doc boost (<100 chunks)
-        if total_chunks < 100:
-            result["score"] += 0.05
+    # Re-ranking по тем же правилам, что и в веб-интерфейсе (boost_rules.json)
+    fired = rules.apply(query, results)
+    if fired:
+        print(f"⚡ Сработали правила: {fired}")
     
     # Пересортировка
     results.sort(key=lambda x: x["score"], reverse=True)
@@ -150,7 +121,7 @@ def ask_llm(query: str, context: str, model: str = "deepseek"):
     print("\n🤖 Генерация ответа (DeepSeek)...\n")
     
     try:
-        response = requests.post(
+        response = openrouter.post(
             OPENROUTER_URL,
             headers={
                 "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -171,7 +142,7 @@ def ask_llm(query: str, context: str, model: str = "deepseek"):
         print(f"⚠️  Ошибка DeepSeek API: {e}")
         print("🔄 Fallback на Ollama...\n")
         try:
-            response = requests.post(
+            response = ollama.post(
                 f"{OLLAMA_URL}/api/generate",
                 json={
                     "model": "llama3.2",
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Локальное зеркало коллекции Qdrant для точного векторного поиска в процессе
+
+Корпус небольшой (несколько тысяч векторов 768), поэтому поиск - одно
+умножение матрицы на вектор в NumPy, без сетевого запроса к Qdrant и
+JSON с полными payload всех кандидатов.
+
+Хранение (VECTOR_MIRROR_DIR, по умолчанию /shared/db/vector_mirror):
+    current.json       - текущее поколение и версия коллекции, которой оно соответствует
+    gen-<id>/vectors.npy  - нормированные векторы (float16 или float32)
+    gen-<id>/points.db    - таблица payload: номер строки, ID точки, filename, payload
+Матрица открывается через np.load(mmap_mode='r'), так что gunicorn worker'ы
+делят одни и те же страницы через page cache ОС. Любое изменение пишет
+новое поколение и атомарно переключает current.json; worker'ы подхватывают его
+при следующем поиске (предыдущее поколение остается на диске для уже начатых поисков).
+
+Синхронизация:
+    - полная пересборка из Qdrant (scroll с векторами)
+    - инкрементально при загрузке документа (apply_points из batch_ingest)
+Если версия коллекции изменилась без обновления зеркала (загрузка другим
+скриптом), зеркало считается устаревшим и поиск идет в Qdrant.
+
+Использование:
+    python vector_mirror.py rebuild   # пересобрать зеркало из Qdrant
+    python vector_mirror.py check     # сравнить зеркало с Qdrant
+"""
+
+import os
+import json
+import uuid
+import fcntl
+import random
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+VECTOR_MIRROR_ENABLED = os.getenv('VECTOR_MIRROR_ENABLED', '0') == '1'
+VECTOR_MIRROR_DIR = os.getenv('VECTOR_MIRROR_DIR', '/shared/db/vector_mirror')
+VECTOR_MIRROR_DTYPE = os.getenv('VECTOR_MIRROR_DTYPE', 'float16')
+# Строк матрицы на одно умножение при поиске (~12 МБ float32 при размерности 768)
+SEARCH_BLOCK_ROWS = 4096
+
+_lock = threading.Lock()
+# Открытое поколение зеркала в текущем процессе: снимок не меняется, при смене поколения
+# заменяется целиком (поиск в другом потоке дорабатывает со своим снимком)
+_snapshot = None
+
+
+def normalize_point_id(point_id):
+    """ID точки в каноническом виде (Qdrant отдает UUID с дефисами, ingestion пишет md5 hex)"""
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        return str(point_id)
+
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _read_current():
+    try:
+        return json.loads((Path(VECTOR_MIRROR_DIR) / 'current.json').read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_generation(point_ids, vectors, payloads, version):
+    """Пишет новое поколение зеркала и делает его текущим"""
+    root = Path(VECTOR_MIRROR_DIR)
+    generation = f"gen-{uuid.uuid4().hex[:12]}"
+    gen_dir = root / generation
+    gen_dir.mkdir(parents=True)
+
+    np.save(gen_dir / 'vectors.npy', np.asarray(vectors).astype(VECTOR_MIRROR_DTYPE))
+
+    conn = sqlite3.connect(gen_dir / 'points.db')
+    conn.execute('''
+        CREATE TABLE points (
+            row INTEGER PRIMARY KEY,
+            point_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            payload TEXT NOT NULL
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO points (row, point_id, filename, chunk_index, payload) VALUES (?, ?, ?, ?, ?)',
+        [(row, point_id, payload.get('filename', ''), payload.get('chunk_index', 0),
+          json.dumps(payload, ensure_ascii=False))
+         for row, (point_id, payload) in enumerate(zip(point_ids, payloads))]
+    )
+    conn.commit()
+    conn.close()
+
+    previous = _read_current()
+    current = {'generation': generation, 'collection_version': version, 'points': len(point_ids)}
+    tmp_path = root / 'current.json.tmp'
+    tmp_path.write_text(json.dumps(current))
+    tmp_path.replace(root / 'current.json')
+
+    # Предыдущее поколение оставляем: поиск, начатый до переключения, еще читает его points.db
+    keep = {generation, previous['generation'] if previous else None}
+    for old_dir in root.glob('gen-*'):
+        if old_dir.name not in keep:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    return current
+
+
+class _WriteLock:
+    """Межпроцессная блокировка записи зеркала (загрузка может идти из webapp и docling)"""
+
+    def __enter__(self):
+        Path(VECTOR_MIRROR_DIR).mkdir(parents=True, exist_ok=True)
+        self.file = open(Path(VECTOR_MIRROR_DIR) / '.lock', 'w')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def _read_all(current):
+    """Все точки поколения: (point_ids, vectors float32, payloads)"""
+    gen_dir = Path(VECTOR_MIRROR_DIR) / current['generation']
+    vectors = np.load(gen_dir / 'vectors.npy').astype(np.float32)
+    conn = sqlite3.connect(gen_dir / 'points.db')
+    rows = conn.execute('SELECT point_id, payload FROM points ORDER BY row').fetchall()
+    conn.close()
+    return [row[0] for row in rows], vectors, [json.loads(row[1]) for row in rows]
+
+
+def rebuild_from_qdrant(qdrant_url, collection="documents", version=None):
+    """Полная пересборка зеркала по всем точкам коллекции"""
+    from http_client import qdrant
+    from batch_ingest import get_collection_version
+    from ingest_state import active_version_filter
+
+    version = version or get_collection_version()
+    # Точки невключенных версий (загрузка идет или прервалась) в зеркало не попадают
+    search_filter = active_version_filter()
+    point_ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        scroll_params = {"limit": 256, "with_payload": True, "with_vector": True, "filter": search_filter}
+        if offset:
+            scroll_params["offset"] = offset
+        response = qdrant.post(
+            f"{qdrant_url}/collections/{collection}/points/scroll",
+            json=scroll_params,
+            timeout=60,
+            idempotent=True
+        )
+        response.raise_for_status()
+        result = response.json()["result"]
+        for point in result["points"]:
+            point_ids.append(normalize_point_id(point["id"]))
+            vectors.append(point["vector"])
+            payloads.append(point["payload"])
+        offset = result.get("next_page_offset")
+        if not offset:
+            break
+
+    matrix = _normalize_rows(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    with _WriteLock():
+        current = _write_generation(point_ids, matrix, payloads, version)
+    print(f"✨ Зеркало пересобрано: {current['points']} точек ({VECTOR_MIRROR_DTYPE})")
+    return current
+
+
+def apply_points(points, previous_version, version, remove_ids=()):
+    """
+    Добавляет/обновляет точки в зеркале (после upsert в Qdrant)
+
+    Args:
+        points: точки в формате upsert Qdrant (id, vector, payload)
+        previous_version: версия коллекции до загрузки
+        version: версия коллекции после загрузки
+        remove_ids: ID точек, удаленных из Qdrant (прежняя версия документа) -
+            убираются в том же поколении
+    """
+    with _WriteLock():
+        current = _read_current()
+        if current is None or current['collection_version'] != previous_version:
+            # Зеркало не построено или уже отстало - частичное обновление его не исправит
+            print("⚠️ Зеркало векторов устарело, запустите: python vector_mirror.py rebuild")
+            return None
+        point_ids, vectors, payloads = _read_all(current)
+        if remove_ids:
+            remove = {normalize_point_id(point_id) for point_id in remove_ids}
+            keep = [row for row, point_id in enumerate(point_ids) if point_id not in remove]
+            point_ids, vectors, payloads = [point_ids[row] for row in keep], vectors[keep], [payloads[row] for row in keep]
+        rows = {point_id: row for row, point_id in enumerate(point_ids)}
+
+        new_vectors = _normalize_rows([point["vector"] for point in points])
+        appended = []
+        for point, vector in zip(points, new_vectors):
+            point_id = normalize_point_id(point["id"])
+            if point_id in rows:
+                vectors[rows[point_id]] = vector
+                payloads[rows[point_id]] = point["payload"]
+            else:
+                rows[point_id] = len(point_ids)
+                point_ids.append(point_id)
+                payloads.append(point["payload"])
+                appended.append(vector)
+        if appended:
+            vectors = np.vstack([vectors, np.stack(appended)]) if len(vectors) else np.stack(appended)
+        return _write_generation(point_ids, vectors, payloads, version)
+
+
+def remove_points(point_ids_to_remove, previous_version, version):
+    """Удаляет точки из зеркала (после удаления в Qdrant)"""
+    with _WriteLock():
+        current = _read_current()
+        if current is None or current['collection_version'] != previous_version:
+            print("⚠️ Зеркало векторов устарело, запустите: python vector_mirror.py rebuild")
+            return None
+        remove = {normalize_point_id(point_id) for point_id in point_ids_to_remove}
+        point_ids, vectors, payloads = _read_all(current)
+        keep = [row for row, point_id in enumerate(point_ids) if point_id not in remove]
+        return _write_generation(
+            [point_ids[row] for row in keep], vectors[keep], [payloads[row] for row in keep], version
+        )
+
+
+def _load():
+    """Снимок текущего поколения (открывает новое, если сменилось с прошлого раза)"""
+    global _snapshot
+    current = _read_current()
+    if current is None:
+        return None
+    snapshot = _snapshot
+    if snapshot is not None and snapshot['generation'] == current['generation']:
+        return snapshot
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot['generation'] != current['generation']:
+            gen_dir = Path(VECTOR_MIRROR_DIR) / current['generation']
+            vectors = np.load(gen_dir / 'vectors.npy', mmap_mode='r')
+            conn = sqlite3.connect(gen_dir / 'points.db')
+            rows = conn.execute('SELECT point_id, filename, chunk_index FROM points ORDER BY row').fetchall()
+            conn.close()
+            snapshot = {
+                'generation': current['generation'],
+                'version': current['collection_version'],
+                'vectors': vectors,
+                'point_ids': [row[0] for row in rows],
+                'filenames': [row[1] for row in rows],
+                'chunk_indices': np.array([row[2] for row in rows], dtype=np.int64),
+                'db_path': str(gen_dir / 'points.db'),
+            }
+            _snapshot = snapshot
+    return snapshot
+
+
+def is_ready(version):
+    """Зеркало построено и соответствует текущей версии коллекции"""
+    try:
+        mirror = _load()
+    except Exception as e:
+        print(f"⚠️ Ошибка открытия зеркала векторов: {e}")
+        return False
+    return mirror is not None and mirror['version'] == version
+
+
+def _filter_mask(mirror, search_filter):
+    """Маска строк по фильтру Qdrant (поддерживаются filename match.text/value и chunk_index match.any)"""
+    mask = np.ones(len(mirror['point_ids']), dtype=bool)
+    for condition in (search_filter or {}).get("must", []):
+        key, match = condition["key"], condition["match"]
+        if key == "filename" and "text" in match:
+            needle = match["text"].lower()
+            mask &= np.array([needle in filename.lower() for filename in mirror['filenames']], dtype=bool)
+        elif key == "filename" and "value" in match:
+            mask &= np.array([filename == match["value"] for filename in mirror['filenames']], dtype=bool)
+        elif key == "chunk_index" and "any" in match:
+            mask &= np.isin(mirror['chunk_indices'], match["any"])
+        else:
+            raise ValueError(f"Условие фильтра не поддерживается зеркалом: {condition}")
+    return mask
+
+
+def search(query_vector, limit, search_filter=None):
+    """
+    Точный поиск по косинусной близости
+
+    Returns:
+        list: результаты в формате Qdrant (id, score, payload) по убыванию score
+    """
+    mirror = _load()
+    if mirror is None or not mirror['point_ids']:
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    query = query / norm if norm else query
+    # Матрица читается из mmap (общая для процессов через page cache) блоками: float16
+    # переводится в float32 по SEARCH_BLOCK_ROWS строк, полной копии матрицы нет
+    vectors = mirror['vectors']
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = vectors[start:start + SEARCH_BLOCK_ROWS]
+        scores[start:start + len(block)] = np.asarray(block, dtype=np.float32) @ query
+    if search_filter:
+        scores[~_filter_mask(mirror, search_filter)] = -np.inf
+
+    limit = min(limit, len(scores))
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top])]
+    top = [int(row) for row in top if np.isfinite(scores[row])]
+    if not top:
+        return []
+
+    conn = sqlite3.connect(mirror['db_path'])
+    placeholders = ",".join("?" * len(top))
+    payloads = dict(conn.execute(
+        f'SELECT row, payload FROM points WHERE row IN ({placeholders})', top
+    ).fetchall())
+    conn.close()
+    return [{
+        "id": mirror['point_ids'][row],
+        "score": float(scores[row]),
+        "payload": json.loads(payloads[row])
+    } for row in top]
+
+
+def check(qdrant_url, collection="documents", sample=50, queries=10, limit=10):
+    """
+    Сравнивает зеркало с Qdrant: число точек, векторы и payload случайной выборки,
+    совпадение top-k результатов поиска
+
+    Returns:
+        dict: отчет (ok - True, если расхождений нет)
+    """
+    from http_client import qdrant
+    from ingest_state import active_version_filter
+
+    mirror = _load()
+    if mirror is None:
+        return {'ok': False, 'error': 'зеркало не построено'}
+
+    # В зеркале только активные версии: точки прерванных загрузок в Qdrant не считаем
+    search_filter = active_version_filter()
+    report = {'mirror_points': len(mirror['point_ids']), 'mirror_version': mirror['version']}
+    response = qdrant.post(
+        f"{qdrant_url}/collections/{collection}/points/count",
+        json={"filter": search_filter, "exact": True},
+        timeout=30,
+        idempotent=True
+    )
+    response.raise_for_status()
+    report['qdrant_points'] = response.json()["result"]["count"]
+
+    # Векторы и payload случайных точек
+    rows = random.sample(range(len(mirror['point_ids'])), min(sample, len(mirror['point_ids'])))
+    response = qdrant.post(
+        f"{qdrant_url}/collections/{collection}/points",
+        json={"ids": [mirror['point_ids'][row] for row in rows], "with_payload": True, "with_vector": True},
+        timeout=30,
+        idempotent=True
+    )
+    response.raise_for_status()
+    remote = {normalize_point_id(point["id"]): point for point in response.json()["result"]}
+    conn = sqlite3.connect(mirror['db_path'])
+    missing, vector_mismatch, payload_mismatch = 0, 0, 0
+    for row in rows:
+        point = remote.get(mirror['point_ids'][row])
+        if point is None:
+            missing += 1
+            continue
+        local_vector = np.asarray(mirror['vectors'][row], dtype=np.float32)
+        remote_vector = _normalize_rows([point["vector"]])[0]
+        if float(local_vector @ remote_vector) < 0.999:
+            vector_mismatch += 1
+        payload = json.loads(conn.execute('SELECT payload FROM points WHERE row = ?', (row,)).fetchone()[0])
+        if payload.get("text") != point["payload"].get("text"):
+            payload_mismatch += 1
+    conn.close()
+    report.update(sampled=len(rows), missing_in_qdrant=missing,
+                  vector_mismatch=vector_mismatch, payload_mismatch=payload_mismatch)
+
+    # Совпадение top-k для случайных векторов коллекции в роли запросов
+    overlaps = []
+    for row in random.sample(range(len(mirror['point_ids'])), min(queries, len(mirror['point_ids']))):
+        query_vector = np.asarray(mirror['vectors'][row], dtype=np.float32).tolist()
+        local_ids = {r["id"] for r in search(query_vector, limit)}
+        response = qdrant.post(
+            f"{qdrant_url}/collections/{collection}/points/search",
+            json={"vector": query_vector, "limit": limit, "with_payload": False, "filter": search_filter},
+            timeout=30,
+            idempotent=True
+        )
+        response.raise_for_status()
+        remote_ids = {normalize_point_id(r["id"]) for r in response.json()["result"]}
+        overlaps.append(len(local_ids & remote_ids) / max(len(remote_ids), 1))
+    report['topk_overlap'] = round(float(np.mean(overlaps)), 3) if overlaps else None
+
+    report['ok'] = (report['mirror_points'] == report['qdrant_points'] and not missing
+                    and not vector_mismatch and not payload_mismatch)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    qdrant_url = os.getenv('QDRANT_URL', "http://qdrant-docling:6333")
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "rebuild":
+        rebuild_from_qdrant(qdrant_url)
+    elif command == "check":
+        result = check(qdrant_url)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.exit(0 if result['ok'] else 1)
+    else:
+        print("Использование: python vector_mirror.py rebuild | check")
+        sys.exit(1)
@@ -36,8 +36,8 @@ print("="*70)
 
 # Проверяем результаты
 try:
-    import requests
-    r = requests.get("http://qdrant-docling:6333/collections/documents", timeout=5)
+    from http_client import qdrant
+    r = qdrant.get("http://qdrant-docling:6333/collections/documents", timeout=5)
     if r.status_code == 200:
         points = r.json()['result']['points_count']
         print(f"\n📊 Всего векторов в базе: {points}")
@@ -1,9 +1,9 @@
 from flask import Blueprint, jsonify, request
 import database as db
 import re
-import requests
 import os
 from telegram_notify import notify_access_approved, notify_access_rejected
+from http_client import qdrant
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -314,10 +314,11 @@ def get_documents():
             if offset:
                 scroll_params["offset"] = offset
             
-            response = requests.post(
+            response = qdrant.post(
                 f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
                 json=scroll_params,
-                timeout=10
+                timeout=10,
+                idempotent=True
             )
             
             if response.status_code != 200:
@@ -355,7 +356,7 @@ def get_documents():
         docs_list.sort(key=lambda x: x["filename"])
         
         # Получаем общую статистику
-        collection_info = requests.get(
+        collection_info = qdrant.get(
             f"{QDRANT_URL}/collections/{COLLECTION_NAME}",
             timeout=10
         )
@@ -0,0 +1,184 @@
+"""
+Семантический кэш готовых ответов LLM
+
+Ответ и источники сохраняются вместе с эмбеддингом запроса. Новый запрос
+получает готовый ответ, если косинусная близость к сохраненному запросу
+не ниже порога, запись не старше TTL и коллекция Qdrant с тех пор не менялась
+(версия коллекции обновляется при каждой загрузке документа).
+
+Записи хранятся в SQLite (общий для всех gunicorn worker'ов), каждый worker
+держит у себя матрицу эмбеддингов и дочитывает только новые строки.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', '/shared/cache/answers.db')
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', '1') == '1'
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(24 * 3600)))
+
+# Заголовок запроса для отладки: X-Cache-Bypass: 1 - не брать ответ из кэша
+BYPASS_HEADER = 'X-Cache-Bypass'
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0}
+_schema_ready = False
+
+# Локальная копия кэша текущего процесса
+_version = None
+_last_id = 0
+_ids = []
+_created = []
+_matrix = None
+
+
+def get_connection():
+    """Создает подключение к кэшу ответов"""
+    global _schema_ready
+    Path(ANSWER_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(ANSWER_CACHE_PATH, timeout=5)
+    if not _schema_ready:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection_version TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_version ON answers(collection_version, id)')
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _sync(conn, version):
+    """Дочитывает новые записи текущей версии коллекции в локальную матрицу"""
+    global _version, _last_id, _ids, _created, _matrix
+
+    if version != _version:
+        # Коллекция изменилась - старые ответы больше не используем
+        _version, _last_id, _ids, _created, _matrix = version, 0, [], [], None
+        conn.execute('DELETE FROM answers WHERE collection_version != ?', (version,))
+        conn.commit()
+
+    # Выбрасываем из памяти записи старше TTL
+    cutoff = time.time() - ANSWER_CACHE_TTL
+    if _created and _created[0] < cutoff:
+        keep = [i for i, created in enumerate(_created) if created >= cutoff]
+        _ids = [_ids[i] for i in keep]
+        _created = [_created[i] for i in keep]
+        _matrix = _matrix[keep] if keep else None
+
+    rows = conn.execute(
+        'SELECT id, embedding, created_at FROM answers WHERE collection_version = ? AND id > ? ORDER BY id',
+        (version, _last_id)
+    ).fetchall()
+    if not rows:
+        return
+
+    vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    _matrix = vectors if _matrix is None else np.vstack([_matrix, vectors])
+    _ids.extend(row[0] for row in rows)
+    _created.extend(row[2] for row in rows)
+    _last_id = rows[-1][0]
+
+
+def lookup(embedding, version):
+    """
+    Ищет сохраненный ответ на похожий запрос
+
+    Returns:
+        dict (answer, sources, similarity, query) или None
+    """
+    if not ANSWER_CACHE_ENABLED or embedding is None:
+        return None
+
+    try:
+        with _lock:
+            conn = get_connection()
+            _sync(conn, version)
+            best = None
+            if _matrix is not None:
+                similarities = _matrix @ _normalize(embedding)
+                fresh = np.asarray(_created) >= time.time() - ANSWER_CACHE_TTL
+                similarities[~fresh] = -1.0
+                idx = int(np.argmax(similarities))
+                if similarities[idx] >= ANSWER_CACHE_THRESHOLD:
+                    best = (_ids[idx], float(similarities[idx]))
+
+            row = None
+            if best:
+                row = conn.execute(
+                    'SELECT query, answer, sources FROM answers WHERE id = ?', (best[0],)
+                ).fetchone()
+            conn.close()
+
+            if row is None:
+                _stats['misses'] += 1
+                return None
+            _stats['hits'] += 1
+    except Exception as e:
+        print(f"Ошибка чтения кэша ответов: {e}")
+        return None
+
+    return {
+        'query': row[0],
+        'answer': row[1],
+        'sources': json.loads(row[2]),
+        'similarity': round(best[1], 4)
+    }
+
+
+def store(query, embedding, answer, sources, version):
+    """Сохраняет ответ в кэш"""
+    if not ANSWER_CACHE_ENABLED or embedding is None:
+        return
+    try:
+        conn = get_connection()
+        conn.execute(
+            'INSERT INTO answers (collection_version, query, embedding, answer, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (version, query, _normalize(embedding).tobytes(), answer, json.dumps(sources, ensure_ascii=False), time.time())
+        )
+        conn.execute('DELETE FROM answers WHERE created_at < ?', (time.time() - ANSWER_CACHE_TTL,))
+        conn.commit()
+        conn.close()
+        with _lock:
+            _stats['stored'] += 1
+    except Exception as e:
+        print(f"Ошибка записи кэша ответов: {e}")
+
+
+def record_bypass():
+    """Учитывает запрос, прошедший мимо кэша по заголовку"""
+    with _lock:
+        _stats['bypassed'] += 1
+
+
+def get_cache_stats():
+    """Счетчики кэша ответов текущего процесса"""
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_ids)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    stats['threshold'] = ANSWER_CACHE_THRESHOLD
+    stats['ttl_seconds'] = ANSWER_CACHE_TTL
+    return stats
@@ -1,11 +1,10 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-import requests
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 import os
-import hashlib
-from pathlib import Path
 from werkzeug.utils import secure_filename
 import json
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 sys.path.insert(0, '/docling_app')
 
 # Импорты для админ-панели и Telegram бота
@@ -13,7 +12,20 @@ import database as db
 from admin_routes import admin_bp
 from auth_routes import auth_bp, jwt_required
 from chat_routes import chat_bp
-from examples_loader import load_examples, format_examples_for_prompt
+from examples_loader import get_examples_block, format_examples_for_prompt
+from example_selector import select_examples
+from batch_ingest import get_collection_version
+from chunking import chunk_point_id
+import lexical_index
+import vector_mirror
+import ingest_state
+from chunk_features import features_from_payload, FEATURE_INDEXES
+from boost_rules import get_engine as get_boost_engine
+from embedding_cache import get_cached_embedding, put_cached_embedding, get_cache_stats
+import answer_cache
+import ingest_queue
+from context_packer import pack_context
+from http_client import ollama, qdrant, polza, get_upstream_stats
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
@@ -32,329 +44,497 @@ COLLECTION_NAME = "documents"
 
 # Polza.ai API настройки (OpenAI-совместимый endpoint)
 POLZA_API_KEY = os.getenv('POLZA_API_KEY', '')
-POLZA_URL = "https://api.polza.ai/v1/chat/completions"
+POLZA_URL = os.getenv('POLZA_URL', "https://api.polza.ai/v1/chat/completions")
 DEEPSEEK_MODEL = "deepseek-chat"
 
+# Параллельное выполнение этапов поиска (keyword-поиск параллельно с semantic search)
+RETRIEVAL_CONCURRENT = os.getenv('RETRIEVAL_CONCURRENT', '1') == '1'
+RETRIEVAL_WORKERS = int(os.getenv('RETRIEVAL_WORKERS', '8'))
+# Таймауты этапов поиска, сек
+EMBED_STAGE_TIMEOUT = float(os.getenv('EMBED_STAGE_TIMEOUT', '60'))
+VECTOR_STAGE_TIMEOUT = float(os.getenv('VECTOR_STAGE_TIMEOUT', '30'))
+KEYWORD_STAGE_TIMEOUT = float(os.getenv('KEYWORD_STAGE_TIMEOUT', '10'))
+EXPAND_STAGE_TIMEOUT = float(os.getenv('EXPAND_STAGE_TIMEOUT', '10'))
+
+# Двухфазный поиск: кандидаты приходят из Qdrant без текста чанков (только поля для
+# re-ranking'а), полный текст забирается по ID для финалистов и их соседей
+TWO_PHASE_RETRIEVAL = os.getenv('TWO_PHASE_RETRIEVAL', '1') == '1'
+CANDIDATE_PAYLOAD_FIELDS = ['filename', 'chunk_index', 'total_chunks', 'prev_id', 'next_id', *FEATURE_INDEXES]
+
+# Под gevent потоки пула становятся greenlet'ами (monkey patching)
+RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix='retrieval')
+
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'txt', 'md', 'doc'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_embedding(text, model="nomic-embed-text"):
-    """Получает эмбеддинг текста"""
+def get_embedding(text, model="nomic-embed-text", use_cache=True):
+    """Получает эмбеддинг текста (для запросов - через кэш)"""
+    if use_cache:
+        cached = get_cached_embedding(text, model)
+        if cached is not None:
+            return cached
     try:
-        response = requests.post(
+        response = ollama.post(
             f"{OLLAMA_URL}/api/embeddings",
             json={"model": model, "prompt": text},
-            timeout=60
+            timeout=EMBED_STAGE_TIMEOUT,
+            idempotent=True
         )
-        return response.json()["embedding"]
+        embedding = response.json()["embedding"]
+        if use_cache:
+            put_cached_embedding(text, model, embedding)
+        return embedding
     except Exception as e:
         print(f"Ошибка получения эмбеддинга: {e}")
         return None
 
-def search_documents(query, limit=50):
-    """Гибридный поиск: semantic + keyword matching + boosting"""
+def find_keyword_candidates(keyword):
+    """
+    Находит чанки с определениями, содержащие термин: все совпадения локального
+    BM25-индекса (без отсечки по score - определение может быть не в топе), из них
+    Qdrant одним запросом отдает только чанки с определениями
+    """
+    if lexical_index.is_empty():
+        print("⚠️ Лексический индекс пуст, запустите: python lexical_index.py rebuild")
+        return []
+    
+    hits = lexical_index.search(keyword, limit=None)
+    print(f"Lexical index: {len(hits)} candidates for '{keyword}'")
+    if not hits:
+        return []
+    
+    response = qdrant.post(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
+        json={
+            "filter": definition_filter([hit["point_id"] for hit in hits]),
+            "limit": len(hits),
+            "with_payload": True,
+            "with_vector": False
+        },
+        timeout=KEYWORD_STAGE_TIMEOUT,
+        idempotent=True
+    )
+    response.raise_for_status()
+    return response.json()["result"]["points"]
+
+def definition_filter(point_ids):
+    """
+    Фильтр Qdrant: точки point_ids, в которых определяются термины (payload-индекс defined_terms)
+    
+    Точки, загруженные до появления признаков, проходят: их проверит definition_matches.
+    """
+    return {"must": [
+        {"has_id": list(point_ids)},
+        {"should": [
+            {"must_not": [{"is_empty": {"key": "defined_terms"}}]},
+            {"is_empty": {"key": "has_definition"}}
+        ]}
+    ]}
+
+# Активные версии документов, перечитываются при смене версии коллекции
+_active_versions = {'collection_version': None, 'versions': []}
+
+def versioned_filter(search_filter=None):
+    """
+    Фильтр Qdrant, добавляющий условие "только активные версии документов"
+    
+    Во время загрузки в коллекции лежат точки и старой, и новой версии документа;
+    видна та, что записана активной в ingest_state. Точки без doc_version
+    (загружены до версионирования) видны всегда.
+    """
+    version = get_collection_version()
+    if _active_versions['collection_version'] != version:
+        try:
+            _active_versions['versions'] = sorted(ingest_state.get_active_versions().values())
+        except Exception as e:
+            print(f"Ошибка чтения активных версий документов: {e}")
+        _active_versions['collection_version'] = version
+    return ingest_state.active_version_filter(search_filter, _active_versions['versions'])
+
+def vector_search(query_embedding, limit, search_filter=None, with_payload=True):
+    """
+    Semantic search: в локальном зеркале векторов, если оно включено и актуально, иначе в Qdrant
+    
+    Args:
+        with_payload: True или список полей payload, которые вернуть (зеркало всегда отдает payload целиком)
+    """
+    if vector_mirror.VECTOR_MIRROR_ENABLED and vector_mirror.is_ready(get_collection_version()):
+        return vector_mirror.search(query_embedding, limit, search_filter)
+    
+    search_params = {
+        "vector": query_embedding,
+        "limit": limit,
+        "with_payload": with_payload,
+        # В зеркале только активные версии, в Qdrant - еще и загружаемые
+        "filter": versioned_filter(search_filter)
+    }
+    
+    response = qdrant.post(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/search",
+        json=search_params,
+        timeout=VECTOR_STAGE_TIMEOUT,
+        idempotent=True
+    )
+    return response.json()["result"]
+
+def retrieve_points(ids, timeout):
+    """Точки по ID одним запросом (payload целиком, без векторов)"""
+    response = qdrant.post(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
+        json={
+            "ids": list(ids),
+            "with_payload": True,
+            "with_vector": False
+        },
+        timeout=timeout,
+        idempotent=True
+    )
+    response.raise_for_status()
+    return response.json()["result"]
+
+def fill_payloads(results, extra_ids=(), timeout=EXPAND_STAGE_TIMEOUT):
+    """
+    Догружает полный payload результатам без текста (кандидаты двухфазного поиска)
+    
+    Заодно тем же запросом забирает точки extra_ids (соседние чанки).
+    
+    Returns:
+        list: точки из extra_ids
+    """
+    missing, extra = payload_request_ids(results, extra_ids)
+    if not missing and not extra:
+        return []
+    points = retrieve_points(list(missing) + list(extra), timeout)
+    return apply_payloads(results, missing, extra, points)
+
+def payload_request_ids(results, extra_ids=()):
+    """
+    Какие точки запросить по ID: результаты без текста и extra_ids
+    
+    Returns:
+        tuple: ({ID: результат без текста}, множество ID остальных точек)
+    """
+    # Qdrant возвращает ID в виде UUID с дефисами, chunk_point_id - без
+    missing = {vector_mirror.normalize_point_id(r["id"]): r for r in results if "text" not in r["payload"]}
+    extra = {vector_mirror.normalize_point_id(point_id) for point_id in extra_ids} - set(missing)
+    return missing, extra
+
+def apply_payloads(results, missing, extra, points):
+    """Раскладывает полученные по ID точки: payload - результатам, остальные возвращает списком"""
+    extra_points = []
+    for point in points:
+        point_id = vector_mirror.normalize_point_id(point["id"])
+        if point_id in missing:
+            missing[point_id]["payload"] = point["payload"]
+        elif point_id in extra:
+            extra_points.append(point)
+    
+    # Точки, которые пропали из коллекции между фазами, из результатов убираем
+    results[:] = [r for r in results if "text" in r["payload"]]
+    return extra_points
+
+def find_definition_results(keyword):
+    """Keyword-поиск чанков, где определяется термин (для вопросов "Что такое X?")"""
+    print(f"Keyword search for definition: '{keyword}'")
     try:
-        query_lower = query.lower()
-        
-        # Проверяем, упомянут ли конкретный документ
-        doc_filters = {
-            'справочник': 'Справочник Мудрого Руководителя',
-            'золотой стандарт': 'Золотой Стандарт Аудита',
-            'директор': 'Директор'
-        }
-        
-        # Если упомянут документ - фильтруем по нему
-        search_filter = None
-        for keyword, doc_pattern in doc_filters.items():
-            if keyword in query_lower:
-                search_filter = {
-                    "must": [{
-                        "key": "filename",
-                        "match": {"text": doc_pattern}
-                    }]
-                }
-                print(f"Forced filter: {doc_pattern}")
-                break
+        all_points = find_keyword_candidates(keyword)
+    except Exception as e:
+        print(f"Keyword search error: {e}")
+        return []
+    return definition_matches(keyword, all_points)
+
+def definition_matches(keyword, points):
+    """Чанки, где определяется термин, с максимальным score"""
+    keyword_results = []
+    for point in points:
+        # Проверяем: определяется ли в чанке искомый термин
+        defined_terms = features_from_payload(point["payload"])["defined_terms"]
+        if any(keyword.replace('ё', 'е') in term for term in defined_terms):
+            # Добавляем с высоким score
+            keyword_results.append({
+                "id": point["id"],
+                "score": 1.5,  # Максимальный score для keyword match
+                "payload": point["payload"]
+            })
+            print(f"Keyword match with definition: {point['payload']['filename']} (chunk {point['payload']['chunk_index']})")
+    return keyword_results
+
+def wait_stage(future, timeout, stage, default):
+    """Ждет результат этапа из пула; по таймауту или ошибке этап пропускается (возвращает default)"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        print(f"⚠️ Этап {stage} не уложился в {timeout} сек, пропускаем")
+    except Exception as e:
+        print(f"Ошибка этапа {stage}: {e}")
+    return default
+
+def plan_search(query):
+    """
+    Что нужно для поиска по вопросу: правила boosting'а, фильтр по документу
+    (если документ упомянут) и термин для keyword-поиска определения
+    
+    Returns:
+        tuple: (rules, search_filter или None, keyword или None)
+    """
+    query_lower = query.lower()
+    rules = get_boost_engine()
+    
+    # Если упомянут документ - фильтруем по нему
+    search_filter, doc_pattern = rules.get_doc_filter(query_lower)
+    if search_filter:
+        print(f"Forced filter: {doc_pattern}")
+    
+    # Для вопросов "Что такое X?" - нужен keyword search
+    # Извлекаем термин из запроса (например, "нормочас" из "Что такое нормочас?")
+    keyword = rules.get_definition_term(query_lower)
+    if not keyword or len(keyword) <= 2:  # Только если есть термин
+        keyword = None
+    return rules, search_filter, keyword
+
+def candidate_limit(limit, search_filter):
+    """Сколько кандидатов брать из semantic search"""
+    return limit * 3 if not search_filter else limit  # Увеличили для лучшего охвата
+
+def candidate_payload():
+    """Какие поля payload запрашивать у кандидатов"""
+    return CANDIDATE_PAYLOAD_FIELDS if TWO_PHASE_RETRIEVAL else True
+
+def legacy_candidates(results):
+    """
+    Кандидаты без признаков в payload (загружены до их появления) - признаки
+    считаются по тексту, его нужно догрузить до re-ranking'а
+    """
+    return [r for r in results if "has_definition" not in r["payload"]]
+
+def rank_candidates(query, rules, results, keyword_results, limit):
+    """Re-ranking кандидатов semantic search и слияние с keyword-результатами"""
+    # 2-3. Re-ranking: boost по правилам из boost_rules.json
+    # (упоминание документа, размер документа, определения, формулы, переменные формул)
+    fired = rules.apply(query, results)
+    if fired:
+        print(f"Boost rules fired: {fired}")
+    
+    # 4. Фильтрация по минимальному score (score threshold)
+    filtered_results = [r for r in results if r["score"] >= rules.min_score_threshold]
+    
+    # Если после фильтрации осталось слишком мало - берем лучшие даже с низким score
+    if len(filtered_results) < limit // 2:
+        filtered_results = results[:limit]
+        print(f"Warning: Low scores, using top {len(filtered_results)} results")
+    
+    # 5. Keyword результаты по определению термина - в начало
+    if keyword_results:
+        print(f"Adding {len(keyword_results)} keyword results to top")
+        # Удаляем дубликаты по ID
+        existing_ids = {r["id"] for r in filtered_results}
+        for kr in keyword_results:
+            if kr["id"] not in existing_ids:
+                filtered_results.insert(0, kr)  # В начало!
+    
+    # 6. Пересортировка по новому score
+    filtered_results.sort(key=lambda x: x["score"], reverse=True)
+    return filtered_results[:limit]
+
+def search_documents(query, limit=50, with_text=True):
+    """
+    Гибридный поиск: semantic + keyword matching + boosting
+    
+    При RETRIEVAL_CONCURRENT keyword-поиск (не зависит от эмбеддинга)
+    идет в пуле параллельно с эмбеддингом и semantic search. Этап, не уложившийся
+    в свой таймаут, пропускается (поиск идет без его результатов).
+    
+    При TWO_PHASE_RETRIEVAL кандидаты приходят без текста; with_text=False
+    оставляет результаты без текста - его догрузит expand_context_around_chunks
+    вместе с соседними чанками одним запросом.
+    """
+    keyword_future = None
+    try:
+        started = time.time()
+        timings = {}
+        rules, search_filter, keyword = plan_search(query)
+        if keyword and RETRIEVAL_CONCURRENT:
+            keyword_future = RETRIEVAL_POOL.submit(find_definition_results, keyword)
         
         # 1. Semantic search
         query_embedding = get_embedding(query)
+        timings['embed'] = time.time() - started
         if not query_embedding:
             return []
         
-        search_params = {
-            "vector": query_embedding,
-            "limit": limit * 3 if not search_filter else limit,  # Увеличили для лучшего охвата
-            "with_payload": True
-        }
-        if search_filter:
-            search_params["filter"] = search_filter
-        
-        response = requests.post(
-            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/search",
-            json=search_params,
-            timeout=30
+        stage_started = time.time()
+        results = vector_search(
+            query_embedding,
+            candidate_limit(limit, search_filter),
+            search_filter,
+            with_payload=candidate_payload()
         )
-        results = response.json()["result"]
+        timings['vector'] = time.time() - stage_started
         
-        # 2. Keyword matching - ищем упоминания документов в запросе
-        query_lower = query.lower()
-        keyword_boosts = {
-            'справочник': ('Справочник', 0.3),  # Сильный boost
-            'золотой стандарт': ('Золотой Стандарт', 0.3),
-            'ссп': ('Справочник', 0.2),  # Аббревиатура
-            'пир': ('ПИР', 0.05),
-            'директор': ('Директор', 0.1)
-        }
+        legacy = legacy_candidates(results)
+        if legacy:
+            fill_payloads(legacy, timeout=VECTOR_STAGE_TIMEOUT)
         
-        # 3. Re-ranking: boost scores
-        import re
-        for result in results:
-            filename = result["payload"]["filename"]
-            total_chunks = result["payload"]["total_chunks"]
-            text = result["payload"]["text"]
-            text_lower = text.lower()
-            
-            # Boost для keyword match
-            for keyword, (file_pattern, boost) in keyword_boosts.items():
-                if keyword in query_lower and file_pattern in filename:
-                    result["score"] += boost
-                    print(f"Keyword boost: {filename} +{boost}")
-            
-            # Boost для маленьких документов (<100 chunks)
-            if total_chunks < 100:
-                size_boost = 0.05
-                result["score"] += size_boost
-                print(f"Small doc boost: {filename} ({total_chunks} chunks) +{size_boost}")
-            
-            # ОЧЕНЬ СИЛЬНЫЙ boost для чанков с ОПРЕДЕЛЕНИЯМИ ("Что такое X?")
-            is_definition_query = any(kw in query_lower for kw in ['что такое', 'что это', 'определение', 'это такое'])
-            if is_definition_query:
-                # Паттерны определений: **Название** = или **Название (НЧ)** =
-                definition_patterns = [
-                    r'\*\*[А-ЯЁа-яё\s]+\*\*\s*=',  # **Нормочас** =
-                    r'\*\*[А-ЯЁа-яё\s]+\([А-ЯЁа-яё]+\)\*\*\s*=',  # **Нормочас (НЧ)** =
-                    r'[А-ЯЁа-яё\s]+\([А-ЯЁ]+\)\s*=',  # Нормочас (НЧ) =
-                ]
-                has_definition = any(re.search(pattern, text) for pattern in definition_patterns)
-                if has_definition:
-                    definition_boost = 0.5  # ОЧЕНЬ сильный boost для определений
-                    result["score"] += definition_boost
-                    print(f"DEFINITION BOOST: {filename} (chunk {result['payload']['chunk_index']}) +{definition_boost}")
-            
-            # СИЛЬНЫЙ boost для чанков с формулами (если запрос о расчетах/формулах)
-            formula_keywords = ['формул', 'рассчита', 'вычисл', 'как найти', 'как считать', 'расчет', 
-                              'показатель', 'метрик', 'коэффициент', 'норма', 'вв', 'кзаг', 'нч', 'тр']
-            if any(keyword in query_lower for keyword in formula_keywords):
-                # Проверяем наличие формулы в тексте
-                formula_patterns = [
-                    r'[А-ЯЁ]+[А-ЯЁа-яё]*\s*=\s*[А-ЯЁа-яё0-9\s\+\-\*\(\)]+',  # ВВ = Кзаг * НЧ * тр
-                    r'[А-ЯЁ]+[А-ЯЁа-яё]*\s*=\s*[А-ЯЁа-яё0-9\s\+\-\*\/\(\)]+',  # Формулы с делением
-                    r'\b[А-ЯЁ]{2,}\s*[=:]\s*',  # Сокращения типа ВВ=
-                ]
-                has_formula = any(re.search(pattern, text, re.IGNORECASE) for pattern in formula_patterns)
-                
-                if has_formula:
-                    formula_boost = 0.25  # Сильный boost для формул
-                    result["score"] += formula_boost
-                    print(f"Formula boost: {filename} (chunk {result['payload']['chunk_index']}) +{formula_boost}")
-            
-            # Boost для точных совпадений переменных формул И терминов в запросе
-            formula_vars = {
-                'вв': ['валов', 'выручк'],
-                'кзаг': ['коэффициент', 'загрузк'],
-                'нч': ['нормочас'],
-                'нормочас': ['нормочас', 'нч'],
-                'тр': ['рабоч', 'времен']
-            }
-            for var_key, var_keywords in formula_vars.items():
-                if var_key in query_lower:
-                    if any(kw in text_lower for kw in var_keywords):
-                        var_boost = 0.2  # Усилили boost
-                        result["score"] += var_boost
-                        print(f"Formula variable boost ({var_key}): {filename} +{var_boost}")
-        
-        # 4. Фильтрация по минимальному score (score threshold)
-        MIN_SCORE_THRESHOLD = 0.40  # Снизили порог для более широкого охвата
-        filtered_results = [r for r in results if r["score"] >= MIN_SCORE_THRESHOLD]
-        
-        # Если после фильтрации осталось слишком мало - берем лучшие даже с низким score
-        if len(filtered_results) < limit // 2:
-            filtered_results = results[:limit]
-            print(f"Warning: Low scores, using top {len(filtered_results)} results")
-        
-        # 5. Для вопросов "Что такое X?" - добавляем keyword search
-        is_definition_query = any(kw in query_lower for kw in ['что такое', 'что это', 'определение'])
-        if is_definition_query:
-            # Извлекаем ключевое слово из запроса (например, "нормочас" из "Что такое нормочас?")
-            keyword = None
-            for kw in ['что такое ', 'что это ', 'определение ']:
-                if kw in query_lower:
-                    keyword = query_lower.replace(kw, '').replace('?', '').strip()
-                    break
-            
-            if keyword and len(keyword) > 2:  # Только если есть термин
-                print(f"Keyword search for definition: '{keyword}'")
-                try:
-                    # Scroll по ВСЕЙ коллекции с offset для полного охвата
-                    all_points = []
-                    offset = None
-                    
-                    # Получаем ВСЕ чанки через pagination
-                    for _ in range(10):  # Максимум 10 итераций (1000 чанков)
-                        scroll_params = {
-                            "limit": 100,
-                            "with_payload": True,
-                            "with_vector": False
-                        }
-                        if offset:
-                            scroll_params["offset"] = offset
-                        
-                        scroll_response = requests.post(
-                            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
-                            json=scroll_params,
-                            timeout=30
-                        )
-                        
-                        if scroll_response.status_code == 200:
-                            result = scroll_response.json()["result"]
-                            points = result["points"]
-                            if not points:
-                                break
-                            all_points.extend(points)
-                            offset = result.get("next_page_offset")
-                            if not offset:
-                                break
-                        else:
-                            break
-                    
-                    print(f"Scrolled {len(all_points)} total points for keyword search")
-                    
-                    # Фильтруем чанки с определениями
-                    keyword_results = []
-                    for point in all_points:
-                        text = point["payload"]["text"]
-                        text_lower = text.lower()
-                        
-                        # Проверяем: есть ли ключевое слово И определение
-                        if keyword in text_lower:
-                            definition_patterns = [
-                                r'\*\*.*?' + re.escape(keyword) + r'.*?\*\*\s*=',  # **Нормочас** =
-                                r'\*\*.*?\([А-ЯЁ]+\)\*\*\s*=',  # **...(НЧ)** =
-                                r'\*\*' + re.escape(keyword) + r'[^*]*?\*\*\s*=',  # **нормочас доктора (НЧ)** =
-                            ]
-                            has_definition = any(re.search(pattern, text, re.IGNORECASE) for pattern in definition_patterns)
-                            
-                            if has_definition:
-                                # Добавляем с высоким score
-                                keyword_results.append({
-                                    "id": point["id"],
-                                    "score": 1.5,  # Максимальный score для keyword match
-                                    "payload": point["payload"]
-                                })
-                                print(f"Keyword match with definition: {point['payload']['filename']} (chunk {point['payload']['chunk_index']})")
-                    
-                    # Добавляем keyword результаты в начало
-                    if keyword_results:
-                        print(f"Adding {len(keyword_results)} keyword results to top")
-                        # Удаляем дубликаты по ID
-                        existing_ids = {r["id"] for r in filtered_results}
-                        for kr in keyword_results:
-                            if kr["id"] not in existing_ids:
-                                filtered_results.insert(0, kr)  # В начало!
-                except Exception as e:
-                    print(f"Keyword search error: {e}")
+        keyword_results = []
+        if keyword:
+            stage_started = time.time()
+            if keyword_future:
+                keyword_results = wait_stage(keyword_future, KEYWORD_STAGE_TIMEOUT, 'keyword', [])
+            else:
+                keyword_results = find_definition_results(keyword)
+            timings['keyword'] = time.time() - stage_started
         
-        # 6. Пересортировка по новому score
-        filtered_results.sort(key=lambda x: x["score"], reverse=True)
+        final_results = rank_candidates(query, rules, results, keyword_results, limit)
+        if with_text:
+            stage_started = time.time()
+            fill_payloads(final_results)
+            timings['payload'] = time.time() - stage_started
         
-        return filtered_results[:limit]
+        stages = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items())
+        print(f"Retrieval ({'concurrent' if RETRIEVAL_CONCURRENT else 'serial'}): {stages}, total {time.time() - started:.3f}s")
+        return final_results
     except Exception as e:
         print(f"Ошибка поиска: {e}")
         return []
+    finally:
+        # Эмбеддинг или semantic search упали - keyword-поиск, еще ждущий в пуле, не нужен
+        if keyword_future and not keyword_future.done():
+            keyword_future.cancel()
 
-def expand_context_around_chunks(results, window=1):
-    """Расширяет контекст вокруг найденных чанков - берет соседние чанки для формул"""
-    expanded = []
-    chunks_by_file = {}
+def neighbor_point_ids(results, window=1):
+    """
+    ID соседних чанков (в пределах window), которых нет среди найденных
     
-    # Группируем по файлам
+    ID соседей известны заранее: prev_id/next_id из payload или (для точек,
+    загруженных до их появления) md5 от имени файла и номера чанка, поэтому
+    соседей можно забрать одним запросом по ID, без scroll по каждому файлу.
+    """
+    chunks_by_file = {}
     for r in results:
-        filename = r["payload"]["filename"]
-        if filename not in chunks_by_file:
-            chunks_by_file[filename] = []
-        chunks_by_file[filename].append(r)
+        chunks_by_file.setdefault(r["payload"]["filename"], []).append(r)
     
-    # Для каждого файла получаем соседние чанки
+    neighbor_ids = {}
     for filename, chunks in chunks_by_file.items():
-        chunk_indices = set()
         total_chunks = chunks[0]["payload"]["total_chunks"]
-        
-        # Собираем индексы найденных чанков и соседних
-        for chunk in chunks:
-            idx = chunk["payload"]["chunk_index"]
+        found = {c["payload"]["chunk_index"] for c in chunks}
+        for c in chunks:
+            payload = c["payload"]
+            idx = payload["chunk_index"]
             for i in range(max(0, idx - window), min(total_chunks, idx + window + 1)):
-                chunk_indices.add(i)
-        
-        # Если нет дополнительных индексов - просто возвращаем оригинальные
-        if len(chunk_indices) <= len(chunks):
-            expanded.extend(chunks)
-            continue
-        
-        # Получаем соседние чанки из Qdrant
-        try:
-            response = requests.post(
-                f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
-                json={
-                    "filter": {
-                        "must": [
-                            {"key": "filename", "match": {"value": filename}},
-                            {"key": "chunk_index", "match": {"any": list(chunk_indices)}}
-                        ]
-                    },
-                    "limit": len(chunk_indices),
-                    "with_payload": True,
-                    "with_vector": False
-                },
-                timeout=10
-            )
-            if response.status_code == 200:
-                neighbor_chunks = response.json()["result"]["points"]
-                # Объединяем с оригинальными, сохраняя scores
-                chunk_map = {c["payload"]["chunk_index"]: c for c in chunks}
-                added = set()
-                
-                for nc in neighbor_chunks:
-                    idx = nc["payload"]["chunk_index"]
-                    if idx in chunk_map:
-                        if idx not in added:
-                            expanded.append(chunk_map[idx])  # Берем оригинал с score
-                            added.add(idx)
-                    else:
-                        # Соседний чанк без score - используем минимальный score
-                        nc["score"] = min([c["score"] for c in chunks]) - 0.1
-                        expanded.append(nc)
-                        added.add(idx)
-            else:
-                expanded.extend(chunks)
-        except Exception as e:
-            print(f"Ошибка расширения контекста для {filename}: {e}")
-            expanded.extend(chunks)
+                if i in found:
+                    continue
+                if window == 1 and "prev_id" in payload:
+                    # ID по содержимому не вычисляются из номера чанка
+                    point_id = payload["prev_id"] if i < idx else payload["next_id"]
+                else:
+                    point_id = chunk_point_id(filename, i)
+                if point_id:
+                    neighbor_ids[point_id] = filename
+    return neighbor_ids
+
+def attach_neighbors(results, neighbor_chunks):
+    """Добавляет соседние чанки к найденным и сортирует по score"""
+    # Соседний чанк без score - используем минимальный score найденных чанков файла - 0.1
+    min_scores = {}
+    for r in results:
+        filename = r["payload"]["filename"]
+        min_scores[filename] = min(r["score"], min_scores.get(filename, r["score"]))
+    
+    expanded = list(results)
+    for nc in neighbor_chunks:
+        filename = nc["payload"]["filename"]
+        if filename in min_scores:
+            nc["score"] = min_scores[filename] - 0.1
+            expanded.append(nc)
     
     # Сортируем по score
     expanded.sort(key=lambda x: x["score"], reverse=True)
     return expanded
 
-def ask_llm(query, context, model="deepseek"):
-    """Генерирует ответ с помощью LLM + few-shot examples"""
+def expand_context_around_chunks(results, window=1):
+    """
+    Расширяет контекст вокруг найденных чанков - берет соседние чанки для формул
     
-    # Загружаем примеры вопрос-ответ для few-shot learning
-    # Берем только 3 примера, но полностью, чтобы LLM видел всю структуру ответов
-    examples = load_examples(max_examples=3)
-    examples_text = format_examples_for_prompt(examples)
+    Соседи всех файлов забираются одним запросом по ID; тем же запросом
+    догружается текст найденных чанков, если его нет (двухфазный поиск).
+    """
+    neighbor_ids = neighbor_point_ids(results, window)
     
-    system_prompt = """Ты - эксперт-консультант по управлению стоматологической клиникой. Отвечай ТОЧНО, по сути, без лишних слов. Отвечай УВЕРЕННО как достоверный источник.
+    # Получаем соседние чанки (и текст найденных) из Qdrant одним запросом
+    try:
+        neighbor_chunks = fill_payloads(results, neighbor_ids)
+    except Exception as e:
+        print(f"Ошибка расширения контекста: {e}")
+        neighbor_chunks = []
+        # Без текста чанк в контекст не попадет
+        results[:] = [r for r in results if "text" in r["payload"]]
+    
+    return attach_neighbors(results, neighbor_chunks)
+
+def build_context(results):
+    """
+    Формирует контекст для LLM и список источников по результатам поиска
+    
+    Returns:
+        tuple: (context, sources)
+    """
+    # Расширяем контекст вокруг найденных чанков (для формул)
+    expanded_results = expand_context_around_chunks(results, window=1)
+    
+    # Лучшие чанки в пределах бюджета токенов, Справочник - в начале
+    context, _ = pack_context(expanded_results)
+    return context, format_sources(results)
+
+def format_sources(results):
+    """Источники ответа для клиента: файл, начало текста чанка, score"""
+    return [{
+        'filename': r["payload"]["filename"],
+        'text': r["payload"]["text"][:200] + "...",
+        'score': r["score"]
+    } for r in results]
+
+def is_cache_bypassed():
+    """Проверяет заголовок X-Cache-Bypass (для отладки - всегда идем в LLM)"""
+    if request.headers.get(answer_cache.BYPASS_HEADER) == '1':
+        answer_cache.record_bypass()
+        return True
+    return False
+
+def answer_query(query, query_with_context, use_cache=True):
+    """
+    Поиск + генерация ответа; при use_cache сначала ищет похожий вопрос в кэше ответов
+    
+    Returns:
+        tuple: (answer или None, если документы не найдены, sources, статус кэша HIT/MISS/BYPASS)
+    """
+    version = get_collection_version()
+    # Эмбеддинг вопроса нужен для кэша ответов и подбора примеров (поиск возьмет его из кэша эмбеддингов)
+    query_embedding = get_embedding(query)
+    
+    if use_cache:
+        cached = answer_cache.lookup(query_embedding, version)
+        if cached:
+            print(f"Answer cache HIT ({cached['similarity']}): '{cached['query']}'")
+            return cached['answer'], cached['sources'], 'HIT'
+    
+    # Поиск документов - увеличено для лучшего поиска формул
+    results = search_documents(query, limit=15, with_text=False)
+    if not results:
+        return None, [], 'MISS' if use_cache else 'BYPASS'
+    
+    context, sources = build_context(results)
+    answer = ask_llm(query_with_context, context, query_embedding=query_embedding)
+    
+    # Ошибки API и пустые ответы не кэшируем
+    if use_cache and answer and not answer.startswith('⚠️'):
+        answer_cache.store(query, query_embedding, answer, sources, version)
+    return answer, sources, 'MISS' if use_cache else 'BYPASS'
+
+# Статическая часть системного промпта - одинаковый для всех запросов префикс
+# (работает кэширование префикса у провайдера); примеры добавляются после него
+SYSTEM_PROMPT = """Ты - эксперт-консультант по управлению стоматологической клиникой. Отвечай ТОЧНО, по сути, без лишних слов. Отвечай УВЕРЕННО как достоверный источник.
 
 ПРАВИЛА ОТВЕТА:
 1. Используй ТОЛЬКО информацию из предоставленного контекста, но ОТВЕЧАЙ УВЕРЕННО как эксперт, без ссылок на документы
@@ -501,8 +681,31 @@ def ask_llm(query, context, model="deepseek"):
 Формула: Кзаг = tзаг / tраб х 100%
 Норма: 85% и более - зеленая зона"
 
-{examples_text}"""
+"""
+
+_system_prompt_cache = {'examples_block': None, 'prompt': None}
+
+def get_system_prompt(query_embedding=None):
+    """
+    Системный промпт с few-shot examples
+    
+    По эмбеддингу вопроса подбираются самые похожие примеры. Без эмбеддинга
+    (или если подбор не удался) - первые 3 примера; такой промпт собирается
+    один раз (до изменения examples.json).
+    """
+    examples = select_examples(query_embedding, OLLAMA_URL) if query_embedding is not None else None
+    if examples is not None:
+        return SYSTEM_PROMPT + format_examples_for_prompt(examples)
     
+    # Берем только 3 примера, но полностью, чтобы LLM видел всю структуру ответов
+    examples_block = get_examples_block(max_examples=3)
+    if _system_prompt_cache['examples_block'] is not examples_block:
+        _system_prompt_cache['prompt'] = SYSTEM_PROMPT + examples_block
+        _system_prompt_cache['examples_block'] = examples_block
+    return _system_prompt_cache['prompt']
+
+def build_llm_messages(query, context, query_embedding=None):
+    """Собирает сообщения для LLM: системный промпт с few-shot examples + контекст и вопрос"""
     user_prompt = f"""
 {context}
 
@@ -516,153 +719,97 @@ def ask_llm(query, context, model="deepseek"):
 - Если есть что-то ПОХОЖЕЕ - используй и ответь ПО АНАЛОГИИ, чтобы помочь пользователю
 - Если информации нет СОВСЕМ - НЕ упоминай "в контексте нет". Вместо этого скажи: "На данный момент у меня недостаточно информации, чтобы ответить на ваш вопрос в такой формулировке. Возможно, вам помогут эти варианты вопросов:" и предложи 3-4 переформулировки"""
     
+    return [
+        {"role": "system", "content": get_system_prompt(query_embedding)},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def polza_request_body(query, context, stream=False, query_embedding=None):
+    """Тело запроса к DeepSeek через Polza.ai"""
+    return {
+        "model": DEEPSEEK_MODEL,
+        "messages": build_llm_messages(query, context, query_embedding),
+        "temperature": 0.0,  # Нулевая температура для максимальной точности формул
+        "top_p": 0.95,
+        "max_tokens": 4000,  # Увеличили для полных детальных ответов
+        "stream": stream
+    }
+
+def polza_error_message(error_msg):
+    """Понятное пользователю сообщение об ошибке Polza.ai"""
+    if "402" in error_msg:
+        return "⚠️ Закончился баланс Polza.ai API. Пополните баланс на https://polza.ai/dashboard"
+    elif "401" in error_msg:
+        return "⚠️ Ошибка авторизации Polza.ai API. Проверьте API ключ."
+    else:
+        return f"⚠️ Ошибка Polza.ai API: {error_msg}"
+
+def ask_llm(query, context, model="deepseek", query_embedding=None):
+    """Генерирует ответ с помощью LLM + few-shot examples"""
     try:
         # Используем ТОЛЬКО DeepSeek через Polza.ai
-        response = requests.post(
+        response = polza.post(
             POLZA_URL,
             headers={
                 "Authorization": f"Bearer {POLZA_API_KEY}",
                 "Content-Type": "application/json"
             },
-            json={
-                "model": DEEPSEEK_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.0,  # Нулевая температура для максимальной точности формул
-                "top_p": 0.95,
-                "max_tokens": 4000  # Увеличили для полных детальных ответов
-            },
+            json=polza_request_body(query, context, query_embedding=query_embedding),
             timeout=60  # Уменьшили таймаут, т.к. DeepSeek быстрый
         )
         response.raise_for_status()
         return response.json()["choices"][0]["message"]["content"]
     except Exception as e:
         # Возвращаем понятную ошибку без fallback на Ollama
-        error_msg = str(e)
-        if "402" in error_msg:
-            return "⚠️ Закончился баланс Polza.ai API. Пополните баланс на https://polza.ai/dashboard"
-        elif "401" in error_msg:
-            return "⚠️ Ошибка авторизации Polza.ai API. Проверьте API ключ."
-        else:
-            return f"⚠️ Ошибка Polza.ai API: {error_msg}"
-
-def chunk_text(text, chunk_size=350, overlap=70):
-    """Разбивает текст на чанки"""
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        if chunk:
-            chunks.append(chunk)
-    return chunks
-
-def add_to_qdrant(chunk_id, embedding, text, metadata):
-    """Добавляет вектор в Qdrant"""
+        return polza_error_message(str(e))
+
+class LLMStreamError(Exception):
+    """Поток ответа Polza.ai прервался; текст исключения - сообщение для пользователя (с ⚠️)"""
+
+def ask_llm_stream(query, context, query_embedding=None):
+    """
+    Потоковая генерация ответа: отдает фрагменты текста по мере того, как их присылает Polza.ai
+    
+    При ошибке API (в том числе посреди ответа) бросает LLMStreamError: уже отданные
+    фрагменты - неполный ответ, кэшировать и сохранять его нельзя.
+    """
+    started = time.time()
+    first_token_at = None
     try:
-        response = requests.put(
-            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
-            json={
-                "points": [{
-                    "id": chunk_id,
-                    "vector": embedding,
-                    "payload": {
-                        "text": text,
-                        **metadata
-                    }
-                }]
+        response = polza.post(
+            POLZA_URL,
+            headers={
+                "Authorization": f"Bearer {POLZA_API_KEY}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream"
             },
-            timeout=30
+            json=polza_request_body(query, context, stream=True, query_embedding=query_embedding),
+            stream=True,
+            timeout=60  # Таймаут на подключение и на паузу между фрагментами
         )
         response.raise_for_status()
-        return True
-    except Exception as e:
-        print(f"Ошибка добавления в Qdrant: {e}")
-        return False
-
-def process_and_embed_document(filepath):
-    """Обрабатывает документ и создает эмбеддинги"""
-    try:
-        filename = Path(filepath).name
-        file_ext = Path(filepath).suffix.lower()
+        response.encoding = 'utf-8'
         
-        # Для TXT и MD - просто читаем
-        if file_ext in ['.txt', '.md']:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                text = f.read()
-        elif file_ext in ['.pdf', '.docx', '.pptx']:
-            # Для PDF/DOCX - конвертируем в markdown через процесс
-            import subprocess
-            print(f"Конвертация {file_ext} в markdown...")
-            result = subprocess.run(
-                ['python', '/docling_app/process_documents.py', filepath],
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-            if result.returncode != 0:
-                return False, f"Ошибка конвертации: {result.stderr[:200]}"
-            
-            # Ищем созданный markdown файл
-            md_file = Path(app.config['PROCESSED_FOLDER']) / f"{Path(filepath).stem}.md"
-            if not md_file.exists():
-                return False, "Markdown файл не был создан после конвертации"
-            
-            with open(md_file, 'r', encoding='utf-8') as f:
-                text = f.read()
-            filename = md_file.name  # Используем имя markdown файла
-        else:
-            return False, f"Неподдерживаемый формат: {file_ext}"
-        
-        if not text.strip():
-            return False, "Файл пустой"
-        
-        # Разбиваем на чанки
-        words = text.split()
-        chunks = []
-        chunk_size = 350  # Оптимизировано для формул
-        overlap = 70      # Больший overlap для лучшего покрытия формул
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            if chunk:
-                chunks.append(chunk)
-        
-        # Создаем эмбеддинги и загружаем в Qdrant
-        for idx, chunk in enumerate(chunks):
-            chunk_id = hashlib.md5(f"{filename}_{idx}".encode()).hexdigest()
-            
-            # Получаем эмбеддинг
-            embedding = get_embedding(chunk)
-            if not embedding:
-                continue
-            
-            # Добавляем в Qdrant
-            metadata = {
-                "filename": filename,
-                "chunk_index": idx,
-                "total_chunks": len(chunks)
-            }
-            
-            requests.put(
-                f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
-                json={
-                    "points": [{
-                        "id": chunk_id,
-                        "vector": embedding,
-                        "payload": {
-                            "text": chunk,
-                            **metadata
-                        }
-                    }]
-                },
-                timeout=30
-            )
-        
-        return True, f"Обработано {len(chunks)} чанков"
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                # OpenAI-совместимый SSE: "data: {...}", в конце "data: [DONE]"
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    print(f"LLM stream: первый токен через {first_token_at - started:.2f} сек")
+                yield text
+        print(f"LLM stream: ответ получен за {time.time() - started:.2f} сек")
     except Exception as e:
-        return False, str(e)
+        print(f"LLM stream: ошибка через {time.time() - started:.2f} сек: {e}")
+        raise LLMStreamError(polza_error_message(str(e) or type(e).__name__)) from e
 
 @app.route('/')
 def index():
@@ -675,7 +822,11 @@ def admin():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Загрузка и обработка документа"""
+    """
+    Загрузка документа: файл сохраняется и ставится в очередь на обработку
+    
+    Конвертацию и эмбеддинги выполняет ingest_worker.py; прогресс - GET /api/upload/<job_id>.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'Файл не найден'}), 400
@@ -691,22 +842,27 @@ def upload_file():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         
-        # Обработка документа и создание эмбеддингов
-        success, message = process_and_embed_document(filepath)
-        if not success:
-            print(f"ERROR: {message}")
-            return jsonify({'error': message}), 500
-        
+        job_id = ingest_queue.enqueue(filename, filepath)
         return jsonify({
             'success': True,
-            'message': f'Документ {filename} успешно добавлен в базу знаний. {message}'
-        })
+            'job_id': job_id,
+            'status_url': f'/api/upload/{job_id}',
+            'message': f'Документ {filename} поставлен в очередь на обработку'
+        }), 202
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
         print(f"EXCEPTION in upload: {error_trace}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Состояние задачи загрузки: статус, обработано чанков, оценка оставшегося времени"""
+    job = ingest_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(job)
+
 @app.route('/api/telegram/check_auth', methods=['POST'])
 def telegram_check_auth():
     """Быстрая проверка авторизации для Telegram бота"""
@@ -746,67 +902,32 @@ def telegram_search():
             'authorized': False
         }), 403
     
-    # Если есть история - добавляем контекст предыдущего вопроса
-    if history:
-        last_qa = history[-1]
-        query_with_context = f"Предыдущий вопрос: {last_qa['question']}\nПредыдущий ответ: {last_qa['answer'][:300]}...\n\nТекущий вопрос: {query}"
-    else:
-        query_with_context = query
+    query_with_context = build_query_with_context(query, history)
     
-    # Поиск документов
-    results = search_documents(query, limit=15)
+    # Поиск документов и ответ (через кэш ответов, если нет истории)
+    use_cache = not history and not is_cache_bypassed()
+    answer, sources, cache_status = answer_query(query, query_with_context, use_cache)
     
-    if not results:
+    if answer is None:
         return jsonify({
             'answer': 'Не найдено релевантных документов',
             'sources': [],
             'authorized': True
         })
     
-    # Формируем контекст
-    expanded_results = expand_context_around_chunks(results, window=1)
-    spravochnik_parts = []
-    other_parts = []
-    seen_chunks = set()
-    
-    for r in expanded_results:
-        filename = r["payload"]["filename"]
-        chunk_idx = r["payload"]["chunk_index"]
-        chunk_key = (filename, chunk_idx)
-        
-        if chunk_key in seen_chunks:
-            continue
-        seen_chunks.add(chunk_key)
-        
-        text = r["payload"]["text"]
-        context_entry = f"[Источник: {filename}, чанк {chunk_idx+1}]\n{text}"
-        
-        if "Справочник" in filename:
-            spravochnik_parts.append(context_entry)
-        else:
-            other_parts.append(context_entry)
-    
-    context = "\n\n".join(spravochnik_parts + other_parts)
-    sources = [{
-        'filename': r["payload"]["filename"],
-        'text': r["payload"]["text"][:200] + "...",
-        'score': r["score"]
-    } for r in results]
-    
-    # Генерируем ответ
-    answer = ask_llm(query_with_context, context)
-    
     # Логируем запрос
     try:
         db.log_query(user['id'], query, answer)
     except Exception as e:
         print(f"Ошибка логирования запроса: {e}")
     
-    return jsonify({
+    response = jsonify({
         'answer': answer,
         'sources': sources,
         'authorized': True
     })
+    response.headers['X-Cache'] = cache_status
+    return response
 
 @app.route('/api/telegram/link_phone', methods=['POST'])
 def telegram_link_phone():
@@ -847,6 +968,39 @@ def telegram_link_phone():
             'error': 'Ошибка при привязке номера телефона'
         }), 500
 
+def build_query_with_context(query, history):
+    """Добавляет к вопросу контекст предыдущего вопроса-ответа из истории чата"""
+    if not history:
+        return query
+    # Берем последний вопрос-ответ для контекста
+    last_qa = history[-1]
+    return f"Предыдущий вопрос: {last_qa['question']}\nПредыдущий ответ: {last_qa['answer'][:300]}...\n\nТекущий вопрос: {query}"
+
+def save_chat_history(user_id, session_id, query, answer):
+    """
+    Сохраняет вопрос и ответ в историю чата (создает сессию, если ее нет)
+    
+    Returns:
+        session_id (None, если сохранить не удалось)
+    """
+    try:
+        # Если нет сессии - создаем новую
+        if not session_id:
+            # Создаем название из первых 50 символов запроса
+            title = query[:50] + ('...' if len(query) > 50 else '')
+            session_id = db.create_chat_session(user_id, 'web', title)
+        
+        # Сохраняем вопрос и ответ
+        db.add_chat_message(session_id, 'user', query)
+        db.add_chat_message(session_id, 'assistant', answer)
+    except Exception as e:
+        print(f"Ошибка сохранения в историю: {e}")
+    return session_id
+
+def sse_event(event, data):
+    """Форматирует событие server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.route('/api/search', methods=['POST'])
 @jwt_required
 def search():
@@ -860,95 +1014,132 @@ def search():
         return jsonify({'error': 'Запрос пустой'}), 400
     
     # Если есть история - добавляем контекст предыдущего вопроса
-    if history:
-        # Берем последний вопрос-ответ для контекста
-        last_qa = history[-1]
-        query_with_context = f"Предыдущий вопрос: {last_qa['question']}\nПредыдущий ответ: {last_qa['answer'][:300]}...\n\nТекущий вопрос: {query}"
-    else:
-        query_with_context = query
+    query_with_context = build_query_with_context(query, history)
     
-    # Поиск документов - увеличено для лучшего поиска формул
-    results = search_documents(query, limit=15)
+    # Поиск документов и ответ с учетом истории (через кэш ответов, если истории нет)
+    use_cache = not history and not is_cache_bypassed()
+    answer, sources, cache_status = answer_query(query, query_with_context, use_cache)
     
-    if not results:
+    if answer is None:
         return jsonify({
             'answer': 'Не найдено релевантных документов',
             'sources': []
         })
     
-    # Формируем контекст с указанием источника
-    # Расширяем контекст вокруг найденных чанков (для формул)
-    expanded_results = expand_context_around_chunks(results, window=1)
+    # Сохраняем в историю чата
+    session_id = save_chat_history(request.user_id, session_id, query, answer)
     
-    # Приоритет Справочнику - ставим его чанки в начало
-    spravochnik_parts = []
-    other_parts = []
-    seen_chunks = set()  # Для дедупликации
+    response = jsonify({
+        'answer': answer,
+        'sources': sources,
+        'session_id': session_id
+    })
+    response.headers['X-Cache'] = cache_status
+    return response
+
+@app.route('/api/search/stream', methods=['POST'])
+@jwt_required
+def search_stream():
+    """
+    Потоковый поиск (веб-интерфейс): ответ LLM отдается через server-sent events
     
-    for r in expanded_results:
-        filename = r["payload"]["filename"]
-        chunk_idx = r["payload"]["chunk_index"]
-        chunk_key = (filename, chunk_idx)
+    События: sources (источники, сразу после поиска), token (фрагмент ответа),
+    done (session_id и статус кэша), error. История чата сохраняется после
+    завершения потока.
+    """
+    data = request.json
+    query = data.get('query', '')
+    session_id = data.get('session_id')  # ID текущей сессии
+    history = data.get('history', [])  # История чата
+    
+    if not query:
+        return jsonify({'error': 'Запрос пустой'}), 400
+    
+    user_id = request.user_id
+    query_with_context = build_query_with_context(query, history)
+    use_cache = not history and not is_cache_bypassed()
+    
+    def generate():
+        version = get_collection_version()
         
-        # Пропускаем дубликаты
-        if chunk_key in seen_chunks:
-            continue
-        seen_chunks.add(chunk_key)
+        try:
+            query_embedding = get_embedding(query)
+            if use_cache:
+                cached = answer_cache.lookup(query_embedding, version)
+                if cached:
+                    print(f"Answer cache HIT ({cached['similarity']}): '{cached['query']}'")
+                    yield sse_event('sources', cached['sources'])
+                    yield sse_event('token', {'text': cached['answer']})
+                    yield sse_event('done', {
+                        'session_id': save_chat_history(user_id, session_id, query, cached['answer']),
+                        'cache': 'HIT'
+                    })
+                    return
+            
+            results = search_documents(query, limit=15, with_text=False)
+            if not results:
+                yield sse_event('sources', [])
+                yield sse_event('token', {'text': 'Не найдено релевантных документов'})
+                yield sse_event('done', {'session_id': session_id, 'cache': 'MISS' if use_cache else 'BYPASS'})
+                return
+            
+            context, sources = build_context(results)
+            # Источники отдаем до генерации, чтобы клиент показал их сразу
+            yield sse_event('sources', sources)
+            
+            parts = []
+            for text in ask_llm_stream(query_with_context, context, query_embedding=query_embedding):
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+            answer = "".join(parts)
+        except LLMStreamError as e:
+            # Неполный ответ не кэшируем и в историю не сохраняем
+            yield sse_event('error', {'error': str(e)})
+            return
+        except Exception as e:
+            print(f"Ошибка потокового поиска: {e}")
+            yield sse_event('error', {'error': str(e)})
+            return
         
-        text = r["payload"]["text"]
-        context_entry = f"[Источник: {filename}, чанк {chunk_idx+1}]\n{text}"
+        # Поток закончился без текста - пустой ответ не кэшируем и в историю не сохраняем
+        if not answer:
+            yield sse_event('error', {'error': polza_error_message('пустой ответ')})
+            return
         
-        if "Справочник" in filename:
-            spravochnik_parts.append(context_entry)
-        else:
-            other_parts.append(context_entry)
-    
-    # Справочник в начале, остальные - потом
-    context = "\n\n".join(spravochnik_parts + other_parts)
-    sources = [{
-        'filename': r["payload"]["filename"],
-        'text': r["payload"]["text"][:200] + "...",
-        'score': r["score"]
-    } for r in results]
-    
-    # Генерируем ответ с учетом истории
-    answer = ask_llm(query_with_context, context)
-    
-    # Сохраняем в историю чата
-    try:
-        # Если нет сессии - создаем новую
-        if not session_id:
-            # Создаем название из первых 50 символов запроса
-            title = query[:50] + ('...' if len(query) > 50 else '')
-            session_id = db.create_chat_session(request.user_id, 'web', title)
+        if use_cache:
+            answer_cache.store(query, query_embedding, answer, sources, version)
         
-        # Сохраняем вопрос и ответ
-        db.add_chat_message(session_id, 'user', query)
-        db.add_chat_message(session_id, 'assistant', answer)
-    except Exception as e:
-        print(f"Ошибка сохранения в историю: {e}")
+        # Сохраняем в историю чата после завершения потока
+        yield sse_event('done', {
+            'session_id': save_chat_history(user_id, session_id, query, answer),
+            'cache': 'MISS' if use_cache else 'BYPASS'
+        })
     
-    return jsonify({
-        'answer': answer,
-        'sources': sources,
-        'session_id': session_id
-    })
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Отключаем буферизацию в nginx
+        }
+    )
 
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
     """Список документов в базе"""
     try:
-        response = requests.get(
+        response = qdrant.get(
             f"{QDRANT_URL}/collections/{COLLECTION_NAME}",
             timeout=10
         )
         data = response.json()
         
         # Получаем все документы
-        points_response = requests.post(
+        points_response = qdrant.post(
             f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
             json={"limit": 100, "with_payload": True},
-            timeout=10
+            timeout=10,
+            idempotent=True
         )
         
         points = points_response.json()["result"]["points"]
@@ -979,7 +1170,7 @@ def health():
 def stats():
     """Статистика системы"""
     try:
-        qdrant_resp = requests.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}", timeout=10)
+        qdrant_resp = qdrant.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}", timeout=10)
         qdrant_data = qdrant_resp.json()
         
         return jsonify({
@@ -989,7 +1180,12 @@ def stats():
             },
             'ollama': {
                 'status': 'online'
-            }
+            },
+            'embedding_cache': get_cache_stats(),
+            'answer_cache': answer_cache.get_cache_stats(),
+            'boost_rules': get_boost_engine().get_stats(),
+            'upstreams': get_upstream_stats(),
+            'ingest_queue': ingest_queue.get_queue_stats()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,460 @@
+"""
+Асинхронный вариант поиска (aiohttp)
+
+Тот же конвейер, что у /api/search и /api/telegram/search во Flask-приложении
+(кэш ответов, гибридный поиск, расширение контекста, DeepSeek через Polza.ai),
+но ожидание Ollama, Qdrant и Polza.ai не занимает worker: запросы идут через
+пулы соединений aiohttp, и один процесс держит сотни одновременных ожиданий
+ответа LLM. SQLite (кэши, пользователи, история чата) и подбор примеров
+выполняются в пуле потоков, чтобы не блокировать event loop.
+
+Запуск:
+    gunicorn async_app:app --bind 0.0.0.0:5001 --worker-class aiohttp.GunicornWebWorker
+    python async_app.py   # для разработки
+"""
+
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, '/docling_app')
+
+import app as flask_app
+import database as db
+import answer_cache
+import lexical_index
+import vector_mirror
+from auth_routes import decode_jwt_token
+from batch_ingest import get_collection_version
+from context_packer import pack_context
+from embedding_cache import get_cached_embedding, put_cached_embedding
+from http_client import HTTP_RETRIES, HTTP_RETRY_BACKOFF, RETRY_STATUSES, attempt_timeout, can_retry
+
+# Соединений на сервис в одном процессе: к Polza.ai - на все одновременные ожидания LLM
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', '50'))
+ASYNC_LLM_POOL_SIZE = int(os.getenv('ASYNC_LLM_POOL_SIZE', '500'))
+# Потоки для SQLite и подбора примеров
+ASYNC_THREADS = int(os.getenv('ASYNC_THREADS', '32'))
+ASYNC_PORT = int(os.getenv('ASYNC_PORT', '5001'))
+
+
+class AsyncUpstreamClient:
+    """Пул соединений aiohttp к одному сервису; повторы и счетчики - как у http_client.UpstreamClient"""
+
+    def __init__(self, name, pool_size=ASYNC_POOL_SIZE, retries=HTTP_RETRIES,
+                 backoff=HTTP_RETRY_BACKOFF):
+        self.name = name
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+        self._stats = {'requests': 0, 'errors': 0, 'retries': 0, 'in_flight': 0,
+                       'max_in_flight': 0, 'total_seconds': 0.0}
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    def _record(self, seconds, error=False, retry=False):
+        # Вызывается только из event loop - без блокировки
+        self._stats['requests'] += 1
+        self._stats['total_seconds'] += seconds
+        if error:
+            self._stats['errors'] += 1
+        if retry:
+            self._stats['retries'] += 1
+
+    async def post(self, url, payload, timeout, idempotent=False, headers=None):
+        """
+        POST с JSON-телом
+
+        timeout - общий срок всех попыток вместе с паузами между ними.
+
+        Returns:
+            dict: JSON ответа (ошибка HTTP - исключение aiohttp.ClientResponseError)
+        """
+        attempts = self.retries + 1 if idempotent else 1
+        deadline = time.monotonic() + timeout
+        self._stats['in_flight'] += 1
+        self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+        try:
+            for attempt in range(attempts):
+                delay = self.backoff * (2 ** attempt)
+                client_timeout = aiohttp.ClientTimeout(total=attempt_timeout(timeout, deadline))
+                started = time.perf_counter()
+                try:
+                    async with self.session.post(url, json=payload, headers=headers,
+                                                 timeout=client_timeout) as response:
+                        retryable = response.status in RETRY_STATUSES
+                        last_attempt = not can_retry(attempt, attempts, deadline, delay)
+                        if not retryable or last_attempt:
+                            response.raise_for_status()
+                            data = await response.json(content_type=None)
+                            self._record(time.perf_counter() - started)
+                            return data
+                        self._record(time.perf_counter() - started, error=response.status >= 500, retry=True)
+                except aiohttp.ClientResponseError:
+                    self._record(time.perf_counter() - started, error=True)
+                    raise
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    last_attempt = not can_retry(attempt, attempts, deadline, delay)
+                    self._record(time.perf_counter() - started, error=True, retry=not last_attempt)
+                    if last_attempt:
+                        raise
+                await asyncio.sleep(delay)
+        finally:
+            self._stats['in_flight'] -= 1
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        count = stats['requests']
+        stats['avg_ms'] = round(stats['total_seconds'] / count * 1000, 1) if count else 0.0
+        stats['total_seconds'] = round(stats['total_seconds'], 3)
+        return stats
+
+
+ollama = AsyncUpstreamClient('ollama')
+qdrant = AsyncUpstreamClient('qdrant')
+polza = AsyncUpstreamClient('polza', pool_size=ASYNC_LLM_POOL_SIZE)
+UPSTREAMS = (ollama, qdrant, polza)
+
+
+async def get_embedding(text, model="nomic-embed-text"):
+    """Эмбеддинг вопроса через кэш эмбеддингов"""
+    cached = await asyncio.to_thread(get_cached_embedding, text, model)
+    if cached is not None:
+        return cached
+    try:
+        data = await ollama.post(
+            f"{flask_app.OLLAMA_URL}/api/embeddings",
+            {"model": model, "prompt": text},
+            timeout=flask_app.EMBED_STAGE_TIMEOUT,
+            idempotent=True
+        )
+        embedding = data["embedding"]
+        await asyncio.to_thread(put_cached_embedding, text, model, embedding)
+        return embedding
+    except Exception as e:
+        print(f"Ошибка получения эмбеддинга: {e!r}")
+        return None
+
+
+def mirror_search(query_embedding, limit, search_filter):
+    """Поиск в локальном зеркале векторов; None, если оно выключено или устарело"""
+    if vector_mirror.VECTOR_MIRROR_ENABLED and vector_mirror.is_ready(get_collection_version()):
+        return vector_mirror.search(query_embedding, limit, search_filter)
+    return None
+
+
+async def vector_search(query_embedding, limit, search_filter=None):
+    """Semantic search (кандидаты - с полями для re-ranking'а, см. flask_app.candidate_payload)"""
+    results = await asyncio.to_thread(mirror_search, query_embedding, limit, search_filter)
+    if results is not None:
+        return results
+
+    search_params = {
+        "vector": query_embedding,
+        "limit": limit,
+        "with_payload": flask_app.candidate_payload(),
+        "filter": await asyncio.to_thread(flask_app.versioned_filter, search_filter)
+    }
+    data = await qdrant.post(
+        f"{flask_app.QDRANT_URL}/collections/{flask_app.COLLECTION_NAME}/points/search",
+        search_params,
+        timeout=flask_app.VECTOR_STAGE_TIMEOUT,
+        idempotent=True
+    )
+    return data["result"]
+
+
+async def retrieve_points(ids, timeout):
+    """Точки по ID одним запросом (payload целиком, без векторов)"""
+    data = await qdrant.post(
+        f"{flask_app.QDRANT_URL}/collections/{flask_app.COLLECTION_NAME}/points",
+        {"ids": list(ids), "with_payload": True, "with_vector": False},
+        timeout=timeout,
+        idempotent=True
+    )
+    return data["result"]
+
+
+async def fill_payloads(results, extra_ids=(), timeout=flask_app.EXPAND_STAGE_TIMEOUT):
+    """Как flask_app.fill_payloads: текст результатам без него + точки extra_ids"""
+    missing, extra = flask_app.payload_request_ids(results, extra_ids)
+    if not missing and not extra:
+        return []
+    points = await retrieve_points(list(missing) + list(extra), timeout)
+    return flask_app.apply_payloads(results, missing, extra, points)
+
+
+def lexical_hits(keyword):
+    """Все совпадения BM25-индекса для термина (как flask_app.find_keyword_candidates)"""
+    if lexical_index.is_empty():
+        print("⚠️ Лексический индекс пуст, запустите: python lexical_index.py rebuild")
+        return []
+    hits = lexical_index.search(keyword, limit=None)
+    print(f"Lexical index: {len(hits)} candidates for '{keyword}'")
+    return hits
+
+
+async def find_definition_results(keyword):
+    """Keyword-поиск чанков, где определяется термин"""
+    print(f"Keyword search for definition: '{keyword}'")
+    try:
+        hits = await asyncio.to_thread(lexical_hits, keyword)
+        if not hits:
+            return []
+        data = await qdrant.post(
+            f"{flask_app.QDRANT_URL}/collections/{flask_app.COLLECTION_NAME}/points/scroll",
+            {"filter": flask_app.definition_filter([hit["point_id"] for hit in hits]),
+             "limit": len(hits), "with_payload": True, "with_vector": False},
+            timeout=flask_app.KEYWORD_STAGE_TIMEOUT,
+            idempotent=True
+        )
+        points = data["result"]["points"]
+    except Exception as e:
+        print(f"Keyword search error: {e!r}")
+        return []
+    return flask_app.definition_matches(keyword, points)
+
+
+async def search_documents(query, query_embedding, limit=15):
+    """
+    Гибридный поиск (как flask_app.search_documents с with_text=False):
+    keyword-поиск идет параллельно с semantic search
+    """
+    keyword_task = None
+    try:
+        started = time.time()
+        rules, search_filter, keyword = flask_app.plan_search(query)
+        keyword_task = asyncio.create_task(find_definition_results(keyword)) if keyword else None
+
+        results = await vector_search(query_embedding, flask_app.candidate_limit(limit, search_filter), search_filter)
+        legacy = flask_app.legacy_candidates(results)
+        if legacy:
+            await fill_payloads(legacy, timeout=flask_app.VECTOR_STAGE_TIMEOUT)
+
+        keyword_results = []
+        if keyword_task:
+            try:
+                keyword_results = await asyncio.wait_for(keyword_task, flask_app.KEYWORD_STAGE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Этап keyword не уложился в {flask_app.KEYWORD_STAGE_TIMEOUT} сек, пропускаем")
+
+        final_results = flask_app.rank_candidates(query, rules, results, keyword_results, limit)
+        print(f"Retrieval (async): total {time.time() - started:.3f}s")
+        return final_results
+    except Exception as e:
+        print(f"Ошибка поиска: {e!r}")
+        return []
+    finally:
+        # Semantic search упал - keyword-задачу никто не дождется
+        if keyword_task and not keyword_task.done():
+            keyword_task.cancel()
+
+
+async def build_context(results):
+    """Контекст для LLM (с соседними чанками) и источники"""
+    neighbor_ids = flask_app.neighbor_point_ids(results, window=1)
+    try:
+        neighbor_chunks = await fill_payloads(results, neighbor_ids)
+    except Exception as e:
+        print(f"Ошибка расширения контекста: {e!r}")
+        neighbor_chunks = []
+        results[:] = [r for r in results if "text" in r["payload"]]
+
+    expanded_results = flask_app.attach_neighbors(results, neighbor_chunks)
+    context, _ = await asyncio.to_thread(pack_context, expanded_results)
+    return context, flask_app.format_sources(results)
+
+
+async def ask_llm(query, context, query_embedding=None):
+    """Ответ DeepSeek через Polza.ai; при ошибке - сообщение с ⚠️"""
+    try:
+        # Подбор примеров при смене examples.json читает файлы и считает эмбеддинги - в потоке
+        body = await asyncio.to_thread(flask_app.polza_request_body, query, context, False, query_embedding)
+        data = await polza.post(
+            flask_app.POLZA_URL,
+            body,
+            timeout=60,
+            headers={
+                "Authorization": f"Bearer {flask_app.POLZA_API_KEY}",
+                "Content-Type": "application/json"
+            }
+        )
+        return data["choices"][0]["message"]["content"]
+    except Exception as e:
+        return flask_app.polza_error_message(str(e) or type(e).__name__)
+
+
+async def answer_query(query, query_with_context, use_cache=True):
+    """
+    Поиск + генерация ответа через кэш ответов (как flask_app.answer_query)
+
+    Returns:
+        tuple: (answer или None, sources, статус кэша HIT/MISS/BYPASS)
+    """
+    version = await asyncio.to_thread(get_collection_version)
+    query_embedding = await get_embedding(query)
+    if not query_embedding:
+        return None, [], 'MISS' if use_cache else 'BYPASS'
+
+    if use_cache:
+        cached = await asyncio.to_thread(answer_cache.lookup, query_embedding, version)
+        if cached:
+            print(f"Answer cache HIT ({cached['similarity']}): '{cached['query']}'")
+            return cached['answer'], cached['sources'], 'HIT'
+
+    results = await search_documents(query, query_embedding, limit=15)
+    if not results:
+        return None, [], 'MISS' if use_cache else 'BYPASS'
+
+    context, sources = await build_context(results)
+    answer = await ask_llm(query_with_context, context, query_embedding)
+
+    # Ошибки API и пустые ответы не кэшируем
+    if use_cache and answer and not answer.startswith('⚠️'):
+        await asyncio.to_thread(answer_cache.store, query, query_embedding, answer, sources, version)
+    return answer, sources, 'MISS' if use_cache else 'BYPASS'
+
+
+def is_cache_bypassed(request):
+    """Проверяет заголовок X-Cache-Bypass"""
+    if request.headers.get(answer_cache.BYPASS_HEADER) == '1':
+        answer_cache.record_bypass()
+        return True
+    return False
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return {}
+
+
+routes = web.RouteTableDef()
+
+
+@routes.post('/api/search')
+async def search(request):
+    """Поиск с учетом истории чата (веб-интерфейс), ответы - как у Flask /api/search"""
+    token = request.headers.get('Authorization')
+    if not token:
+        return web.json_response({'error': 'Token is missing'}, status=401)
+    if token.startswith('Bearer '):
+        token = token[7:]
+    payload = decode_jwt_token(token)
+    if not payload:
+        return web.json_response({'error': 'Invalid or expired token'}, status=401)
+
+    data = await read_json(request)
+    query = data.get('query', '')
+    session_id = data.get('session_id')
+    history = data.get('history', [])
+    if not query:
+        return web.json_response({'error': 'Запрос пустой'}, status=400)
+
+    query_with_context = flask_app.build_query_with_context(query, history)
+    use_cache = not history and not is_cache_bypassed(request)
+    answer, sources, cache_status = await answer_query(query, query_with_context, use_cache)
+
+    if answer is None:
+        return web.json_response({'answer': 'Не найдено релевантных документов', 'sources': []})
+
+    session_id = await asyncio.to_thread(flask_app.save_chat_history, payload['user_id'], session_id, query, answer)
+    return web.json_response(
+        {'answer': answer, 'sources': sources, 'session_id': session_id},
+        headers={'X-Cache': cache_status}
+    )
+
+
+@routes.post('/api/telegram/search')
+async def telegram_search(request):
+    """Поиск для Telegram бота, ответы - как у Flask /api/telegram/search"""
+    data = await read_json(request)
+    telegram_id = data.get('telegram_id')
+    query = data.get('query', '')
+    history = data.get('history', [])
+
+    if not telegram_id:
+        return web.json_response({'error': 'Telegram ID не указан'}, status=400)
+    if not query:
+        return web.json_response({'error': 'Запрос пустой'}, status=400)
+
+    user = await asyncio.to_thread(db.get_user_by_telegram_id, telegram_id)
+    if not user:
+        return web.json_response({
+            'error': 'Доступ запрещен. Обратитесь к администратору.',
+            'authorized': False
+        }, status=403)
+
+    query_with_context = flask_app.build_query_with_context(query, history)
+    use_cache = not history and not is_cache_bypassed(request)
+    answer, sources, cache_status = await answer_query(query, query_with_context, use_cache)
+
+    if answer is None:
+        return web.json_response({
+            'answer': 'Не найдено релевантных документов',
+            'sources': [],
+            'authorized': True
+        })
+
+    try:
+        await asyncio.to_thread(db.log_query, user['id'], query, answer)
+    except Exception as e:
+        print(f"Ошибка логирования запроса: {e}")
+
+    return web.json_response(
+        {'answer': answer, 'sources': sources, 'authorized': True},
+        headers={'X-Cache': cache_status}
+    )
+
+
+@routes.get('/health')
+async def health(request):
+    return web.json_response({'status': 'ok'})
+
+
+@routes.get('/api/async/stats')
+async def stats(request):
+    """Счетчики запросов к сервисам в этом процессе (in_flight - ожидающие ответа сейчас)"""
+    return web.json_response({client.name: client.get_stats() for client in UPSTREAMS})
+
+
+async def on_startup(application):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASYNC_THREADS, thread_name_prefix='async-blocking')
+    )
+    for client in UPSTREAMS:
+        await client.start()
+
+
+async def on_cleanup(application):
+    for client in UPSTREAMS:
+        await client.close()
+
+
+def create_app():
+    application = web.Application(client_max_size=1024 * 1024)
+    application.add_routes(routes)
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    db.init_db()
+    web.run_app(app, host='0.0.0.0', port=ASYNC_PORT)
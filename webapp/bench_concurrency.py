@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: Flask-приложение (gunicorn) против async_app (aiohttp)
+
+Отправляет запросы к /api/telegram/search с заданной параллельностью и
+выводит пропускную способность, медиану и p95 времени ответа. Запросы идут
+с X-Cache-Bypass, чтобы каждый доходил до LLM.
+
+Чтобы не тратить баланс Polza.ai и получить одинаковое время ответа LLM,
+оба приложения можно направить на заглушку (POLZA_URL в .env):
+    python bench_concurrency.py fake-llm --port 8099 --delay 3
+    POLZA_URL=http://<хост>:8099/v1/chat/completions
+
+Использование:
+    python bench_concurrency.py run http://localhost:5000 <telegram_id> --concurrency 10,50,200
+    python bench_concurrency.py run http://localhost:5001 <telegram_id> --concurrency 10,50,200
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+
+import aiohttp
+from aiohttp import web
+
+QUERIES = [
+    "Что такое нормочас?",
+    "Что такое коэффициент загрузки?",
+    "Как рассчитать валовую выручку доктора?",
+    "Какие нормы загрузки кресла у терапевта?",
+]
+
+
+async def one_request(session, url, telegram_id, query, timeout):
+    """Время ответа (сек) или None при ошибке"""
+    started = time.perf_counter()
+    try:
+        async with session.post(
+            f"{url}/api/telegram/search",
+            json={"telegram_id": telegram_id, "query": query},
+            headers={"X-Cache-Bypass": "1"},
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            await response.read()
+            if response.status != 200:
+                return None
+    except Exception:
+        return None
+    return time.perf_counter() - started
+
+
+async def run_level(url, telegram_id, concurrency, total, timeout):
+    """total запросов, не больше concurrency одновременно"""
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker(i):
+            async with semaphore:
+                return await one_request(session, url, telegram_id, QUERIES[i % len(QUERIES)], timeout)
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(worker(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    ok = sorted(t for t in timings if t is not None)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - len(ok),
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "median_ms": statistics.median(ok) * 1000 if ok else 0.0,
+        "p95_ms": ok[min(len(ok) - 1, int(len(ok) * 0.95))] * 1000 if ok else 0.0,
+    }
+
+
+async def run(args):
+    print(f"{args.url}: {args.requests_per_level or '2x concurrency'} запросов на уровень")
+    print(f"{'параллельно':>12} {'запросов':>9} {'ошибок':>7} {'req/s':>8} {'median, мс':>11} {'p95, мс':>9}")
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        total = args.requests_per_level or concurrency * 2
+        result = await run_level(args.url, args.telegram_id, concurrency, total, args.timeout)
+        print(f"{result['concurrency']:>12} {result['requests']:>9} {result['errors']:>7} "
+              f"{result['rps']:>8.1f} {result['median_ms']:>11.0f} {result['p95_ms']:>9.0f}")
+
+
+def fake_llm(port, delay):
+    """Заглушка OpenAI-совместимого chat completions с фиксированной задержкой"""
+    async def completions(request):
+        await request.read()
+        await asyncio.sleep(delay)
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": "Тестовый ответ"}}]})
+
+    application = web.Application()
+    application.router.add_post('/v1/chat/completions', completions)
+    print(f"Заглушка LLM: задержка {delay} сек")
+    web.run_app(application, host='0.0.0.0', port=port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест поиска")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("url")
+    run_parser.add_argument("telegram_id", type=int)
+    run_parser.add_argument("--concurrency", default="1,10,50,200")
+    run_parser.add_argument("--requests-per-level", type=int, default=0)
+    run_parser.add_argument("--timeout", type=float, default=120)
+
+    llm_parser = commands.add_parser("fake-llm")
+    llm_parser.add_argument("--port", type=int, default=8099)
+    llm_parser.add_argument("--delay", type=float, default=3.0)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        fake_llm(args.port, args.delay)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска: последовательные этапы против параллельных
+
+Замеряет полное время поиска (search_documents + expand_context_around_chunks)
+в режимах RETRIEVAL_CONCURRENT=0 и RETRIEVAL_CONCURRENT=1 на живых Ollama и Qdrant.
+Перед замерами делается прогон для прогрева (эмбеддинги запросов попадают в кэш
+одинаково для обоих режимов).
+
+Использование (внутри контейнера webapp):
+    python bench_retrieval.py [повторов на запрос]
+"""
+
+import sys
+import time
+import statistics
+
+import app
+
+QUERIES = [
+    "Что такое нормочас?",
+    "Что такое коэффициент загрузки?",
+    "Как рассчитать валовую выручку доктора?",
+    "Что делать если низкая конверсия из консультации в лечение?",
+    "Справочник: как считать нормочас?",
+    "Какие нормы загрузки кресла у терапевта?",
+]
+
+
+def retrieve(query):
+    """Поиск + расширение контекста, как при ответе на вопрос"""
+    results = app.search_documents(query, limit=15, with_text=False)
+    return app.expand_context_around_chunks(results, window=1)
+
+
+def run(concurrent, repeats):
+    """Возвращает список времен (сек) всех запросов в заданном режиме"""
+    app.RETRIEVAL_CONCURRENT = concurrent
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            started = time.perf_counter()
+            retrieve(query)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return statistics.median(timings) * 1000, p95 * 1000, statistics.mean(timings) * 1000
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print("Прогрев...")
+    run(False, 1)
+
+    results = {}
+    for concurrent in (False, True):
+        mode = "concurrent" if concurrent else "serial"
+        print(f"\nРежим {mode}: {repeats} x {len(QUERIES)} запросов")
+        results[mode] = summary(run(concurrent, repeats))
+
+    print("\n" + "=" * 60)
+    print(f"{'Режим':<12} {'median, мс':>12} {'p95, мс':>12} {'mean, мс':>12}")
+    for mode, (median, p95, mean) in results.items():
+        print(f"{mode:<12} {median:>12.1f} {p95:>12.1f} {mean:>12.1f}")
+    speedup = results["serial"][0] / results["concurrent"][0] if results["concurrent"][0] else 0
+    print(f"\nУскорение по медиане: x{speedup:.2f}")
@@ -0,0 +1,157 @@
+"""
+Упаковка найденных чанков в контекст LLM с ограничением по токенам
+
+Чанки берутся по убыванию score (после boosting'а) и добавляются, пока
+укладываются в бюджет CONTEXT_TOKEN_BUDGET. Идущие подряд чанки одного файла
+склеиваются в один фрагмент, перекрытие между ними (60-70 слов) не повторяется.
+В итоговом контексте фрагменты Справочника идут первыми. Токены считаются локальным токенизатором tiktoken,
+если он установлен, иначе - приближенно по числу символов.
+"""
+
+import os
+import math
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '8000'))
+# Для оценки без токенизатора: символов на токен (русский текст)
+CHARS_PER_TOKEN = float(os.getenv('CHARS_PER_TOKEN', '3.0'))
+
+# Перекрытие соседних чанков ищется в этих пределах (слов); чанкеры используют 60-70
+MIN_OVERLAP_WORDS = 5
+MAX_OVERLAP_WORDS = 200
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    # Нет пакета или не удалось загрузить словарь - считаем приближенно
+    _encoding = None
+
+
+def estimate_tokens(text):
+    """Оценка числа токенов в тексте"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def overlap_words(left, right, max_overlap=MAX_OVERLAP_WORDS):
+    """Сколько последних слов left совпадает с первыми словами right (0, если перекрытия нет)"""
+    for size in range(min(len(left), len(right), max_overlap), MIN_OVERLAP_WORDS - 1, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+def format_span(span):
+    """Блок контекста с указанием источника"""
+    if span["first"] == span["last"]:
+        header = f"[Источник: {span['filename']}, чанк {span['first'] + 1}]"
+    else:
+        header = f"[Источник: {span['filename']}, чанки {span['first'] + 1}-{span['last'] + 1}]"
+    return f"{header}\n{' '.join(span['words'])}"
+
+
+def assemble_spans(chunks):
+    """
+    Склеивает идущие подряд чанки одного файла в один фрагмент без повтора перекрытия
+
+    Args:
+        chunks: словари filename, chunk_index, words, score
+
+    Returns:
+        list: фрагменты (filename, first, last, words, score) по убыванию score
+    """
+    spans = []
+    for chunk in sorted(chunks, key=lambda c: (c["filename"], c["chunk_index"])):
+        last = spans[-1] if spans else None
+        if last and last["filename"] == chunk["filename"] and last["last"] + 1 == chunk["chunk_index"]:
+            overlap = overlap_words(last["words"], chunk["words"])
+            last["words"] = last["words"] + chunk["words"][overlap:]
+            last["last"] = chunk["chunk_index"]
+            last["score"] = max(last["score"], chunk["score"])
+        else:
+            spans.append({
+                "filename": chunk["filename"],
+                "first": chunk["chunk_index"],
+                "last": chunk["chunk_index"],
+                "words": list(chunk["words"]),
+                "score": chunk["score"],
+            })
+    spans.sort(key=lambda span: span["score"], reverse=True)
+    return spans
+
+
+def pack_context(results, budget=None):
+    """
+    Собирает контекст из результатов поиска в пределах бюджета токенов
+
+    Соседние чанки одного файла склеиваются в один фрагмент, перекрытие
+    (повтор слов на границе чанков) в бюджет не входит.
+
+    Args:
+        results: результаты поиска (с соседними чанками), у каждого score и payload
+        budget: бюджет токенов (по умолчанию CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        tuple: (context, stats) - stats: chunks, packed_chunks, spans, total_tokens,
+               packed_tokens, saved_tokens
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+
+    # Дедупликация по (файл, номер чанка), по убыванию score
+    chunks = {}
+    for r in sorted(results, key=lambda x: x["score"], reverse=True):
+        payload = r["payload"]
+        chunk_key = (payload["filename"], payload["chunk_index"])
+        if chunk_key in chunks:
+            continue
+        chunks[chunk_key] = {
+            "filename": payload["filename"],
+            "chunk_index": payload["chunk_index"],
+            "words": payload["text"].split(),
+            "score": r["score"],
+        }
+
+    # Берем лучшие чанки, пока укладываемся в бюджет (первый - в любом случае).
+    # Стоимость чанка - только слова, которых еще нет у выбранных соседей
+    selected = {}
+    selected_tokens = 0
+    for (filename, idx), chunk in chunks.items():
+        words = chunk["words"]
+        prev_chunk = selected.get((filename, idx - 1))
+        next_chunk = selected.get((filename, idx + 1))
+        start = overlap_words(prev_chunk["words"], words) if prev_chunk else 0
+        end = len(words) - (overlap_words(words, next_chunk["words"]) if next_chunk else 0)
+        tokens = estimate_tokens(" ".join(words[start:max(start, end)]))
+        if not prev_chunk and not next_chunk:
+            tokens += estimate_tokens(f"[Источник: {filename}, чанк {idx + 1}]")
+        if selected and selected_tokens + tokens > budget:
+            break
+        selected[(filename, idx)] = chunk
+        selected_tokens += tokens
+
+    # Приоритет Справочнику - ставим его фрагменты в начало
+    spans = assemble_spans(selected.values())
+    spravochnik_parts = [format_span(span) for span in spans if "Справочник" in span["filename"]]
+    other_parts = [format_span(span) for span in spans if "Справочник" not in span["filename"]]
+    context = "\n\n".join(spravochnik_parts + other_parts)
+
+    # Для сравнения - сколько токенов заняли бы все чанки по отдельности
+    total_tokens = sum(
+        estimate_tokens(format_span({"filename": c["filename"], "first": c["chunk_index"],
+                                     "last": c["chunk_index"], "words": c["words"]}))
+        for c in chunks.values()
+    )
+    packed_tokens = estimate_tokens(context)
+    stats = {
+        'chunks': len(chunks),
+        'packed_chunks': len(selected),
+        'spans': len(spans),
+        'total_tokens': total_tokens,
+        'packed_tokens': packed_tokens,
+        'saved_tokens': total_tokens - packed_tokens,
+    }
+    print(f"Context packer: {stats['packed_chunks']}/{stats['chunks']} чанков в {stats['spans']} фрагментах, "
+          f"{packed_tokens}/{total_tokens} токенов (бюджет {budget}), "
+          f"сэкономлено {stats['saved_tokens']}")
+    return context, stats
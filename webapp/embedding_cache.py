@@ -0,0 +1,127 @@
+"""
+Двухуровневый кэш эмбеддингов запросов:
+1. LRU в памяти процесса (микросекунды)
+2. SQLite на диске в /shared (общий для всех gunicorn worker'ов, переживает рестарты)
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+EMBED_CACHE_PATH = os.getenv('EMBED_CACHE_PATH', '/shared/cache/query_embeddings.db')
+EMBED_CACHE_MEMORY_SIZE = int(os.getenv('EMBED_CACHE_MEMORY_SIZE', '2048'))
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+_disk_ready = False
+
+
+def normalize_query(text):
+    """Нормализует текст запроса: регистр, ё/е, лишние пробелы"""
+    return " ".join(text.lower().replace('ё', 'е').split())
+
+
+def make_key(text, model):
+    """Ключ кэша: модель + нормализованный текст"""
+    return hashlib.sha1(f"{model}\n{normalize_query(text)}".encode('utf-8')).hexdigest()
+
+
+def get_connection():
+    """Создает подключение к дисковому кэшу"""
+    global _disk_ready
+    Path(EMBED_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(EMBED_CACHE_PATH, timeout=5)
+    if not _disk_ready:
+        # WAL позволяет worker'ам читать параллельно с записью
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        _disk_ready = True
+    return conn
+
+
+def _remember(key, embedding):
+    """Кладет эмбеддинг в LRU, вытесняя самые старые записи"""
+    with _lock:
+        _memory[key] = embedding
+        _memory.move_to_end(key)
+        while len(_memory) > EMBED_CACHE_MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def get_cached_embedding(text, model):
+    """
+    Ищет эмбеддинг запроса в кэше
+
+    Returns:
+        list[float] или None, если в кэше нет
+    """
+    key = make_key(text, model)
+
+    with _lock:
+        embedding = _memory.get(key)
+        if embedding is not None:
+            _memory.move_to_end(key)
+            _stats['memory_hits'] += 1
+            return embedding
+
+    try:
+        conn = get_connection()
+        row = conn.execute(
+            'SELECT embedding FROM query_embeddings WHERE key = ?', (key,)
+        ).fetchone()
+        conn.close()
+    except Exception as e:
+        print(f"Ошибка чтения кэша эмбеддингов: {e}")
+        row = None
+
+    if row is None:
+        with _lock:
+            _stats['misses'] += 1
+        return None
+
+    embedding = array('f', row[0]).tolist()
+    _remember(key, embedding)
+    with _lock:
+        _stats['disk_hits'] += 1
+    return embedding
+
+
+def put_cached_embedding(text, model, embedding):
+    """Сохраняет эмбеддинг запроса в оба уровня кэша"""
+    key = make_key(text, model)
+    _remember(key, embedding)
+
+    try:
+        conn = get_connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO query_embeddings (key, model, query, embedding) VALUES (?, ?, ?, ?)',
+            (key, model, normalize_query(text), array('f', embedding).tobytes())
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Ошибка записи кэша эмбеддингов: {e}")
+
+
+def get_cache_stats():
+    """Счетчики попаданий/промахов текущего процесса"""
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_entries'] = len(_memory)
+    total = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / total, 3) if total else 0.0
+    return stats
@@ -0,0 +1,125 @@
+"""
+Подбор few-shot примеров под вопрос пользователя
+
+Вопросы из examples.json один раз переводятся в эмбеддинги и сохраняются
+на диск (матрица NumPy); пересчет - только при изменении examples.json
+или модели эмбеддингов. Для каждого запроса берутся top-k примеров по
+косинусной близости к эмбеддингу вопроса, суммарно не больше
+EXAMPLES_TOKEN_CAP токенов.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from batch_ingest import embed_batch
+from context_packer import estimate_tokens
+from examples_loader import load_examples, get_examples_mtime
+
+EXAMPLES_EMBED_PATH = os.getenv('EXAMPLES_EMBED_PATH', '/shared/cache/examples_embeddings.npz')
+EXAMPLES_TOP_K = int(os.getenv('EXAMPLES_TOP_K', '3'))
+EXAMPLES_TOKEN_CAP = int(os.getenv('EXAMPLES_TOKEN_CAP', '1500'))
+EXAMPLES_EMBED_MODEL = "nomic-embed-text"
+
+_lock = threading.Lock()
+# Примеры и нормированная матрица эмбеддингов их вопросов для текущего examples.json
+_state = {'mtime': None, 'examples': [], 'matrix': None, 'tokens': []}
+
+
+def _examples_key(examples, model):
+    """Ключ кэша на диске: меняется при изменении вопросов или модели"""
+    questions = json.dumps([ex['question'] for ex in examples], ensure_ascii=False)
+    return hashlib.sha256(f"{model}\n{questions}".encode()).hexdigest()
+
+
+def _load_matrix(examples, ollama_url):
+    """Матрица эмбеддингов вопросов: с диска или через Ollama (с сохранением на диск)"""
+    key = _examples_key(examples, EXAMPLES_EMBED_MODEL)
+    path = Path(EXAMPLES_EMBED_PATH)
+    if path.exists():
+        try:
+            with np.load(path) as data:
+                if str(data['key']) == key:
+                    return data['matrix']
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать эмбеддинги примеров: {e}")
+
+    print(f"Эмбеддинги для {len(examples)} примеров...")
+    vectors = np.asarray(
+        embed_batch([ex['question'] for ex in examples], model=EXAMPLES_EMBED_MODEL, ollama_url=ollama_url),
+        dtype=np.float32
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    matrix = vectors / np.where(norms == 0, 1, norms)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + '.tmp.npz')
+    np.savez(tmp_path, key=np.array(key), matrix=matrix)
+    os.replace(tmp_path, path)
+    return matrix
+
+
+def _ensure_loaded(ollama_url):
+    """Перечитывает примеры и матрицу, если examples.json изменился"""
+    mtime = get_examples_mtime()
+    if _state['matrix'] is not None and _state['mtime'] == mtime:
+        return
+    with _lock:
+        if _state['matrix'] is not None and _state['mtime'] == mtime:
+            return
+        examples = load_examples(max_examples=1000)
+        if not examples:
+            _state.update(mtime=mtime, examples=[], matrix=np.zeros((0, 1), dtype=np.float32), tokens=[])
+            return
+        matrix = _load_matrix(examples, ollama_url)
+        tokens = [estimate_tokens(ex['question'] + ex['answer']) for ex in examples]
+        _state.update(mtime=mtime, examples=examples, matrix=matrix, tokens=tokens)
+
+
+def select_examples(query_embedding, ollama_url, top_k=None, token_cap=None):
+    """
+    Примеры, наиболее похожие на вопрос
+
+    Args:
+        query_embedding: эмбеддинг вопроса (nomic-embed-text)
+        top_k: сколько примеров взять максимум
+        token_cap: ограничение на суммарный размер примеров в токенах
+
+    Returns:
+        list: примеры (question, answer) по убыванию близости;
+              None, если подобрать не удалось (нет эмбеддингов)
+    """
+    top_k = top_k or EXAMPLES_TOP_K
+    token_cap = token_cap or EXAMPLES_TOKEN_CAP
+    if query_embedding is None:
+        return None
+
+    try:
+        _ensure_loaded(ollama_url)
+    except Exception as e:
+        print(f"⚠️ Ошибка подготовки эмбеддингов примеров: {e}")
+        return None
+
+    examples, matrix, tokens = _state['examples'], _state['matrix'], _state['tokens']
+    if not examples:
+        return []
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    similarities = matrix @ (query / norm if norm else query)
+
+    selected = []
+    used_tokens = 0
+    for idx in np.argsort(-similarities):
+        if len(selected) >= top_k:
+            break
+        # Слишком длинный пример пропускаем, пробуем следующий по близости
+        if used_tokens + tokens[idx] > token_cap:
+            continue
+        selected.append(examples[idx])
+        used_tokens += tokens[idx]
+    return selected
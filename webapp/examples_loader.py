@@ -6,6 +6,18 @@
 import json
 import os
 
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), 'examples.json')
+
+# Готовые блоки примеров для промпта: max_examples -> (mtime examples.json, текст)
+_blocks = {}
+
+def get_examples_mtime():
+    """Время изменения examples.json (None, если файла нет)"""
+    try:
+        return os.path.getmtime(EXAMPLES_PATH)
+    except OSError:
+        return None
+
 def load_examples(max_examples=5):
     """
     Загружает примеры вопрос-ответ для few-shot learning
@@ -17,12 +29,11 @@ def load_examples(max_examples=5):
         list: список словарей с ключами 'question' и 'answer'
     """
     try:
-        examples_path = os.path.join(os.path.dirname(__file__), 'examples.json')
-        if not os.path.exists(examples_path):
-            print(f"⚠️ Файл с примерами не найден: {examples_path}")
+        if not os.path.exists(EXAMPLES_PATH):
+            print(f"⚠️ Файл с примерами не найден: {EXAMPLES_PATH}")
             return []
         
-        with open(examples_path, 'r', encoding='utf-8') as f:
+        with open(EXAMPLES_PATH, 'r', encoding='utf-8') as f:
             examples = json.load(f)
         
         # Возвращаем первые max_examples примеров
@@ -72,6 +83,23 @@ def format_examples_for_prompt(examples):
     
     return formatted
 
+def get_examples_block(max_examples=3):
+    """
+    Блок примеров для system prompt; examples.json перечитывается,
+    только если файл изменился с прошлого вызова
+    
+    Returns:
+        str: тот же объект строки, пока файл не менялся
+    """
+    mtime = get_examples_mtime()
+    cached = _blocks.get(max_examples)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    block = format_examples_for_prompt(load_examples(max_examples=max_examples))
+    _blocks[max_examples] = (mtime, block)
+    return block
+
 def get_examples_summary():
     """Возвращает краткую статистику по примерам"""
     examples = load_examples(max_examples=100)  # Загружаем все
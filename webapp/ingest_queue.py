@@ -0,0 +1,203 @@
+"""
+Очередь задач загрузки документов
+
+/api/upload только сохраняет файл и ставит задачу в очередь; конвертацию,
+чанкинг и эмбеддинги выполняют воркеры ingest_worker.py. Очередь хранится
+в SQLite (общая для всех gunicorn worker'ов и процессов воркеров), задачу
+забирает ровно один воркер (BEGIN IMMEDIATE), задачи одного файла выполняются
+по очереди. Задача, воркер которой перестал обновлять heartbeat (процесс упал),
+возвращается в работу, но не больше INGEST_MAX_ATTEMPTS раз.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+from pathlib import Path
+
+INGEST_QUEUE_PATH = os.getenv('INGEST_QUEUE_PATH', '/shared/db/ingest_jobs.db')
+# Через сколько секунд без heartbeat задача считается брошенной (больше таймаута конвертации)
+INGEST_JOB_STALE_SECONDS = int(os.getenv('INGEST_JOB_STALE_SECONDS', '900'))
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '3'))
+
+_schema_ready = False
+
+
+def get_connection():
+    """Создает подключение к очереди"""
+    global _schema_ready
+    Path(INGEST_QUEUE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(INGEST_QUEUE_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                filepath TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                chunks_total INTEGER NOT NULL DEFAULT 0,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                embed_started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def enqueue(filename, filepath):
+    """Ставит документ в очередь, возвращает ID задачи"""
+    job_id = uuid.uuid4().hex
+    conn = get_connection()
+    conn.execute(
+        'INSERT INTO jobs (id, filename, filepath, status, created_at) VALUES (?, ?, ?, ?, ?)',
+        (job_id, filename, filepath, 'queued', time.time())
+    )
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def claim():
+    """
+    Забирает следующую задачу (самую старую в очереди или брошенную)
+
+    Returns:
+        dict задачи или None, если очередь пуста
+    """
+    now = time.time()
+    stale_before = now - INGEST_JOB_STALE_SECONDS
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # Брошенные задачи, исчерпавшие попытки, больше не берем
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, "
+            "message = 'Воркер не завершил обработку (превышено число попыток)' "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (now, stale_before, INGEST_MAX_ATTEMPTS)
+        )
+        # Файл, который уже загружает живой воркер, не берем: вторая загрузка того же
+        # документа ждала бы блокировку (ingest_state.document_lock), занимая воркер
+        row = conn.execute(
+            "SELECT id FROM jobs AS j WHERE (status = 'queued' OR (status = 'running' AND heartbeat_at < ?)) "
+            "AND NOT EXISTS (SELECT 1 FROM jobs AS r WHERE r.filename = j.filename AND r.id != j.id "
+            "AND r.status = 'running' AND r.heartbeat_at >= ?) "
+            "ORDER BY created_at LIMIT 1",
+            (stale_before, stale_before)
+        ).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', stage = 'converting', attempts = attempts + 1, "
+            "chunks_done = 0, started_at = ?, embed_started_at = NULL, heartbeat_at = ? WHERE id = ?",
+            (now, now, row['id'])
+        )
+        job = dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+        conn.execute('COMMIT')
+        return job
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def start_embedding(job_id, chunks_total):
+    """Конвертация закончена, начинаются эмбеддинги"""
+    now = time.time()
+    conn = get_connection()
+    conn.execute(
+        "UPDATE jobs SET stage = 'embedding', chunks_total = ?, chunks_done = 0, "
+        "embed_started_at = ?, heartbeat_at = ? WHERE id = ?",
+        (chunks_total, now, now, job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def update_progress(job_id, chunks_done):
+    """Прогресс эмбеддингов (заодно heartbeat)"""
+    conn = get_connection()
+    conn.execute(
+        'UPDATE jobs SET chunks_done = ?, heartbeat_at = ? WHERE id = ?',
+        (chunks_done, time.time(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def finish(job_id, success, message):
+    """Завершает задачу: done или failed"""
+    conn = get_connection()
+    conn.execute(
+        'UPDATE jobs SET status = ?, stage = NULL, message = ?, finished_at = ? WHERE id = ?',
+        ('done' if success else 'failed', message, time.time(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_job(job_id):
+    """
+    Состояние задачи с прогрессом и оценкой оставшегося времени
+
+    Returns:
+        dict или None, если задачи нет
+    """
+    conn = get_connection()
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    position = None
+    if row is not None and row['status'] == 'queued':
+        position = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= ?",
+            (row['created_at'],)
+        ).fetchone()[0]
+    conn.close()
+    if row is None:
+        return None
+
+    now = time.time()
+    chunks_per_sec = None
+    eta_seconds = None
+    if row['status'] == 'running' and row['stage'] == 'embedding' and row['chunks_done']:
+        chunks_per_sec = row['chunks_done'] / max(now - row['embed_started_at'], 1e-6)
+        eta_seconds = round((row['chunks_total'] - row['chunks_done']) / chunks_per_sec, 1)
+        chunks_per_sec = round(chunks_per_sec, 2)
+
+    return {
+        'job_id': row['id'],
+        'filename': row['filename'],
+        'status': row['status'],
+        'stage': row['stage'],
+        'chunks_done': row['chunks_done'],
+        'chunks_total': row['chunks_total'],
+        'progress': round(row['chunks_done'] / row['chunks_total'], 3) if row['chunks_total'] else 0.0,
+        'chunks_per_sec': chunks_per_sec,
+        'eta_seconds': eta_seconds,
+        'queue_position': position,
+        'attempts': row['attempts'],
+        'message': row['message'],
+        'created_at': row['created_at'],
+        'elapsed_seconds': round((row['finished_at'] or now) - (row['started_at'] or now), 1),
+    }
+
+
+def get_queue_stats():
+    """Число задач по статусам"""
+    conn = get_connection()
+    rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+    conn.close()
+    return {status: count for status, count in rows}
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Воркеры загрузки документов
+
+Забирают задачи из очереди ingest_queue: конвертация PDF/DOCX/PPTX в markdown
+(сервис conversion_server.py с загруженными моделями; если он недоступен -
+process_documents.py в отдельном процессе), разбиение на чанки и загрузка
+через batch_ingest.ingest_chunks с записью прогресса в очередь.
+
+Запуск (отдельный сервис, рядом с webapp):
+    python ingest_worker.py
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, '/docling_app')
+
+import requests
+
+import ingest_queue
+from batch_ingest import ingest_chunks
+from chunking import split_text
+from http_client import docling
+
+OLLAMA_URL = os.getenv('OLLAMA_URL', "http://ollama:11434")
+QDRANT_URL = os.getenv('QDRANT_URL', "http://qdrant:6333")
+COLLECTION_NAME = "documents"
+PROCESSED_FOLDER = os.getenv('PROCESSED_FOLDER', '/shared/processed')
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+INGEST_POLL_INTERVAL = float(os.getenv('INGEST_POLL_INTERVAL', '1.0'))
+CONVERSION_TIMEOUT = 300
+# Пустое значение - всегда конвертировать в отдельном процессе
+CONVERSION_SERVICE_URL = os.getenv('CONVERSION_SERVICE_URL', 'http://docling:8090')
+
+
+def read_document(filepath):
+    """
+    Текст документа: TXT/MD читаются как есть, PDF/DOCX/PPTX конвертируются в markdown
+
+    Returns:
+        tuple: (filename для payload, text); при ошибке - исключение ValueError
+    """
+    filename = Path(filepath).name
+    file_ext = Path(filepath).suffix.lower()
+
+    if file_ext in ['.txt', '.md']:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return filename, f.read()
+
+    if file_ext not in ['.pdf', '.docx', '.pptx']:
+        raise ValueError(f"Неподдерживаемый формат: {file_ext}")
+
+    print(f"Конвертация {file_ext} в markdown...")
+    md_file = convert_via_service(filepath)
+    if md_file is None:
+        result = subprocess.run(
+            ['python', '/docling_app/process_documents.py', filepath],
+            capture_output=True,
+            text=True,
+            timeout=CONVERSION_TIMEOUT
+        )
+        if result.returncode != 0:
+            raise ValueError(f"Ошибка конвертации: {result.stderr[:200]}")
+
+        # Ищем созданный markdown файл
+        md_file = Path(PROCESSED_FOLDER) / f"{Path(filepath).stem}.md"
+    if not md_file.exists():
+        raise ValueError("Markdown файл не был создан после конвертации")
+    with open(md_file, 'r', encoding='utf-8') as f:
+        return md_file.name, f.read()  # Используем имя markdown файла
+
+
+def convert_via_service(filepath):
+    """
+    Конвертация в сервисе conversion_server.py (без запуска Python и загрузки моделей)
+
+    Returns:
+        Path markdown файла или None, если сервис не настроен или недоступен
+    """
+    if not CONVERSION_SERVICE_URL:
+        return None
+    try:
+        response = docling.post(
+            f"{CONVERSION_SERVICE_URL}/convert",
+            json={'path': str(filepath), 'output_dir': PROCESSED_FOLDER},
+            timeout=CONVERSION_TIMEOUT
+        )
+    except requests.exceptions.ConnectionError:
+        print("Сервис конвертации недоступен, конвертация в отдельном процессе")
+        return None
+    except requests.exceptions.Timeout:
+        raise ValueError(f"Конвертация не завершилась за {CONVERSION_TIMEOUT} сек")
+
+    if response.status_code == 503:
+        # Модели еще загружаются
+        return None
+    data = response.json()
+    if not data.get('success'):
+        raise ValueError(f"Ошибка конвертации: {str(data.get('error'))[:200]}")
+    print(f"Сконвертировано сервисом за {data['seconds']} сек{' (холодный старт)' if data['cold'] else ''}")
+    return Path(data['output_file'])
+
+
+def process_document(filepath, job_id):
+    """
+    Обрабатывает документ задачи и создает эмбеддинги, прогресс пишется в очередь
+
+    Returns:
+        tuple: (success, message)
+    """
+    try:
+        filename, text = read_document(filepath)
+    except (ValueError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+
+    if not text.strip():
+        return False, "Файл пустой"
+
+    chunks = split_text(text)
+    ingest_queue.start_embedding(job_id, len(chunks))
+
+    # Создаем эмбеддинги и загружаем в Qdrant пачками
+    stats = ingest_chunks(
+        filename,
+        chunks,
+        ollama_url=OLLAMA_URL,
+        qdrant_url=QDRANT_URL,
+        collection=COLLECTION_NAME,
+        progress=lambda done, total: ingest_queue.update_progress(job_id, done)
+    )
+    if not (stats["upserted"] or stats["unchanged"] or stats["resumed"]):
+        return False, "Не удалось загрузить чанки в Qdrant"
+    if not stats["activated"]:
+        return False, (f"Не удалось загрузить {stats['failed']} из {len(chunks)} чанков, "
+                       f"в базе знаний осталась прежняя версия документа")
+
+    stored = stats['upserted'] + stats['unchanged'] + stats['resumed']
+    return True, (f"Документ {filename} добавлен в базу знаний. Обработано {stored} "
+                  f"из {len(chunks)} чанков, новых эмбеддингов {stats['embedded']} "
+                  f"({stats['chunks_per_sec']} чанков/сек)")
+
+
+def worker_loop(name, stop_event):
+    """Берет задачи из очереди, пока не попросят остановиться"""
+    while not stop_event.is_set():
+        try:
+            job = ingest_queue.claim()
+        except Exception as e:
+            print(f"[{name}] Ошибка чтения очереди: {e}")
+            stop_event.wait(INGEST_POLL_INTERVAL)
+            continue
+        if job is None:
+            stop_event.wait(INGEST_POLL_INTERVAL)
+            continue
+
+        print(f"[{name}] Задача {job['id']}: {job['filename']} (попытка {job['attempts']})")
+        started = time.time()
+        try:
+            success, message = process_document(job['filepath'], job['id'])
+        except Exception as e:
+            success, message = False, str(e)
+        ingest_queue.finish(job['id'], success, message)
+        print(f"[{name}] Задача {job['id']} {'выполнена' if success else 'с ошибкой'} "
+              f"за {time.time() - started:.1f} сек: {message}")
+
+
+def run(workers=INGEST_WORKERS):
+    """Запускает воркеры и ждет SIGTERM/SIGINT; текущие задачи дорабатываются"""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+    threads = [
+        threading.Thread(target=worker_loop, args=(f"ingest-{i + 1}", stop_event), daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Воркеры загрузки запущены: {workers}, очередь {ingest_queue.INGEST_QUEUE_PATH}")
+
+    while not stop_event.is_set():
+        stop_event.wait(1)
+    print("Остановка воркеров, ждем завершения текущих задач...")
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    run()
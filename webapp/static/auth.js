@@ -566,6 +566,34 @@ async function deleteSession(sessionId) {
 
 // ============ ОБНОВЛЕНИЕ ФУНКЦИИ ПОИСКА ============
 
+// Читает поток server-sent events и вызывает onEvent(event, data) для каждого события
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // События разделены пустой строкой
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 // Переопределяем глобальную функцию search для работы с авторизацией
 window.originalSearch = window.search;
 window.search = async function() {
@@ -593,8 +621,8 @@ window.search = async function() {
     const loadingId = addLoadingMessage();
     
     try {
-        // Отправляем запрос
-        const response = await fetch('/api/search', {
+        // Отправляем запрос - ответ приходит потоком (server-sent events)
+        const response = await fetch('/api/search/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -606,17 +634,47 @@ window.search = async function() {
             })
         });
         
-        const data = await response.json();
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || response.statusText);
+        }
         
-        // Удаляем загрузку
-        document.getElementById(loadingId).remove();
+        let answer = '';
+        let sources = [];
+        let done = null;
+        let textDiv = null;
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'sources') {
+                sources = data;
+            } else if (event === 'token') {
+                answer += data.text;
+                // Первый фрагмент - заменяем спиннер на текст ответа
+                if (!textDiv) {
+                    const loading = document.getElementById(loadingId);
+                    const content = loading.querySelector('.message-content');
+                    content.innerHTML = '';
+                    textDiv = document.createElement('div');
+                    textDiv.className = 'message-text';
+                    content.appendChild(textDiv);
+                }
+                textDiv.textContent = answer;
+                const container = document.getElementById('messagesContainer');
+                container.scrollTop = container.scrollHeight;
+            } else if (event === 'done') {
+                done = data;
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
         
-        // Добавляем ответ
-        addMessage('assistant', data.answer, data.sources);
+        // Удаляем временное сообщение и добавляем ответ целиком (с источниками и вопросами)
+        document.getElementById(loadingId).remove();
+        addMessage('assistant', answer, sources);
         
         // Обновляем currentSessionId если создана новая сессия
-        if (data.session_id) {
-            currentSessionId = data.session_id;
+        if (done && done.session_id) {
+            currentSessionId = done.session_id;
             // Перезагружаем список сессий
             await loadSessions();
         }
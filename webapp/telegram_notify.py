@@ -2,8 +2,8 @@
 Модуль для отправки уведомлений через Telegram Bot API
 """
 import os
-import requests
 import logging
+from http_client import telegram
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +27,7 @@ def send_telegram_message(chat_id, text, parse_mode='Markdown'):
         return False
     
     try:
-        response = requests.post(
+        response = telegram.post(
             f"{TELEGRAM_API_URL}/sendMessage",
             json={
                 'chat_id': chat_id,